@@ -0,0 +1,208 @@
+"""
+Runs a JSONL or CSV file of user messages through the graph with bounded concurrency.
+
+Each input row needs a message (`--text-field`, default "message") and may carry an id (`--id-field`, default
+"id"; the row number otherwise). Results are appended to the output JSONL as they complete, and the output doubles
+as the progress checkpoint: re-running the same command skips the rows already written with status "ok".
+
+Each row runs on its own checkpointer thread, namespaced by the input file (or `--thread-prefix`) so rows with the
+same id in different files do not share a conversation. A row retried after a failure starts a new thread.
+
+    python batch.py chats.jsonl -o characters.jsonl --concurrency 8 --rate-limit gpt-4o=5 --rate-limit gpt-4o-mini=20
+"""
+import argparse
+import asyncio
+import csv
+import hashlib
+import json
+import os
+import time
+from collections import Counter
+from typing import Any, Dict, Iterator, Optional, Set, Tuple
+
+from langchain_core.callbacks import UsageMetadataCallbackHandler
+from langchain_core.messages import HumanMessage
+
+import settings
+from chains.llm import set_rate_limit
+from chains.tiering import tier_stats
+from extractors import stats as pre_extraction_stats
+from instrumentation import call_cost, usage_ledger
+
+
+def read_rows(path: str, text_field: str, id_field: str) -> Iterator[Tuple[str, str]]:
+    """
+    Yields (id, message) pairs one at a time, so the input is never fully loaded in memory.
+    """
+    with open(path, encoding="utf-8", newline="") as file:
+        if path.endswith(".csv"):
+            rows = csv.DictReader(file)
+        else:
+            rows = (json.loads(line) for line in file if line.strip())
+
+        for number, row in enumerate(rows, start=1):
+            yield str(row.get(id_field) or number), row[text_field]
+
+
+def read_progress(path: str) -> Tuple[Set[str], Counter]:
+    """
+    Returns the ids already written with status "ok" and the number of failed attempts per id.
+    """
+    done, failures = set(), Counter()
+    if not os.path.exists(path):
+        return done, failures
+
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                # A line cut short by an interrupted run
+                continue
+            if result.get("status") == "ok":
+                done.add(result["id"])
+            else:
+                failures[result["id"]] += 1
+    return done, failures
+
+
+def default_thread_prefix(input_path: str) -> str:
+    # The same input file maps to the same threads on every run, whatever the working directory
+    return hashlib.sha1(os.path.abspath(input_path).encode("utf-8")).hexdigest()[:12]
+
+
+def thread_id(prefix: str, row_id: str, failed_attempts: int = 0) -> str:
+    # A retry gets a fresh thread instead of continuing the failed attempt's half-finished conversation
+    return f"{prefix}:{row_id}" if not failed_attempts else f"{prefix}:{row_id}:retry-{failed_attempts}"
+
+
+def _add_usage(total: Dict[str, Dict[str, int]], usage: Dict[str, Any]) -> None:
+    for model_name, metadata in usage.items():
+        model_total = total.setdefault(model_name, {"input_tokens": 0, "output_tokens": 0, "total_tokens": 0,
+                                                    "cached_tokens": 0})
+        for key in ("input_tokens", "output_tokens", "total_tokens"):
+            model_total[key] += metadata.get(key, 0)
+        model_total["cached_tokens"] += (metadata.get("input_token_details") or {}).get("cache_read", 0)
+
+
+def _cost(usage: Dict[str, Dict[str, int]]) -> float:
+    return sum((call_cost(model_name, total["input_tokens"], total["output_tokens"], total["cached_tokens"])
+                for model_name, total in usage.items()), 0.0)
+
+
+async def _process(graph, row_id: str, message: str, row_thread_id: str) -> Dict[str, Any]:
+    usage = UsageMetadataCallbackHandler()
+    config = {"configurable": {"thread_id": row_thread_id}, "callbacks": [usage]}
+    start = time.perf_counter()
+
+    try:
+        state = await graph.ainvoke({"messages": [HumanMessage(content=message)]}, config)
+    except Exception as e:
+        return {"id": row_id, "thread_id": row_thread_id, "status": "error", "error": f"{type(e).__name__}: {e}",
+                "latency": time.perf_counter() - start, "usage": usage.usage_metadata}
+
+    return {
+        "id": row_id,
+        "thread_id": row_thread_id,
+        "status": "ok",
+        "anime_character": state.get("anime_character"),
+        "reply": state["messages"][-1].content,
+        "latency": time.perf_counter() - start,
+        "usage": usage.usage_metadata,
+    }
+
+
+async def run_batch(graph, input_path: str, output_path: str, *, concurrency: int = 4,
+                    text_field: str = "message", id_field: str = "id",
+                    thread_prefix: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Streams the input through `graph.ainvoke` with at most `concurrency` rows in flight and returns the run report.
+    Thread ids are `thread_prefix` (a hash of the input path by default) plus the row id.
+    """
+    done, failures = read_progress(output_path)
+    prefix = thread_prefix or default_thread_prefix(input_path)
+    report = {"processed": 0, "ok": 0, "failed": 0, "skipped": 0, "usage": {}}
+    slots = asyncio.Semaphore(concurrency)
+    in_flight = set()
+    start = time.perf_counter()
+
+    with open(output_path, "a", encoding="utf-8") as output:
+
+        async def process(row_id: str, message: str):
+            try:
+                result = await _process(graph, row_id, message, thread_id(prefix, row_id, failures[row_id]))
+            finally:
+                slots.release()
+
+            output.write(json.dumps(result, ensure_ascii=False, default=str) + "\n")
+            output.flush()
+
+            report["processed"] += 1
+            report["ok" if result["status"] == "ok" else "failed"] += 1
+            _add_usage(report["usage"], result["usage"])
+
+        for row_id, message in read_rows(input_path, text_field, id_field):
+            if row_id in done:
+                report["skipped"] += 1
+                continue
+
+            # Waiting for a free slot before reading the next row keeps memory bounded by `concurrency`
+            await slots.acquire()
+            task = asyncio.create_task(process(row_id, message))
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+
+        if in_flight:
+            await asyncio.gather(*in_flight)
+
+    elapsed = time.perf_counter() - start
+    report["elapsed_seconds"] = elapsed
+    report["throughput_per_second"] = report["processed"] / elapsed if elapsed else 0.0
+    report["cost_usd"] = round(_cost(report["usage"]), 6)
+    if settings.TOKEN_ACCOUNTING:
+        report["usage_ledger"] = usage_ledger.report()
+    if settings.MODEL_TIERING:
+        report["model_tiers"] = tier_stats.report()
+    if settings.PRE_EXTRACTION:
+        report["pre_extraction"] = pre_extraction_stats.as_dict()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a JSONL or CSV file of messages through ConfigPilot.")
+    parser.add_argument("input", help="JSONL or CSV file with one message per row")
+    parser.add_argument("-o", "--output", required=True, help="results JSONL, also used to resume interrupted runs")
+    parser.add_argument("--concurrency", type=int, default=4, help="rows processed at the same time")
+    parser.add_argument("--rate-limit", action="append", default=[], metavar="MODEL=RPS",
+                        help="requests per second for a model, may be repeated")
+    parser.add_argument("--text-field", default="message")
+    parser.add_argument("--id-field", default="id")
+    parser.add_argument("--thread-prefix", help="checkpointer thread namespace (default: a hash of the input path)")
+    args = parser.parse_args()
+
+    for rate_limit in args.rate_limit:
+        model_name, _, requests_per_second = rate_limit.partition("=")
+        set_rate_limit(model_name, float(requests_per_second))
+
+    report = asyncio.run(_main(args))
+    print(json.dumps(report, indent=2))
+
+
+async def _main(args) -> Dict[str, Any]:
+    from configpilot import build_graph, start_up
+    from storage.checkpointer import aclose_checkpointer, aget_checkpointer
+
+    # Rows run through `graph.ainvoke`, which needs the async variant of the configured checkpointer
+    start_up()
+    checkpointer = await aget_checkpointer()
+    try:
+        graph = build_graph(checkpointer=checkpointer)
+        return await run_batch(graph, args.input, args.output, concurrency=args.concurrency,
+                               text_field=args.text_field, id_field=args.id_field,
+                               thread_prefix=args.thread_prefix)
+    finally:
+        await aclose_checkpointer(checkpointer)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Deterministic local stand-in for `ChatOpenAI`, installed with `chains.llm.set_chat_model_factory(FakeChatModel)`.
+
+Structured-output calls return the canned value registered for the output schema as JSON, and free-text calls
+return `text_reply`; both report token usage and fire the chat model callbacks. Every call sleeps for the simulated
+latency of its model and is recorded in `calls`.
+"""
+import asyncio
+import threading
+import time
+from typing import Any, Dict, List, Optional, Type
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.output_parsers import PydanticOutputParser
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import BaseModel
+
+
+# Schema name -> canned output: a dict of field values, a model instance or a callable taking the messages
+canned_outputs: Dict[str, Any] = {}
+# Schema name -> output schema of the structured-output runnables built so far
+_schemas: Dict[str, Type[BaseModel]] = {}
+# Model name -> simulated seconds per call
+latencies: Dict[str, float] = {}
+default_latency = 0.0
+text_reply = "Great, tell me more about your character."
+# (model name, schema name or "text", seconds spent in the call)
+calls: List[tuple] = []
+_calls_lock = threading.Lock()
+
+
+def reset(outputs: Optional[Dict[str, Any]] = None) -> None:
+    canned_outputs.clear()
+    canned_outputs.update(outputs or {})
+    calls.clear()
+
+
+def _record(model_name: str, kind: str, start: float) -> None:
+    with _calls_lock:
+        calls.append((model_name, kind, time.perf_counter() - start))
+
+
+def _latency(model_name: str) -> float:
+    return latencies.get(model_name, default_latency)
+
+
+def _canned(schema, messages: List[BaseMessage]) -> BaseModel:
+    # Subset schemas of the field mapper ("AnimeCharacter_name_age") fall back to the full schema's output
+    value = canned_outputs.get(schema.__name__, canned_outputs.get(schema.__name__.split("_")[0]))
+    if value is None:
+        raise KeyError(f"No canned output for {schema.__name__}")
+    if callable(value):
+        value = value(messages)
+    if isinstance(value, BaseModel):
+        value = value.model_dump()
+    return schema.model_validate({key: item for key, item in value.items() if key in schema.model_fields})
+
+
+def _usage(messages: List[BaseMessage], output: str) -> Dict[str, int]:
+    # Rough 4 characters per token, enough to exercise usage accounting
+    input_tokens = sum(len(str(message.content)) for message in messages) // 4
+    output_tokens = len(output) // 4
+    return {"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens}
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Accepts the `ChatOpenAI` keyword arguments and ignores everything but the model name and temperature.
+    """
+    model_name: str = "fake"
+    temperature: Optional[float] = None
+
+    def __init__(self, **kwargs):
+        super().__init__(**{key: value for key, value in kwargs.items() if key in ("model_name", "temperature")})
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def _message(self, messages: List[BaseMessage], structured_output: Optional[str] = None) -> AIMessage:
+        content = text_reply
+        if structured_output is not None:
+            content = _canned(_schemas[structured_output], messages).model_dump_json()
+        return AIMessage(
+            content=content,
+            usage_metadata=_usage(messages, content),
+            response_metadata={"model_name": self.model_name},
+        )
+
+    def _generate(self, messages, stop=None, run_manager=None, structured_output: Optional[str] = None,
+                  **kwargs) -> ChatResult:
+        start = time.perf_counter()
+        time.sleep(_latency(self.model_name))
+        message = self._message(messages, structured_output)
+        _record(self.model_name, structured_output or "text", start)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, structured_output: Optional[str] = None,
+                         **kwargs) -> ChatResult:
+        start = time.perf_counter()
+        await asyncio.sleep(_latency(self.model_name))
+        message = self._message(messages, structured_output)
+        _record(self.model_name, structured_output or "text", start)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages, stop=None, run_manager=None, structured_output: Optional[str] = None, **kwargs):
+        # Spreads the latency over the words of the reply, so time to first token can be measured. Structured
+        # output comes as a single chunk
+        start = time.perf_counter()
+        if structured_output is not None:
+            time.sleep(_latency(self.model_name))
+            message = self._message(messages, structured_output)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=message.content,
+                                                               usage_metadata=message.usage_metadata))
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+            _record(self.model_name, structured_output, start)
+            return
+
+        words = text_reply.split(" ")
+        for index, word in enumerate(words):
+            time.sleep(_latency(self.model_name) / len(words))
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=word if index == 0 else " " + word))
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+        _record(self.model_name, "text", start)
+
+    def with_structured_output(self, schema, *, method: str = "json_schema", strict: Optional[bool] = None,
+                               **kwargs):
+        # Goes through `_generate` like a real structured call, so callbacks and usage metadata are reported
+        _schemas[schema.__name__] = schema
+        return self.bind(structured_output=schema.__name__) | PydanticOutputParser(pydantic_object=schema)
@@ -0,0 +1,187 @@
+"""
+Offline per-node and whole-graph benchmark, run against the deterministic fake chat model.
+
+Every scenario runs `--iterations` single-turn conversations twice: once with the simulated model latency, to
+measure turn and per-node latency, and once with zero latency, where the remaining time is the graph framework
+and application overhead. Results are printed as JSON.
+
+    python -m benchmarks.graph_benchmark [--mode default|speculative|triage] [--latency 0.05] [--iterations 20]
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import time
+from collections import Counter, defaultdict
+from typing import Any, Dict, List
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import HumanMessage
+
+import settings
+from benchmarks import fake_chat
+from chains.llm import set_chat_model_factory
+
+
+STABLE = {
+    "Classifier": {"related_with_fields": True},
+    "RelevanceReflector": {"input_type": "stable", "reasoning": "The name and age are clear."},
+    "Triage": {"related_with_fields": True, "input_type": "stable", "reasoning": "The name and age are clear."},
+    "TriageWithFields": {"related_with_fields": True, "input_type": "stable", "reasoning": "Clear.",
+                         "extracted_fields": {"name": "Brais", "age": 14}},
+    "AnimeCharacter": {"name": "Brais", "age": 14},
+    "ReflectionFeedback": {"correctness_summary": "Correct.", "confirmations": ["name", "age"]},
+}
+
+
+def _correction_loop() -> Dict[str, Any]:
+    # The first reflection pass corrects the age, the second one confirms it
+    reflections = iter([
+        {"correctness_summary": "The age is wrong.", "confirmations": ["name"], "suggested_corrections": {"age": 15},
+         "proceed_to_creator": False},
+    ])
+    return {**STABLE, "ReflectionFeedback": lambda messages: next(reflections, STABLE["ReflectionFeedback"])}
+
+
+SCENARIOS: Dict[str, Dict[str, Any]] = {
+    "stable": {"input": "el personaje se llama Brais y tiene 14 años", "outputs": lambda: STABLE},
+    "ambiguous": {
+        "input": "el personaje se llama",
+        "outputs": lambda: {
+            **STABLE,
+            "RelevanceReflector": {"input_type": "ambiguous", "reasoning": "The name is missing."},
+            "Triage": {"related_with_fields": True, "input_type": "ambiguous", "reasoning": "The name is missing."},
+            "TriageWithFields": {"related_with_fields": True, "input_type": "ambiguous",
+                                 "reasoning": "The name is missing.", "extracted_fields": {}},
+        },
+    },
+    "non_field": {
+        "input": "I need help coming up with a name.",
+        "outputs": lambda: {
+            **STABLE,
+            "Classifier": {"related_with_fields": False},
+            "Triage": {"related_with_fields": False, "input_type": "ambiguous", "reasoning": "A question."},
+            "TriageWithFields": {"related_with_fields": False, "input_type": "ambiguous", "reasoning": "A question.",
+                                 "extracted_fields": {}},
+        },
+    },
+    "correction_loop": {"input": "se llama Brais y tiene 15 años", "outputs": _correction_loop},
+}
+
+
+class NodeTimer(BaseCallbackHandler):
+    """
+    Records the wall time of every graph node run, keyed by node name.
+    """
+
+    def __init__(self):
+        self.starts: Dict[Any, tuple] = {}
+        self.durations: Dict[str, List[float]] = defaultdict(list)
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, tags=None, metadata=None, **kwargs):
+        node = (metadata or {}).get("langgraph_node")
+        if node and kwargs.get("name") == node:
+            self.starts[run_id] = (node, time.perf_counter())
+
+    def on_chain_end(self, outputs, *, run_id, parent_run_id=None, **kwargs):
+        started = self.starts.pop(run_id, None)
+        if started:
+            self.durations[started[0]].append(time.perf_counter() - started[1])
+
+    def on_chain_error(self, error, *, run_id, parent_run_id=None, **kwargs):
+        self.starts.pop(run_id, None)
+
+
+def _summary_ms(values: List[float]) -> Dict[str, float]:
+    values = sorted(values)
+    return {
+        "mean": round(statistics.fmean(values) * 1000, 3),
+        "p50": round(values[len(values) // 2] * 1000, 3),
+        "p95": round(values[min(len(values) - 1, int(len(values) * 0.95))] * 1000, 3),
+    }
+
+
+def _run_turns(graph, scenario: Dict[str, Any], iterations: int, use_async: bool):
+    turn_times, llm_calls, call_kinds = [], [], Counter()
+    timer = NodeTimer()
+
+    for _ in range(iterations):
+        fake_chat.reset(scenario["outputs"]())
+        state = {"messages": [HumanMessage(content=scenario["input"])]}
+        config = {"callbacks": [timer]}
+
+        start = time.perf_counter()
+        if use_async:
+            asyncio.run(graph.ainvoke(state, config))
+        else:
+            graph.invoke(state, config)
+        turn_times.append(time.perf_counter() - start)
+
+        llm_calls.append(len(fake_chat.calls))
+        call_kinds.update(f"{model_name}:{kind}" for model_name, kind, _ in fake_chat.calls)
+
+    return turn_times, llm_calls, call_kinds, timer
+
+
+def run(mode: str = "default", latency: float = 0.05, iterations: int = 20, use_async: bool = False,
+        scenarios: List[str] = None) -> Dict[str, Any]:
+    # Responses must not be served from the cache, and persistence goes to a throwaway SQLite file
+    settings.RESPONSE_CACHE = False
+    settings.WRITE_BEHIND = True
+    settings.WRITE_BEHIND_SINK = "sqlite"
+    scratch = tempfile.mkdtemp(prefix="configpilot-bench-")
+    settings.WRITE_BEHIND_SQLITE_PATH = os.path.join(scratch, "characters.sqlite3")
+    settings.WRITE_BEHIND_SPOOL_PATH = os.path.join(scratch, "spool.jsonl")
+
+    set_chat_model_factory(fake_chat.FakeChatModel)
+
+    from configpilot import build_graph
+
+    graph = build_graph(speculative_entry=mode == "speculative", triage_entry=mode == "triage")
+    results = {}
+
+    for name in scenarios or SCENARIOS:
+        scenario = SCENARIOS[name]
+
+        fake_chat.default_latency = 0.0
+        # One untimed turn first, so imports and lazily built chains are not measured
+        _run_turns(graph, scenario, 1, use_async)
+        overhead_times, _, _, _ = _run_turns(graph, scenario, iterations, use_async)
+
+        fake_chat.default_latency = latency
+        turn_times, llm_calls, call_kinds, timer = _run_turns(graph, scenario, iterations, use_async)
+
+        results[name] = {
+            "turn_ms": _summary_ms(turn_times),
+            "framework_overhead_ms": _summary_ms(overhead_times),
+            "llm_calls_per_turn": statistics.fmean(llm_calls),
+            "llm_calls": {kind: count / iterations for kind, count in sorted(call_kinds.items())},
+            "nodes_ms": {node: _summary_ms(durations) for node, durations in sorted(timer.durations.items())},
+        }
+
+    set_chat_model_factory(None)
+
+    return {"mode": mode, "simulated_latency_s": latency, "iterations": iterations, "async": use_async,
+            "scenarios": results}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=["default", "speculative", "triage"], default="default")
+    parser.add_argument("--latency", type=float, default=0.05, help="simulated seconds per model call")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--async", dest="use_async", action="store_true", help="run turns with graph.ainvoke")
+    parser.add_argument("--scenario", action="append", choices=list(SCENARIOS), help="run only these scenarios")
+    parser.add_argument("-o", "--output", help="write the JSON results to this file instead of stdout")
+    args = parser.parse_args()
+
+    report = run(mode=args.mode, latency=args.latency, iterations=args.iterations, use_async=args.use_async,
+                 scenarios=args.scenario)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
@@ -0,0 +1,108 @@
+"""
+Measures the cold-start cost of importing the graph module and of compiling its graph on first access.
+
+Each run starts a fresh interpreter with `python -X importtime -c "import configpilot"`, and parses the report into
+the total import time and the modules with the largest cumulative import time. A second interpreter times the
+first `configpilot.graph` access. The modules in DEFERRED_MODULES must not be imported by the module import alone.
+
+Results are printed as JSON. With --max-import-ms, the exit status is 1 when the median import time is above the
+limit or a deferred module was imported eagerly, so the benchmark can gate startup regressions in CI.
+
+    python -m benchmarks.import_benchmark [--module configpilot] [--runs 5] [--top 15] [--max-import-ms 1500]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import Any, Dict, List, Tuple
+
+# Heavy dependencies only loaded when a model client is built, a Postgres connection is opened or a call fails
+DEFERRED_MODULES = ("langchain_openai", "openai", "psycopg2")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_GRAPH_TIMER = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+imported = time.perf_counter()
+{module}.graph
+print(json.dumps({{"import_ms": (imported - start) * 1000, "graph_ms": (time.perf_counter() - imported) * 1000,
+                  "deferred_loaded": [name for name in {deferred!r} if name in sys.modules]}}))
+"""
+
+
+def _python(args: List[str]) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, *args], cwd=ROOT, capture_output=True, text=True, check=True)
+
+
+def parse_importtime(report: str) -> List[Tuple[str, int, int, int]]:
+    """
+    Parses `-X importtime` lines into (module, depth, self µs, cumulative µs) tuples.
+    """
+    modules = []
+    for line in report.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        modules.append((name.strip(), depth, int(self_us), int(cumulative_us)))
+    return modules
+
+
+def _import_run(module: str) -> List[Tuple[str, int, int, int]]:
+    return parse_importtime(_python(["-X", "importtime", "-c", f"import {module}"]).stderr)
+
+
+def run(module: str = "configpilot", runs: int = 5, top: int = 15) -> Dict[str, Any]:
+    import_runs = [_import_run(module) for _ in range(runs)]
+    totals = [next(cumulative for name, _, _, cumulative in modules if name == module) / 1000
+              for modules in import_runs]
+
+    # The breakdown comes from the median run, so one slow outlier does not skew it
+    median_run = import_runs[sorted(range(runs), key=lambda index: totals[index])[runs // 2]]
+    imported = {name for name, _, _, _ in median_run}
+    slowest = sorted(median_run, key=lambda entry: entry[3], reverse=True)[1:top + 1]
+
+    graph_runs = [json.loads(_python(["-c", _GRAPH_TIMER.format(module=module, deferred=DEFERRED_MODULES)]).stdout)
+                  for _ in range(runs)]
+
+    return {
+        "module": module,
+        "runs": runs,
+        "import_ms": {
+            "median": round(statistics.median(totals), 3),
+            "min": round(min(totals), 3),
+            "max": round(max(totals), 3),
+        },
+        "first_graph_access_ms": round(statistics.median(result["graph_ms"] for result in graph_runs), 3),
+        "modules_imported": len(imported),
+        "deferred_modules_loaded": sorted(imported.intersection(DEFERRED_MODULES)),
+        "deferred_modules_loaded_by_graph": sorted({name for result in graph_runs for name in result["deferred_loaded"]}),
+        "slowest_imports_ms": {f"{'  ' * depth}{name}": round(cumulative / 1000, 3)
+                               for name, depth, _, cumulative in slowest},
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="configpilot", help="module to import")
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per measurement")
+    parser.add_argument("--top", type=int, default=15, help="slowest imports to list")
+    parser.add_argument("--max-import-ms", type=float, help="fail when the median import time is above this")
+    parser.add_argument("-o", "--output", help="write the JSON results to this file instead of stdout")
+    args = parser.parse_args()
+
+    report = run(module=args.module, runs=args.runs, top=args.top)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.max_import_ms is not None and (report["import_ms"]["median"] > args.max_import_ms
+                                           or report["deferred_modules_loaded"]):
+        sys.exit(1)
@@ -0,0 +1,109 @@
+"""
+Reports, per chain, how many prompt tokens are a static prefix that provider-side prompt caching can serve.
+
+Offline (default), every chain's prompt is rendered for the sample inputs and the prefix shared by all renders is
+measured. OpenAI caches prompts of at least 1024 tokens in 128-token steps, so the cacheable tokens are the shared
+prefix rounded down to that grid. With --live, the sample inputs are run through the graph twice and the cached and
+uncached prompt tokens reported by the provider are collected per chain instead.
+
+    python -m benchmarks.prompt_cache_benchmark [--live]
+"""
+import argparse
+import json
+import os
+from typing import Any, Callable, Dict, List
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from benchmarks.triage_benchmark import SAMPLE_INPUTS, _count_tokens
+from chains import (
+    ambiguity_resolution,
+    classifier,
+    creator_assistant,
+    field_mapper,
+    history_summarizer,
+    non_field_guidance,
+    reflection_mapper,
+    relevance_reflector,
+    triage,
+)
+from instrumentation import prompt_cache_report
+from state import AnimeCharacter
+
+
+MIN_CACHED_PROMPT_TOKENS = 1024
+CACHE_INCREMENT_TOKENS = 128
+
+# Chain name -> renders its prompt messages for a user input
+CHAINS: Dict[str, Callable[[str], List[Any]]] = {
+    "classifier": classifier._classifier_messages,
+    "relevance_reflector": relevance_reflector._relevance_reflector_messages,
+    "triage": triage._triage_messages,
+    "field_mapper": field_mapper._field_mapper_messages,
+    "reflection_mapper": lambda user_input: reflection_mapper._reflection_messages(
+        user_input, AnimeCharacter(name=user_input.split()[-1])),
+    "ambiguity_resolution": lambda user_input: ambiguity_resolution._ambiguity_resolution_messages(
+        "ambiguous", f"The input '{user_input}' lacks detail."),
+    "non_field_guidance": non_field_guidance._non_field_guidance_messages,
+    "creator_assistant": lambda user_input: creator_assistant._creation_messages(
+        json.dumps({"name": user_input.split()[-1]}), json.dumps({"name": user_input.split()[-1], "age": None})),
+    "history_summarizer": lambda user_input: history_summarizer._history_summarizer_messages(
+        "", [HumanMessage(user_input), AIMessage("Tell me more.")]),
+}
+
+
+def _render(messages) -> str:
+    # Role markers stand in for the chat framing, so a prefix cannot run across a message boundary unnoticed
+    return "".join(f"<|{message.type}|>{message.content}" for message in messages)
+
+
+def _shared_prefix(texts: List[str]) -> str:
+    prefix = os.path.commonprefix(texts)
+    # Stops at the start of the first word that differs, so the prefix tokenizes the same way in every render
+    return prefix[:prefix.rfind(" ") + 1] if len(texts) > 1 and prefix not in texts else prefix
+
+
+def _cacheable(prefix_tokens: int) -> int:
+    if prefix_tokens < MIN_CACHED_PROMPT_TOKENS:
+        return 0
+    return prefix_tokens - prefix_tokens % CACHE_INCREMENT_TOKENS
+
+
+def _offline() -> Dict[str, Dict[str, Any]]:
+    results = {}
+    for chain, render in CHAINS.items():
+        texts = [_render(render(user_input)) for user_input in SAMPLE_INPUTS]
+        prompt_tokens = sum(_count_tokens(text) for text in texts) / len(texts)
+        prefix_tokens = _count_tokens(_shared_prefix(texts))
+
+        results[chain] = {
+            "prompt_tokens": round(prompt_tokens, 1),
+            "static_prefix_tokens": prefix_tokens,
+            "static_ratio": round(prefix_tokens / prompt_tokens, 3),
+            "cacheable_tokens": _cacheable(prefix_tokens),
+        }
+    return results
+
+
+def _live() -> Dict[str, Dict[str, Any]]:
+    from configpilot import build_graph
+
+    graph = build_graph()
+    with prompt_cache_report() as report:
+        # The first pass primes the provider cache, the second one can hit it
+        for _ in range(2):
+            for user_input in SAMPLE_INPUTS:
+                graph.invoke({"messages": [HumanMessage(content=user_input)]})
+    return report.report()
+
+
+def run(live: bool = False) -> Dict[str, Any]:
+    return {"mode": "live" if live else "offline", "chains": _live() if live else _offline()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--live", action="store_true", help="run the graph against OpenAI and report cached tokens")
+    args = parser.parse_args()
+
+    print(json.dumps(run(live=args.live), indent=2))
@@ -0,0 +1,132 @@
+"""
+Compares round trips and tokens per turn between the two-call entry path (classifier + relevance reflector)
+and the single triage call.
+
+Offline (default), prompt tokens are estimated from the rendered messages and the structured-output schema.
+With --live, every input is sent to OpenAI and the provider's usage metadata is reported instead.
+
+    python -m benchmarks.triage_benchmark [--live] [--extract-fields]
+"""
+import argparse
+import json
+import time
+from functools import lru_cache
+
+from langchain_core.callbacks import UsageMetadataCallbackHandler
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+from chains import classifier, relevance_reflector, triage
+
+
+SAMPLE_INPUTS = [
+    "el personaje de anime se llama Brais tiene 14 años",
+    "She is a cheerful 16-year-old girl with long pink hair",
+    "el personaje es increíblemente fuerte pero no tiene ningún poder",
+    "el personaje se llama",
+    "I need help coming up with a name.",
+]
+
+
+@lru_cache(maxsize=None)
+def _encoding():
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("o200k_base")
+    except Exception:
+        return None
+
+
+def _count_tokens(text: str) -> int:
+    encoding = _encoding()
+    if encoding is None:
+        # Rough fallback when the encoding cannot be loaded
+        return max(1, len(text) // 4)
+    return len(encoding.encode(text))
+
+
+def _estimate_prompt_tokens(messages, schema) -> int:
+    # Every chat message adds a few framing tokens on top of its content
+    tokens = sum(_count_tokens(message.content) + 4 for message in messages)
+    return tokens + _count_tokens(json.dumps(convert_to_openai_tool(schema, strict=True)))
+
+
+def _offline_path(user_input: str, extract_fields: bool):
+    two_call_tokens = (
+        _estimate_prompt_tokens(classifier._classifier_messages(user_input), classifier.Classifier)
+        + _estimate_prompt_tokens(relevance_reflector._relevance_reflector_messages(user_input),
+                                  relevance_reflector.RelevanceReflector)
+    )
+    schema = triage.TriageWithFields if extract_fields else triage.Triage
+    triage_tokens = _estimate_prompt_tokens(triage._triage_messages(user_input), schema)
+
+    return {
+        "two_call": {"round_trips": 2, "prompt_tokens": two_call_tokens},
+        "triage": {"round_trips": 1, "prompt_tokens": triage_tokens},
+    }
+
+
+def _live_call(func, *args, **kwargs):
+    handler = UsageMetadataCallbackHandler()
+    start = time.perf_counter()
+    func(*args, **kwargs, config={"callbacks": [handler]})
+    elapsed = time.perf_counter() - start
+
+    usage = {"input_tokens": 0, "output_tokens": 0, "total_tokens": 0}
+    for model_usage in handler.usage_metadata.values():
+        for key in usage:
+            usage[key] += model_usage.get(key, 0)
+
+    return usage, elapsed
+
+
+def _live_path(user_input: str, extract_fields: bool):
+    classifier_usage, classifier_time = _live_call(
+        classifier._classifier_llm().invoke, classifier._classifier_messages(user_input))
+    reflector_usage, reflector_time = _live_call(
+        relevance_reflector._relevance_reflector_llm().invoke,
+        relevance_reflector._relevance_reflector_messages(user_input))
+
+    llm = triage._triage_with_fields_llm() if extract_fields else triage._triage_llm()
+    triage_usage, triage_time = _live_call(llm.invoke, triage._triage_messages(user_input))
+
+    return {
+        "two_call": {
+            "round_trips": 2,
+            "prompt_tokens": classifier_usage["input_tokens"] + reflector_usage["input_tokens"],
+            "completion_tokens": classifier_usage["output_tokens"] + reflector_usage["output_tokens"],
+            "latency_s": round(classifier_time + reflector_time, 3),
+        },
+        "triage": {
+            "round_trips": 1,
+            "prompt_tokens": triage_usage["input_tokens"],
+            "completion_tokens": triage_usage["output_tokens"],
+            "latency_s": round(triage_time, 3),
+        },
+    }
+
+
+def run(live: bool = False, extract_fields: bool = False):
+    results = []
+    for user_input in SAMPLE_INPUTS:
+        path = _live_path if live else _offline_path
+        results.append({"input": user_input, **path(user_input, extract_fields)})
+
+    summary = {}
+    for variant in ("two_call", "triage"):
+        totals = {}
+        for result in results:
+            for key, value in result[variant].items():
+                totals[key] = totals.get(key, 0) + value
+        summary[variant] = {key: round(value / len(results), 3) for key, value in totals.items()}
+
+    return {"mode": "live" if live else "offline", "extract_fields": extract_fields,
+            "per_turn_mean": summary, "results": results}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--live", action="store_true", help="call OpenAI and report provider usage")
+    parser.add_argument("--extract-fields", action="store_true", help="benchmark triage with field extraction")
+    args = parser.parse_args()
+
+    print(json.dumps(run(live=args.live, extract_fields=args.extract_fields), ensure_ascii=False, indent=2))
@@ -1,36 +1,60 @@
+from functools import partial
 from typing import Any
 
-from langchain_core.messages import SystemMessage, HumanMessage
+from langchain_core.messages import SystemMessage
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_openai import ChatOpenAI
 
+from chains.history_summarizer import summary_context
+from chains.llm import cached_chain, for_chain, get_reply_model
+from chains.tiering import empty_reply, tiered_invoke, atiered_invoke
 
-def generate_response(input_type: str, reasoning: str) -> Any:
-    system_message = SystemMessage("""
-            You are a helpful assistant that generates specific clarification questions based on the analysis of user input. 
-            Given the input type (ambiguous, misleading, or stable) and the reasoning behind this classification, your task is to 
-            generate a concrete question aimed at clarifying the ambiguous or misleading field(s). 
-            If multiple fields are identified as ambiguous or misleading, ask about one field at a time, prioritizing the most critical one.
-        """)
 
-    human_message = HumanMessage(f"""
-            Based on the previous analysis, the input has been classified as '{input_type}'. The reasoning provided is:
+SYSTEM_MESSAGE = SystemMessage("""
+        You are a helpful assistant that generates specific clarification questions based on the analysis of user input. 
+        Given the input type (ambiguous, misleading, or stable) and the reasoning behind this classification, your task is to 
+        generate a concrete question aimed at clarifying the ambiguous or misleading field(s). 
+        If multiple fields are identified as ambiguous or misleading, ask about one field at a time, prioritizing the most critical one.
+    """)
 
-            "{reasoning}"
 
-            Please generate a concrete question to clarify the ambiguous or misleading field in the user's input.
-        """)
+PROMPT = ChatPromptTemplate.from_messages([
+    SYSTEM_MESSAGE,
+    ("human", """{history}Please generate a concrete question to clarify the ambiguous or misleading field in the user's input.
 
-    prompt_components = [system_message, human_message]
+Based on the previous analysis, the input has been classified as '{input_type}'. The reasoning provided is:
 
-    prompt_template = ChatPromptTemplate.from_messages(prompt_components)
+"{reasoning}\""""),
+])
 
-    llm = ChatOpenAI(model_name="gpt-4o", temperature=0.5)
 
-    relevance_reflector_chain = prompt_template | llm
+MODEL_NAME = "gpt-4o"
 
-    relevance = relevance_reflector_chain.invoke({"input_type": input_type,
-                                                  "reasoning": reasoning})
+
+@cached_chain
+def _ambiguity_resolution_llm(model_name: str = MODEL_NAME):
+    return for_chain("ambiguity_resolution", model_name, partial(get_reply_model, temperature=0.5), streaming=True)
+
+
+def _ambiguity_resolution_messages(input_type: str, reasoning: str, history_summary: str = ""):
+    return PROMPT.format_messages(history=summary_context(history_summary), input_type=input_type,
+                                  reasoning=reasoning)
+
+
+def generate_response(input_type: str, reasoning: str, history_summary: str = "") -> Any:
+    messages = _ambiguity_resolution_messages(input_type, reasoning, history_summary)
+
+    relevance = tiered_invoke("ambiguity_resolution", MODEL_NAME,
+                              lambda model_name: _ambiguity_resolution_llm(model_name).invoke(messages), empty_reply)
+
+    return relevance
+
+
+async def agenerate_response(input_type: str, reasoning: str, history_summary: str = "") -> Any:
+    messages = _ambiguity_resolution_messages(input_type, reasoning, history_summary)
+
+    relevance = await atiered_invoke("ambiguity_resolution", MODEL_NAME,
+                                     lambda model_name: _ambiguity_resolution_llm(model_name).ainvoke(messages),
+                                     empty_reply)
 
     return relevance
 
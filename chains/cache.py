@@ -0,0 +1,327 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Type
+
+from langchain_core.messages import BaseMessage
+from pydantic import BaseModel
+
+import settings
+from instrumentation.metrics import current_recorder
+
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+_PUNCTUATION = re.compile(r"[^\w\s]")
+
+
+def normalize_input(text: str) -> str:
+    """
+    Normalizes user input so trivially different messages (whitespace, case, punctuation) share a cache entry.
+    """
+    text = _PUNCTUATION.sub(" ", text.casefold())
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def _collapse_whitespace(text: str) -> str:
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def prompt_hash(system_prompt: str) -> str:
+    return hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()
+
+
+def cache_key(model_name: str,
+              temperature: Optional[float],
+              schema: Type[BaseModel],
+              messages: List[BaseMessage],
+              normalize: bool = True) -> str:
+    """
+    Builds the cache key from the model, temperature, output schema, a hash of the system prompt and the
+    dynamic messages. Editing a system prompt changes its hash, which invalidates its entries.
+
+    With `normalize`, case and punctuation differences are ignored. Chains that return values taken from the
+    message turn it off: "No, se llama Brais" and "no se llama brais" mean different things, and the cached
+    casing would be returned for both.
+    """
+    system_prompt, *dynamic_messages = messages
+    payload = [
+        model_name,
+        temperature,
+        schema.__name__,
+        prompt_hash(system_prompt.content),
+        [(normalize_input if normalize else _collapse_whitespace)(message.content) for message in dynamic_messages],
+    ]
+    return hashlib.sha256(json.dumps(payload, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    In-process LRU cache with TTL backed by an on-disk SQLite store. Both tiers are bounded in size and the
+    least recently used entries are evicted first.
+
+    The disk tier is optional: when its file cannot be opened or SQLite fails (e.g. a read-only filesystem), the
+    cache logs a warning and keeps working from memory only. `aget` and `aset` run the disk work in a worker
+    thread so they never block the event loop.
+    """
+
+    def __init__(self,
+                 path: Optional[str] = None,
+                 max_entries: int = 1024,
+                 max_disk_entries: int = 100_000,
+                 ttl_seconds: float = 86_400):
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.ttl_seconds = ttl_seconds
+        self.stats: Dict[str, int] = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Disk work has its own lock, so memory lookups never wait on SQLite
+        self._db_lock = threading.Lock()
+        self._db = None
+        self._disk_entries = 0
+
+        if path:
+            try:
+                self._db = self._open(path)
+                # Counted once, then tracked as rows are added and removed
+                (self._disk_entries,) = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()
+            except (OSError, sqlite3.Error) as e:
+                logger.warning("Response cache at %s is unavailable, caching in memory only: %s", path, e)
+
+    @staticmethod
+    def _open(path: str) -> sqlite3.Connection:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        db = sqlite3.connect(path, check_same_thread=False)
+        db.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        db.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+        db.commit()
+        return db
+
+    def get(self, key: str, schema: Type[BaseModel]) -> Optional[BaseModel]:
+        now = time.time()
+        result = self._memory_get(key, schema, now)
+        if result is None and self._db is not None:
+            result = self._disk_lookup(key, schema, now)
+        if result is None:
+            self._count_miss()
+        return result
+
+    async def aget(self, key: str, schema: Type[BaseModel]) -> Optional[BaseModel]:
+        now = time.time()
+        result = self._memory_get(key, schema, now)
+        if result is None and self._db is not None:
+            result = await asyncio.to_thread(self._disk_lookup, key, schema, now)
+        if result is None:
+            self._count_miss()
+        return result
+
+    def set(self, key: str, value: BaseModel) -> None:
+        now = time.time()
+        serialized = self._memory_store(key, value, now)
+        if self._db is not None:
+            self._disk_set(key, serialized, now)
+
+    async def aset(self, key: str, value: BaseModel) -> None:
+        now = time.time()
+        serialized = self._memory_store(key, value, now)
+        if self._db is not None:
+            await asyncio.to_thread(self._disk_set, key, serialized, now)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+        with self._db_lock:
+            if self._db is not None:
+                try:
+                    self._db.execute("DELETE FROM responses")
+                    self._db.commit()
+                    self._disk_entries = 0
+                except sqlite3.Error as e:
+                    self._disable_disk(e)
+
+    def _count_miss(self) -> None:
+        with self._lock:
+            self.stats["misses"] += 1
+
+    def _memory_get(self, key: str, schema: Type[BaseModel], now: float) -> Optional[BaseModel]:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None or now - entry[1] >= self.ttl_seconds:
+                return None
+            self._memory.move_to_end(key)
+            self.stats["hits"] += 1
+        return schema.model_validate_json(entry[0])
+
+    def _memory_store(self, key: str, value: BaseModel, now: float) -> str:
+        serialized = value.model_dump_json()
+        with self._lock:
+            self._memory_set(key, serialized, now)
+        return serialized
+
+    def _memory_set(self, key: str, serialized: str, created_at: float) -> None:
+        self._memory[key] = (serialized, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def _disable_disk(self, error: Exception) -> None:
+        # Called with `_db_lock` held
+        logger.warning("Response cache disk tier failed, caching in memory only: %s", error)
+        try:
+            self._db.close()
+        except sqlite3.Error:
+            pass
+        self._db = None
+
+    def _disk_lookup(self, key: str, schema: Type[BaseModel], now: float) -> Optional[BaseModel]:
+        value = self._disk_get(key, now)
+        if value is None:
+            return None
+        with self._lock:
+            self.stats["hits"] += 1
+            self.stats["disk_hits"] += 1
+            self._memory_set(key, value[0], value[1])
+        return schema.model_validate_json(value[0])
+
+    def _disk_get(self, key: str, now: float):
+        with self._db_lock:
+            if self._db is None:
+                return None
+            try:
+                row = self._db.execute("SELECT value, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    return None
+                if now - row[1] >= self.ttl_seconds:
+                    self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._db.commit()
+                    self._disk_entries -= 1
+                    return None
+                self._db.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+                self._db.commit()
+                return row
+            except sqlite3.Error as e:
+                self._disable_disk(e)
+                return None
+
+    def _disk_set(self, key: str, serialized: str, now: float) -> None:
+        with self._db_lock:
+            if self._db is None:
+                return
+            try:
+                updated = self._db.execute(
+                    "UPDATE responses SET value = ?, created_at = ?, accessed_at = ? WHERE key = ?",
+                    (serialized, now, now, key)
+                ).rowcount
+                if not updated:
+                    self._db.execute(
+                        "INSERT INTO responses (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                        (key, serialized, now, now)
+                    )
+                    self._disk_entries += 1
+
+                overflow = self._disk_entries - self.max_disk_entries
+                if overflow > 0:
+                    evicted = self._db.execute(
+                        "DELETE FROM responses WHERE key IN "
+                        "(SELECT key FROM responses ORDER BY accessed_at LIMIT ?)",
+                        (overflow,)
+                    ).rowcount
+                    self._disk_entries -= evicted
+                    with self._lock:
+                        self.stats["evictions"] += evicted
+                self._db.commit()
+            except sqlite3.Error as e:
+                self._disable_disk(e)
+
+
+_response_cache: Optional[ResponseCache] = None
+
+
+def get_response_cache() -> ResponseCache:
+    global _response_cache
+    if _response_cache is None:
+        _response_cache = ResponseCache(
+            path=settings.RESPONSE_CACHE_PATH or None,
+            max_entries=settings.RESPONSE_CACHE_MAX_ENTRIES,
+            max_disk_entries=settings.RESPONSE_CACHE_MAX_DISK_ENTRIES,
+            ttl_seconds=settings.RESPONSE_CACHE_TTL_SECONDS,
+        )
+    return _response_cache
+
+
+def _cache_enabled(temperature: Optional[float], cache: Optional[bool]) -> bool:
+    # Only deterministic (temperature 0) calls are cached unless a chain opts in or out explicitly
+    if cache is not None:
+        return cache
+    return settings.RESPONSE_CACHE and temperature == 0
+
+
+def _record_lookup(hit: bool) -> None:
+    recorder = current_recorder()
+    if recorder is not None:
+        recorder.record_cache_lookup(hit)
+
+
+def cached_invoke(llm,
+                  messages: List[BaseMessage],
+                  *,
+                  model_name: str,
+                  temperature: Optional[float],
+                  schema: Type[BaseModel],
+                  cache: Optional[bool] = None,
+                  normalize: bool = True) -> Any:
+    """
+    Invokes a structured-output runnable through the response cache. `normalize` is passed on to `cache_key`.
+    """
+    if not _cache_enabled(temperature, cache):
+        return llm.invoke(messages)
+
+    response_cache = get_response_cache()
+    key = cache_key(model_name, temperature, schema, messages, normalize)
+
+    result = response_cache.get(key, schema)
+    _record_lookup(result is not None)
+    if result is None:
+        result = llm.invoke(messages)
+        response_cache.set(key, result)
+    return result
+
+
+async def acached_invoke(llm,
+                         messages: List[BaseMessage],
+                         *,
+                         model_name: str,
+                         temperature: Optional[float],
+                         schema: Type[BaseModel],
+                         cache: Optional[bool] = None,
+                         normalize: bool = True) -> Any:
+    if not _cache_enabled(temperature, cache):
+        return await llm.ainvoke(messages)
+
+    response_cache = get_response_cache()
+    key = cache_key(model_name, temperature, schema, messages, normalize)
+
+    result = await response_cache.aget(key, schema)
+    _record_lookup(result is not None)
+    if result is None:
+        result = await llm.ainvoke(messages)
+        await response_cache.aset(key, result)
+    return result
@@ -1,8 +1,17 @@
-from langchain_core.messages import SystemMessage, HumanMessage
+import logging
+from functools import lru_cache, partial
+
+from langchain_core.messages import SystemMessage
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_openai import ChatOpenAI
 from pydantic import BaseModel, Field
-from typing import Literal, Any
+from typing import Literal, Any, Optional, Sequence, Tuple
+
+from chains.cache import cached_invoke, acached_invoke
+from chains.llm import cached_chain, for_chain, get_structured_model
+from state import ANIME_CHARACTER
+
+
+logger = logging.getLogger(__name__)
 
 
 class Classifier(BaseModel):
@@ -18,74 +27,103 @@ class Classifier(BaseModel):
     )
 
 
-def classify_input(user_input) -> Any:
-
-    print("-- CLASSIFY INPUT --")
+SYSTEM_PROMPT = (
+    """You are an expert at determining whether a user's input provides actual attribute values corresponding to the 
+    provided anime-character JSON fields.
+    
+    Your task is to analyze the user's input and decide if it includes specific information that can be directly 
+    mapped to any of the anime-character fields. Focus exclusively on inputs that provide attribute values regarding
+    only about the anime-character, and disregard questions, requests for guidance, or unrelated content.
 
-    system_message = SystemMessage(
-        """You are an expert at determining whether a user's input provides actual attribute values corresponding to the 
-        provided anime-character JSON fields.
-        
-        Your task is to analyze the user's input and decide if it includes specific information that can be directly 
-        mapped to any of the anime-character fields. Focus exclusively on inputs that provide attribute values regarding
-        only about the anime-character, and disregard questions, requests for guidance, or unrelated content.
+    The anime-character JSON fields are:
     
-        The anime-character JSON fields are:
-        
-        - name
-        - age
-        - gender
-        - physical_appearance
-        - personality
-        - abilities_power
-        - occupation
-        
-        Please provide a simple, clear determination: respond with `True` if the user's input includes actual attribute 
-        values for any of the JSON fields, or `False` if it does not.
-        
-        **Examples:**
-        
-        - **Input:** "The character is a 16-year-old girl with long blue hair."
-        
-          - **Response:** `True`
-        
-        - **Input:** "Should I describe the character's abilities?"
-        
-          - **Response:** `False`
-        
-        - **Input:** "He is a wise old man who controls time."
-        
-          - **Response:** `True`
-        
-        - **Input:** "I need help coming up with a name."
-        
-          - **Response:** `False`
-            """
-        )
-
-    human_message = HumanMessage(
-        f"""Please assess the following user input and determine if it provides actual attribute values that correspond 
-        to the provided JSON fields for an anime character profile.
+    {fields}
     
-        User Input: {user_input}
+    Please provide a simple, clear determination: respond with `True` if the user's input includes actual attribute 
+    values for any of the JSON fields, or `False` if it does not.
     
-        Based on the specified JSON fields, does the user input include attribute values for any of them? Please answer 
-        `True` or `False`."""
-    )
+    **Examples:**
+    
+    - **Input:** "The character is a 16-year-old girl with long blue hair."
+    
+      - **Response:** `True`
+    
+    - **Input:** "Should I describe the character's abilities?"
+    
+      - **Response:** `False`
+    
+    - **Input:** "He is a wise old man who controls time."
+    
+      - **Response:** `True`
+    
+    - **Input:** "I need help coming up with a name."
+    
+      - **Response:** `False`
+        """
+)
+
+
+@lru_cache(maxsize=None)
+def _system_message(fields: Optional[Tuple[str, ...]] = None) -> SystemMessage:
+    """
+    System prompt listing only `fields`, or every field.
+    """
+    return SystemMessage(SYSTEM_PROMPT.format(fields=ANIME_CHARACTER.prompt_fields(types=False, fields=fields)))
+
 
-    prompt_components = [
-        system_message,
-        human_message,
-    ]
+SYSTEM_MESSAGE = _system_message()
+
+# Static instructions first and the user input last, so every call shares the longest possible prompt prefix
+HUMAN_PROMPT = """Please assess the following user input and determine if it provides actual attribute values that
+correspond to the provided JSON fields for an anime character profile. Based on the specified JSON fields, does the
+user input include attribute values for any of them? Please answer `True` or `False`.
+
+User Input: {user_input}"""
+
+
+@lru_cache(maxsize=None)
+def _prompt(fields: Optional[Tuple[str, ...]] = None) -> ChatPromptTemplate:
+    return ChatPromptTemplate.from_messages([_system_message(fields), ("human", HUMAN_PROMPT)])
+
+
+PROMPT = _prompt()
+
+
+MODEL_NAME = "gpt-4o-mini"
+TEMPERATURE = 0
+
+
+@cached_chain
+def _classifier_llm():
+    return for_chain("classifier", MODEL_NAME,
+                     partial(get_structured_model, temperature=TEMPERATURE, schema=Classifier, method="json_schema",
+                             strict=True))
+
+
+def _classifier_messages(user_input, fields: Optional[Sequence[str]] = None):
+    return _prompt(tuple(fields) if fields else None).format_messages(user_input=user_input)
+
+
+def classify_input(user_input, fields: Optional[Sequence[str]] = None) -> Any:
+    """
+    Classifies whether the user input provides values for the fields. When `fields` is given, only those
+    candidate fields are listed in the prompt.
+    """
+
+    logger.debug("-- CLASSIFY INPUT --")
+
+    classification = cached_invoke(_classifier_llm(), _classifier_messages(user_input, fields),
+                                   model_name=MODEL_NAME, temperature=TEMPERATURE, schema=Classifier)
+
+    return classification
 
-    prompt_template = ChatPromptTemplate.from_messages(prompt_components)
 
-    llm = ChatOpenAI(model_name="gpt-4o-mini", temperature=0).with_structured_output(
-        Classifier, method="json_schema", strict=True)
+async def aclassify_input(user_input, fields: Optional[Sequence[str]] = None) -> Any:
 
-    classifier_chain = prompt_template | llm
+    logger.debug("-- CLASSIFY INPUT --")
 
-    classification = classifier_chain.invoke({"user_input": user_input})
+    classification = await acached_invoke(_classifier_llm(), _classifier_messages(user_input, fields),
+                                          model_name=MODEL_NAME, temperature=TEMPERATURE, schema=Classifier)
 
     return classification
 
@@ -1,8 +1,16 @@
+from functools import partial
+
 from langchain_core.messages import SystemMessage
-from langchain_openai import ChatOpenAI
+from langchain_core.prompts import ChatPromptTemplate
+
+from chains.history_summarizer import summary_context
+from chains.llm import cached_chain, for_chain, get_reply_model
+from chains.tiering import empty_reply, tiered_invoke, atiered_invoke
+from state import ANIME_CHARACTER
 
-def creation_message(new_fields: str, current_fields: str):
-    system_prompt = f"""You are a friendly and supportive assistant helping a user create an anime character. 
+
+SYSTEM_MESSAGE = SystemMessage(
+    f"""You are a friendly and supportive assistant helping a user create an anime character. 
 The user has just provided or updated certain attributes of their character. Your task is to:
 1. Warmly acknowledge and confirm the newly provided details.
 2. Show them what attributes have been filled in so far in a friendly, human way.
@@ -15,22 +23,43 @@ For example, you might say something like:
 Be natural, warm, and enthusiastic, like a friend who's curious and eager to learn more about the character.
 
 Here are all the fields that can be completed:
-- name
-- age
-- gender
-- physical_appearance
-- personality
-- abilities_power
-- occupation
-
-These are the newly provided or updated details:
+{ANIME_CHARACTER.prompt_fields(indent="", types=False)}
+"""
+)
+
+# The character details change every turn, so they follow the static instructions instead of being part of them
+PROMPT = ChatPromptTemplate.from_messages([
+    SYSTEM_MESSAGE,
+    ("human", """{history}These are the newly provided or updated details:
 {new_fields}
 
 And here is the current state of the character's attributes:
-{current_fields}
-"""
+{current_fields}"""),
+])
+
+
+MODEL_NAME = "gpt-4o"
+
+
+@cached_chain
+def _creator_llm(model_name: str = MODEL_NAME):
+    return for_chain("creator_assistant", model_name, partial(get_reply_model, temperature=0), streaming=True)
+
+
+def _creation_messages(new_fields: str, current_fields: str, history_summary: str = ""):
+    return PROMPT.format_messages(history=summary_context(history_summary), new_fields=new_fields,
+                                  current_fields=current_fields)
+
+
+def creation_message(new_fields: str, current_fields: str, history_summary: str = ""):
+    messages = _creation_messages(new_fields, current_fields, history_summary)
+    result = tiered_invoke("creator_assistant", MODEL_NAME,
+                           lambda model_name: _creator_llm(model_name).invoke(messages), empty_reply)
+    return result
+
 
-    llm = ChatOpenAI(model_name="gpt-4o", temperature=0)
-    messages = [SystemMessage(content=system_prompt)]
-    result = llm.invoke(messages)
+async def acreation_message(new_fields: str, current_fields: str, history_summary: str = ""):
+    messages = _creation_messages(new_fields, current_fields, history_summary)
+    result = await atiered_invoke("creator_assistant", MODEL_NAME,
+                                  lambda model_name: _creator_llm(model_name).ainvoke(messages), empty_reply)
     return result
@@ -1,61 +1,197 @@
-from langchain_openai import ChatOpenAI
-from langchain_core.messages import SystemMessage, HumanMessage
+from functools import lru_cache, partial
+from typing import Optional, Sequence, Tuple, Type
+
+from langchain_core.messages import SystemMessage
 from langchain_core.prompts import ChatPromptTemplate
+from pydantic import BaseModel
+
+from chains.cache import cached_invoke, acached_invoke
+from chains.history_summarizer import summary_context
+from chains.llm import cached_chain, for_chain, get_structured_model
+from chains.tiering import aescalated_invoke, atiered_invoke, escalated_invoke, tiered_invoke
+from state import ANIME_CHARACTER, AnimeCharacter
+
+
+SYSTEM_PROMPT = (
+    """You are a highly accurate information extraction assistant. Given the user input describing an anime character,
+    extract the character's attributes and map them into the following JSON fields:
+
+    {fields}
+
+    Instructions:
+    - If an attribute is not mentioned, leave it as null (None).
+    - If an attribute is implicitly described, interpret it reasonably.
+    - For example, if the user says "He is a 3-year-old boy," then:
+        name: None (not mentioned)
+        age: 3
+        gender: "male"
+        physical_appearance: None (not enough info)
+        personality: None (not mentioned)
+        abilities_power: None (not mentioned)
+        occupation: None (not mentioned)
+
+    Return only the final JSON object as structured output.
+    """
+)
 
-from state import AnimeCharacter
 
+@lru_cache(maxsize=None)
+def _system_message(fields: Optional[Tuple[str, ...]] = None) -> SystemMessage:
+    """
+    System prompt listing only `fields`, or every field.
+    """
+    return SystemMessage(SYSTEM_PROMPT.format(fields=ANIME_CHARACTER.prompt_fields(fields=fields)))
+
+
+SYSTEM_MESSAGE = _system_message()
 
-def map_fields(user_input: str) -> AnimeCharacter:
+
+@lru_cache(maxsize=None)
+def _prompt(fields: Optional[Tuple[str, ...]] = None) -> ChatPromptTemplate:
+    """
+    Field mapper prompt for `fields`, or every field. The user input goes last, after everything that is the same
+    on every call.
+    """
+    requested_fields = ""
+    if fields is not None:
+        requested_fields = f"\nOnly these fields are requested: {', '.join(fields)}."
+
+    return ChatPromptTemplate.from_messages([
+        _system_message(fields),
+        ("human", f"Please extract the fields and return them in JSON format.{requested_fields}\n\n"
+                  "{history}User input: {user_input}"),
+    ])
+
+
+PROMPT = _prompt()
+
+
+MODEL_NAME = "gpt-4o"
+TEMPERATURE = 0
+
+
+@cached_chain
+def _field_mapper_llm(model_name: str = MODEL_NAME):
+    return for_chain("field_mapper", model_name,
+                     partial(get_structured_model, temperature=TEMPERATURE, schema=AnimeCharacter,
+                             method="json_schema", strict=True))
+
+
+@lru_cache(maxsize=256)
+def _subset_field_mapper_llm(model_name: str, schema: Type[BaseModel]):
+    # Subset schemas are built once per field set, so the chain is built once per model and field set too
+    return for_chain("field_mapper", model_name,
+                     partial(get_structured_model, temperature=TEMPERATURE, schema=schema, method="json_schema",
+                             strict=True))
+
+
+def _field_mapper_schema(fields: Optional[Sequence[str]]) -> Type[BaseModel]:
+    if fields is None:
+        return AnimeCharacter
+    return ANIME_CHARACTER.subset_model(fields)
+
+
+def _field_mapper_messages(user_input: str, fields: Optional[Sequence[str]] = None, history_summary: str = ""):
+    return _prompt(tuple(fields) if fields is not None else None).format_messages(
+        history=summary_context(history_summary), user_input=user_input
+    )
+
+
+def _field_mapper_call(user_input: str, fields: Optional[Sequence[str]], model_name: str = MODEL_NAME,
+                       history_summary: str = ""):
+    schema = _field_mapper_schema(fields)
+    messages = _field_mapper_messages(user_input, fields, history_summary)
+    if schema is AnimeCharacter:
+        return _field_mapper_llm(model_name), messages, schema
+    return _subset_field_mapper_llm(model_name, schema), messages, schema
+
+
+def _map_fields_with(model_name: str, user_input: str, fields: Optional[Sequence[str]],
+                     history_summary: str = "") -> Tuple[AnimeCharacter, str]:
+    llm, messages, schema = _field_mapper_call(user_input, fields, model_name, history_summary)
+    # Extracted values are taken from the message verbatim, so the cache key keeps its case and punctuation
+    extracted_character = cached_invoke(llm, messages, model_name=model_name, temperature=TEMPERATURE, schema=schema,
+                                        normalize=False)
+    return AnimeCharacter.model_validate(extracted_character.model_dump()), model_name
+
+
+async def _amap_fields_with(model_name: str, user_input: str, fields: Optional[Sequence[str]],
+                            history_summary: str = "") -> Tuple[AnimeCharacter, str]:
+    llm, messages, schema = _field_mapper_call(user_input, fields, model_name, history_summary)
+    extracted_character = await acached_invoke(llm, messages, model_name=model_name, temperature=TEMPERATURE,
+                                               schema=schema, normalize=False)
+    return AnimeCharacter.model_validate(extracted_character.model_dump()), model_name
+
+
+def map_fields_with_model(user_input: str, fields: Optional[Sequence[str]] = None,
+                          history_summary: str = "") -> Tuple[AnimeCharacter, str]:
+    """
+    `map_fields`, also returning the model tier that produced the extraction.
+    """
+
+    return tiered_invoke("field_mapper", MODEL_NAME,
+                         lambda model_name: _map_fields_with(model_name, user_input, fields, history_summary))
+
+
+async def amap_fields_with_model(user_input: str, fields: Optional[Sequence[str]] = None,
+                                 history_summary: str = "") -> Tuple[AnimeCharacter, str]:
+    """
+    Async counterpart of `map_fields_with_model`.
+    """
+
+    return await atiered_invoke("field_mapper", MODEL_NAME,
+                                lambda model_name: _amap_fields_with(model_name, user_input, fields,
+                                                                     history_summary))
+
+
+def map_fields(user_input: str, fields: Optional[Sequence[str]] = None, history_summary: str = "") -> AnimeCharacter:
     """
     Given a user input that has already been classified as having
     relevant anime character attribute data, parse and map it into
     the AnimeCharacter model fields.
+
+    When `fields` is given, only those fields are listed in the prompt and requested from the model, and the rest
+    are returned as None. `history_summary` gives the model the context of the turns dropped from the history.
+
+    With model tiering, extractions that fail schema validation are retried on the next model tier, and those the
+    reflection step doubts are re-run on the top tier with `remap_fields`.
     """
 
-    system_message = SystemMessage(
-        """You are a highly accurate information extraction assistant. Given the user input describing an anime character,
-        extract the character's attributes and map them into the following JSON fields:
-
-        - name (string)
-        - age (integer)
-        - gender (string)
-        - physical_appearance (string)
-        - personality (string)
-        - abilities_power (string)
-        - occupation (string)
-
-        Instructions:
-        - If an attribute is not mentioned, leave it as null (None).
-        - If an attribute is implicitly described, interpret it reasonably.
-        - For example, if the user says "He is a 3-year-old boy," then:
-            name: None (not mentioned)
-            age: 3
-            gender: "male"
-            physical_appearance: None (not enough info)
-            personality: None (not mentioned)
-            abilities_power: None (not mentioned)
-            occupation: None (not mentioned)
-
-        Return only the final JSON object as structured output.
-        """
-    )
+    return map_fields_with_model(user_input, fields, history_summary)[0]
 
-    human_message = HumanMessage(
-        f"""User input: {user_input}
 
-Please extract the fields and return them in JSON format."""
-    )
+async def amap_fields(user_input: str, fields: Optional[Sequence[str]] = None,
+                      history_summary: str = "") -> AnimeCharacter:
+    """
+    Async counterpart of `map_fields`.
+    """
 
-    prompt_template = ChatPromptTemplate.from_messages([system_message, human_message])
+    return (await amap_fields_with_model(user_input, fields, history_summary))[0]
 
-    llm = ChatOpenAI(model_name="gpt-4o", temperature=0).with_structured_output(
-        AnimeCharacter, method="json_schema", strict=True
-    )
 
-    extraction_chain = prompt_template | llm
+def remap_fields(user_input: str, fields: Optional[Sequence[str]], history_summary: str, reason: str,
+                 from_model: str) -> Optional[Tuple[AnimeCharacter, str]]:
+    """
+    Re-extracts `fields` on the top model tier, after reflection raised flags or questions about an extraction made
+    by the cheaper tier `from_model`, and returns it with the top tier's model name. Returns None when `from_model`
+    is already the top tier, or without model tiering.
+    """
+
+    return escalated_invoke("field_mapper", MODEL_NAME, from_model,
+                            lambda model_name: _map_fields_with(model_name, user_input, fields, history_summary),
+                            reason)
+
+
+async def aremap_fields(user_input: str, fields: Optional[Sequence[str]], history_summary: str, reason: str,
+                        from_model: str) -> Optional[Tuple[AnimeCharacter, str]]:
+    """
+    Async counterpart of `remap_fields`.
+    """
 
-    extracted_character = extraction_chain.invoke({"user_input": user_input})
-    return extracted_character
+    return await aescalated_invoke("field_mapper", MODEL_NAME, from_model,
+                                   lambda model_name: _amap_fields_with(model_name, user_input, fields,
+                                                                        history_summary),
+                                   reason)
 
 
 if __name__ == "__main__":
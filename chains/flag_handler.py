@@ -1,49 +1,58 @@
-from langchain_core.messages import SystemMessage, HumanMessage
+from langchain_core.messages import SystemMessage
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_openai import ChatOpenAI
 
+from chains.llm import cached_chain, for_chain, get_chat_model
 from state import AnimeCharacter
 
 
-def response_for_flags(user_input, extracted_character: AnimeCharacter, flags):
+SYSTEM_MESSAGE = SystemMessage(
+    """
+    You are a friendly and approachable assistant that helps users create anime characters.
+    Your main job is to point out any flags—serious inconsistencies or errors—in the current character mapping provided by the user.
 
-    system_message = SystemMessage(
-        """
-        You are a friendly and approachable assistant that helps users create anime characters.
-        Your main job is to point out any flags—serious inconsistencies or errors—in the current character mapping provided by the user.
+    When you spot a flag, you should:
+    - Clearly explain what the issue is.
+    - Ask specific questions to help the user clarify and resolve the problem.
+    - Encourage the user to provide additional information or correct any mistakes to ensure the character mapping is accurate and consistent.
 
-        When you spot a flag, you should:
-        - Clearly explain what the issue is.
-        - Ask specific questions to help the user clarify and resolve the problem.
-        - Encourage the user to provide additional information or correct any mistakes to ensure the character mapping is accurate and consistent.
+    Keep the tone casual and supportive.
+    """
+)
 
-        Keep the tone casual and supportive.
-        """
-    )
+PROMPT = ChatPromptTemplate.from_messages([
+    SYSTEM_MESSAGE,
+    ("human", """**Request:** Please help me address the flags below. Provide guidance on how to clarify and fix these
+issues to ensure the anime character is accurately and consistently mapped.
 
-    human_message = HumanMessage(
-        f"""
-        **User Input:** {user_input}
+**User Input:** {user_input}
 
-        **Current Field Mapping:**
-        {extracted_character.model_dump_json(indent=2)}
+**Current Field Mapping:**
+{field_mapping}
 
-        **Detected Flags:**
-        {flags}
+**Detected Flags:**
+{flags}"""),
+])
+
+
+@cached_chain
+def _flags_chain():
+    return PROMPT | for_chain("flag_handler", "gpt-4o", get_chat_model)
 
-        **Request:** Please help me address the above flags. Provide guidance on how to clarify and fix these issues 
-        to ensure the anime character is accurately and consistently mapped."""
-    )
 
-    prompt_components = [human_message, system_message]
+def _flags_inputs(user_input, extracted_character: AnimeCharacter, flags):
+    return {"user_input": user_input, "field_mapping": extracted_character.model_dump_json(indent=2), "flags": flags}
 
-    prompt = ChatPromptTemplate(prompt_components)
 
-    llm = ChatOpenAI(model_name="gpt-4o")
+def response_for_flags(user_input, extracted_character: AnimeCharacter, flags):
+
+    response = _flags_chain().invoke(_flags_inputs(user_input, extracted_character, flags))
+
+    return response
+
 
-    chain = prompt | llm
+async def aresponse_for_flags(user_input, extracted_character: AnimeCharacter, flags):
 
-    response = chain.invoke({})
+    response = await _flags_chain().ainvoke(_flags_inputs(user_input, extracted_character, flags))
 
     return response
 
@@ -0,0 +1,69 @@
+import logging
+from functools import partial
+from typing import List, Optional
+
+from langchain_core.messages import SystemMessage, BaseMessage
+from langchain_core.prompts import ChatPromptTemplate
+
+from chains.llm import cached_chain, for_chain, get_chat_model
+
+
+logger = logging.getLogger(__name__)
+
+
+SYSTEM_MESSAGE = SystemMessage(
+    """You summarize the conversation between a user and an assistant that helps the user fill the fields of an
+    anime character profile.
+
+    Update the existing summary with the new conversation turns. Keep the facts the user gave about the character,
+    open questions and the user's preferences. Answer with the updated summary only, in at most 5 sentences.
+    """
+)
+
+
+PROMPT = ChatPromptTemplate.from_messages([
+    SYSTEM_MESSAGE,
+    ("human", """Existing summary: {summary}
+
+New conversation turns:
+{conversation}"""),
+])
+
+
+@cached_chain
+def _history_summarizer_llm():
+    return for_chain("history_summarizer", "gpt-4o-mini", partial(get_chat_model, temperature=0))
+
+
+def _history_summarizer_messages(summary: str, messages: List[BaseMessage]):
+    conversation = "\n".join(f"{message.type}: {message.content}" for message in messages)
+    return PROMPT.format_messages(summary=summary or "(empty)", conversation=conversation)
+
+
+def summary_context(summary: Optional[str]) -> str:
+    """
+    Prompt lines carrying the summary of the turns dropped from the history, or nothing while there is none.
+    It goes in the human message, after the static system prompt, so the prompt prefix stays cacheable.
+    """
+    if not summary:
+        return ""
+    return f"Summary of the earlier conversation: {summary}\n\n"
+
+
+def summarize_history(summary: str, messages: List[BaseMessage]) -> str:
+    """
+    Rolls the given messages into the running conversation summary.
+    """
+
+    logger.debug("-- SUMMARIZING HISTORY --")
+
+    response = _history_summarizer_llm().invoke(_history_summarizer_messages(summary, messages))
+    return response.content
+
+
+async def asummarize_history(summary: str, messages: List[BaseMessage]) -> str:
+
+    logger.debug("-- SUMMARIZING HISTORY --")
+
+    response = await _history_summarizer_llm().ainvoke(_history_summarizer_messages(summary, messages))
+    return response.content
@@ -0,0 +1,193 @@
+from functools import lru_cache, wraps
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Type
+
+from langchain_core.rate_limiters import InMemoryRateLimiter
+from pydantic import BaseModel
+
+import settings
+from chains.resilience import resilient
+from instrumentation.metrics import CHAIN_KEY
+
+# httpx and langchain_openai (which pulls in the openai SDK) are imported when the first client is built, so
+# importing the chains stays cheap
+if TYPE_CHECKING:
+    import httpx
+    from langchain_openai import ChatOpenAI
+
+
+_http_client: Optional["httpx.Client"] = None
+_http_async_client: Optional["httpx.AsyncClient"] = None
+
+# Tag of the user-facing reply models, used to pick their tokens out of `graph.stream(stream_mode="messages")`
+REPLY_TAG = "configpilot:reply"
+
+# Builds the chat model clients; replaced by `set_chat_model_factory` to run the graph against a local stand-in.
+# None stands for `ChatOpenAI`
+_chat_model_factory: Optional[Callable[..., Any]] = None
+
+# Per-model request rate limits, shared by every client of the model
+_rate_limiters: Dict[str, InMemoryRateLimiter] = {}
+
+# Chain factories decorated with `cached_chain`, built ahead of time by `warm_up`
+_chain_factories: List[Callable[[], Any]] = []
+
+
+def _pool_limits() -> "httpx.Limits":
+    import httpx
+
+    return httpx.Limits(
+        max_connections=settings.HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+    )
+
+
+def get_http_client() -> "httpx.Client":
+    """
+    Process-wide HTTP client shared by every chat model, so keep-alive connections are reused across turns.
+    """
+    global _http_client
+    if _http_client is None:
+        import httpx
+
+        _http_client = httpx.Client(limits=_pool_limits())
+    return _http_client
+
+
+def get_http_async_client() -> "httpx.AsyncClient":
+    global _http_async_client
+    if _http_async_client is None:
+        import httpx
+
+        _http_async_client = httpx.AsyncClient(limits=_pool_limits())
+    return _http_async_client
+
+
+def _parse_rate_limits(value: str) -> Dict[str, float]:
+    # "gpt-4o=5,gpt-4o-mini=20" -> {"gpt-4o": 5.0, "gpt-4o-mini": 20.0}
+    limits = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        model_name, _, requests_per_second = item.partition("=")
+        limits[model_name.strip()] = float(requests_per_second)
+    return limits
+
+
+def set_chat_model_factory(factory: Optional[Callable[..., Any]] = None) -> None:
+    """
+    Replaces the class used to build chat models, e.g. with a deterministic fake for offline benchmarks.
+    The factory receives the `ChatOpenAI` keyword arguments. Passing None restores `ChatOpenAI`.
+    """
+    global _chat_model_factory
+    _chat_model_factory = factory
+    clear_registry()
+
+
+def set_rate_limit(model_name: str, requests_per_second: float) -> None:
+    """
+    Limits the requests per second sent to `model_name` across all chains. Models already built are rebuilt on
+    their next use so they pick up the limiter.
+    """
+    _rate_limiters[model_name] = InMemoryRateLimiter(
+        requests_per_second=requests_per_second,
+        max_bucket_size=max(1.0, requests_per_second),
+    )
+    clear_registry()
+
+
+def get_rate_limiter(model_name: str) -> Optional[InMemoryRateLimiter]:
+    return _rate_limiters.get(model_name)
+
+
+@lru_cache(maxsize=None)
+def get_chat_model(model_name: str, temperature: Optional[float] = None) -> "ChatOpenAI":
+    """
+    Returns the shared ChatOpenAI client for the given model and temperature.
+    """
+    factory = _chat_model_factory
+    if factory is None:
+        from langchain_openai import ChatOpenAI
+
+        factory = ChatOpenAI
+
+    return factory(
+        model_name=model_name,
+        temperature=temperature,
+        # Keep token usage on streamed responses
+        stream_usage=True,
+        # The resilience policy retries with its own backoff and deadlines
+        **({"max_retries": 0} if settings.RESILIENCE else {}),
+        rate_limiter=get_rate_limiter(model_name),
+        http_client=get_http_client(),
+        http_async_client=get_http_async_client(),
+    )
+
+
+@lru_cache(maxsize=None)
+def get_structured_model(model_name: str,
+                         temperature: Optional[float],
+                         schema: Type[BaseModel],
+                         method: str = "json_schema",
+                         strict: Optional[bool] = None):
+    """
+    Returns the shared structured-output runnable for the given model, temperature and output schema.
+    The schema is compiled once per key instead of on every call.
+    """
+    return get_chat_model(model_name, temperature).with_structured_output(schema, method=method, strict=strict)
+
+
+@lru_cache(maxsize=None)
+def get_reply_model(model_name: str, temperature: Optional[float] = None):
+    """
+    Returns the shared chat model for user-facing replies, tagged with `REPLY_TAG`. Under `graph.stream` or
+    `graph.astream` with `stream_mode="messages"` its tokens are streamed as they are generated.
+    """
+    return get_chat_model(model_name, temperature).with_config(tags=[REPLY_TAG])
+
+
+def for_chain(chain: str, model_name: str, build: Callable[[str], Any], streaming: bool = False):
+    """
+    Builds the model runnable of a chain with `build(model_name)`. It is named so its usage and cached prompt
+    tokens are reported per chain, and wrapped in the resilience policy, whose fallback is built with `build` too.
+    `streaming` marks the user-facing reply chains, whose tokens must not be duplicated by hedges or retries.
+    """
+    def named(name: str):
+        return build(name).with_config(run_name=chain, metadata={CHAIN_KEY: chain})
+
+    if not settings.RESILIENCE:
+        return named(model_name)
+    return resilient(named(model_name), chain, model_name, named, streaming=streaming)
+
+
+def cached_chain(factory: Callable[[], Any]) -> Callable[[], Any]:
+    """
+    Caches the runnable built by `factory`, per argument when it takes any (e.g. the model name of a tiered chain),
+    and registers it for `warm_up`, which builds it with the default arguments.
+    """
+    cached_factory = lru_cache(maxsize=None)(factory)
+
+    @wraps(factory)
+    def wrapper(*args):
+        return cached_factory(*args)
+
+    wrapper.cache_clear = cached_factory.cache_clear
+    _chain_factories.append(wrapper)
+    return wrapper
+
+
+def warm_up() -> None:
+    """
+    Builds every registered chain so the first turn only pays for the network round trip.
+    """
+    for factory in _chain_factories:
+        factory()
+
+
+def clear_registry() -> None:
+    get_chat_model.cache_clear()
+    get_structured_model.cache_clear()
+    get_reply_model.cache_clear()
+    for factory in _chain_factories:
+        factory.cache_clear()
+
+
+for _model_name, _requests_per_second in _parse_rate_limits(settings.RATE_LIMITS).items():
+    set_rate_limit(_model_name, _requests_per_second)
@@ -1,53 +1,78 @@
-from langchain_core.messages import SystemMessage, HumanMessage
+import logging
+from functools import partial
+
+from langchain_core.messages import SystemMessage
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_openai import ChatOpenAI
-
-
-def provide_related_info(user_input: str):
-
-    print("-- Providing related info --")
-
-    system_message = SystemMessage(
-        """
-        You are a helpful assistant that it's main job is to always redirect the user to the main objective, which is
-        fill the following necessary json fields to create an anime character:
-        
-        <anime-character-fields>
-        - name (string)
-        - age (integer)
-        - gender (string)
-        - physical_appearance (string)
-        - personality (string)
-        - abilities_power (string)
-        - occupation (string)
-        </anime-character-fields>
-        
-        The user reached you because his input was not related with the json fields. 
-        
-        Please redirect the conversation to the main objective, selecting **just one** of the fields to encourage
-        the user to provide you information of the anime character that is looking to build.
-        """
-    )
-
-    human_message = HumanMessage(
-        f"""
-        This is the user input that is not related with your objective:
-        
-        User input: {user_input}
-        
-        Please, kindly redirect him to the main objective, selecting **just one** of the fields to encourage
-        """
-    )
-
-    prompt_components = [system_message, human_message]
-
-    prompt_template = ChatPromptTemplate.from_messages(prompt_components)
-
-    llm = ChatOpenAI(model_name="gpt-4o", temperature=0.5)
-
-    non_field_guidance_chain = prompt_template | llm
-
-    response = non_field_guidance_chain.invoke({"user_input": user_input})
+
+from chains.history_summarizer import summary_context
+from chains.llm import cached_chain, for_chain, get_reply_model
+from chains.tiering import empty_reply, tiered_invoke, atiered_invoke
+from state import ANIME_CHARACTER
+
+
+logger = logging.getLogger(__name__)
+
+
+SYSTEM_MESSAGE = SystemMessage(
+    f"""
+    You are a helpful assistant that it's main job is to always redirect the user to the main objective, which is
+    fill the following necessary json fields to create an anime character:
+    
+    <anime-character-fields>
+    {ANIME_CHARACTER.prompt_fields()}
+    </anime-character-fields>
+    
+    The user reached you because his input was not related with the json fields. 
+    
+    Please redirect the conversation to the main objective, selecting **just one** of the fields to encourage
+    the user to provide you information of the anime character that is looking to build.
+    """
+)
+
+
+PROMPT = ChatPromptTemplate.from_messages([
+    SYSTEM_MESSAGE,
+    ("human", """{history}Please, kindly redirect him to the main objective, selecting **just one** of the fields to encourage.
+
+This is the user input that is not related with your objective:
+
+User input: {user_input}"""),
+])
+
+
+MODEL_NAME = "gpt-4o"
+
+
+@cached_chain
+def _non_field_guidance_llm(model_name: str = MODEL_NAME):
+    return for_chain("non_field_guidance", model_name, partial(get_reply_model, temperature=0.5), streaming=True)
+
+
+def _non_field_guidance_messages(user_input: str, history_summary: str = ""):
+    return PROMPT.format_messages(history=summary_context(history_summary), user_input=user_input)
+
+
+def provide_related_info(user_input: str, history_summary: str = ""):
+
+    logger.debug("-- Providing related info --")
+
+    messages = _non_field_guidance_messages(user_input, history_summary)
+
+    response = tiered_invoke("non_field_guidance", MODEL_NAME,
+                             lambda model_name: _non_field_guidance_llm(model_name).invoke(messages), empty_reply)
+
+    return response
+
+
+async def aprovide_related_info(user_input: str, history_summary: str = ""):
+
+    logger.debug("-- Providing related info --")
+
+    messages = _non_field_guidance_messages(user_input, history_summary)
+
+    response = await atiered_invoke("non_field_guidance", MODEL_NAME,
+                                    lambda model_name: _non_field_guidance_llm(model_name).ainvoke(messages),
+                                    empty_reply)
 
     return response
 
@@ -1,23 +1,14 @@
+from functools import partial
 from typing import Optional, Dict, Any, List
 from pydantic import BaseModel, Field
-from langchain_openai import ChatOpenAI
-from langchain_core.messages import SystemMessage, HumanMessage
+from langchain_core.messages import SystemMessage
 from langchain_core.prompts import ChatPromptTemplate
 
+from chains.cache import cached_invoke, acached_invoke
+from chains.llm import cached_chain, for_chain, get_structured_model
+from chains.tiering import tiered_invoke, atiered_invoke
+from state import AnimeCharacter
 
-class AnimeCharacter(BaseModel):
-    """Represents an anime character."""
-    name: Optional[str] = Field(None, description="Name of the character")
-    age: Optional[int] = Field(None, description="Age of the character")
-    gender: Optional[str] = Field(None, description="Gender of the character")
-    physical_appearance: Optional[str] = Field(None, description="Physical appearance of the character")
-    personality: Optional[str] = Field(None, description="Personality of the character")
-    abilities_power: Optional[str] = Field(None, description="Abilities or power of the character")
-    occupation: Optional[str] = Field(None, description="Occupation of the character")
-
-
-from typing import Optional, Dict, Any, List
-from pydantic import BaseModel, Field
 
 class ReflectionFeedback(BaseModel):
     """
@@ -77,71 +68,120 @@ class ReflectionFeedback(BaseModel):
     )
 
 
-def reflect_on_extraction(user_input: str, extracted_character: AnimeCharacter) -> ReflectionFeedback:
+SYSTEM_MESSAGE = SystemMessage(
+    """You are a strict fact-checking assistant. You have two inputs:
+    1. The original user input describing an anime character.
+    2. The extracted fields from a previous step.
+    
+    Rule: The user input doesn't have to contain all the fields, we're just checking the fields that the user input
+    and extracted character provides, ignoring Nones, null, and empty values if not mentioned in the user input.
+
+    Your categories:
+    - flags: Internal pipeline issues or severe logical errors that can't be resolved from current data or user clarification. 
+             The system must fix these before proceeding.
+    - ask_user_about: Contradictions or ambiguities in the user input that can only be resolved by asking the user.
+    Never add here fields that the user do not mention. 
+    - suggested_corrections: Discrepancies that can be confidently fixed based on the user input. 
+    - notes: Minor suggestions or improvements that do not block progress.
+    - confirmations: Fields that are correct as is.
+
+    If a field is not mentioned, it remains None without suggested corrections.
+    If a field can be corrected from user input, add to suggested_corrections.
+    If user input is contradictory or unclear for a field, add that field to ask_user_about.
+    If there is a serious logical/pipeline error, add a flag.
+    Non-blocking advice goes in notes.
+    Fields correct as-is go in confirmations.
+
+    Output only JSON:
+    {
+      "correctness_summary": "...",
+      "flags": [...],
+      "notes": [...],
+      "confirmations": [...],
+      "suggested_corrections": {...},
+      "ask_user_about": [...]
+    }
+    """
+)
+
+
+PROMPT = ChatPromptTemplate.from_messages([
+    SYSTEM_MESSAGE,
+    ("human", """Please verify the correctness of these fields based on the user input.
+
+User Input: {user_input}
+
+Extracted Fields: {extracted_fields}"""),
+])
+
+
+MODEL_NAME = "gpt-4o"
+TEMPERATURE = 0
+
+
+@cached_chain
+def _reflection_llm(model_name: str = MODEL_NAME):
+    return for_chain("reflection_mapper", model_name,
+                     partial(get_structured_model, temperature=TEMPERATURE, schema=ReflectionFeedback,
+                             method="json_mode"))
+
+
+def _reflection_messages(user_input: str, extracted_character: AnimeCharacter, fields: Optional[List[str]] = None):
+    # Restricting to `fields` sends only the fields that changed this turn
+    include = set(fields) if fields is not None else None
+
+    return PROMPT.format_messages(user_input=user_input,
+                                  extracted_fields=extracted_character.model_dump_json(include=include))
+
+
+def uncertain_reflection(reflection: ReflectionFeedback) -> Optional[str]:
+    """
+    Reason to distrust the reflection, or the extraction it checked: flags and questions for the user from a cheaper
+    model are confirmed by the next tier, and an extraction they point at is re-run on the top tier.
+    """
+    if reflection.flags:
+        return "reflection flags"
+    if reflection.ask_user_about:
+        return "ask_user_about entries"
+    return None
+
+
+def reflect_on_extraction(user_input: str,
+                          extracted_character: AnimeCharacter,
+                          fields: Optional[List[str]] = None) -> ReflectionFeedback:
     """
     Given the user input and the extracted AnimeCharacter fields, perform a reflection step.
     The reflection checks for internal consistency, whether fields were correctly extracted,
     and provides a summary along with possible corrections.
+
+    When `fields` is given, only those fields are checked. With model tiering, reflections with flags or
+    `ask_user_about` entries are escalated to the next model tier.
     """
 
-    system_prompt = SystemMessage(
-        """You are a strict fact-checking assistant. You have two inputs:
-        1. The original user input describing an anime character.
-        2. The extracted fields from a previous step.
-        
-        Rule: The user input doesn't have to contain all the fields, we're just checking the fields that the user input
-        and extracted character provides, ignoring Nones, null, and empty values if not mentioned in the user input.
-
-        Your categories:
-        - flags: Internal pipeline issues or severe logical errors that can't be resolved from current data or user clarification. 
-                 The system must fix these before proceeding.
-        - ask_user_about: Contradictions or ambiguities in the user input that can only be resolved by asking the user.
-        Never add here fields that the user do not mention. 
-        - suggested_corrections: Discrepancies that can be confidently fixed based on the user input. 
-        - notes: Minor suggestions or improvements that do not block progress.
-        - confirmations: Fields that are correct as is.
-
-        If a field is not mentioned, it remains None without suggested corrections.
-        If a field can be corrected from user input, add to suggested_corrections.
-        If user input is contradictory or unclear for a field, add that field to ask_user_about.
-        If there is a serious logical/pipeline error, add a flag.
-        Non-blocking advice goes in notes.
-        Fields correct as-is go in confirmations.
-
-        Output only JSON:
-        {
-          "correctness_summary": "...",
-          "flags": [...],
-          "notes": [...],
-          "confirmations": [...],
-          "suggested_corrections": {...},
-          "ask_user_about": [...]
-        }
-        """
+    messages = _reflection_messages(user_input, extracted_character, fields)
+    return tiered_invoke(
+        "reflection_mapper", MODEL_NAME,
+        lambda model_name: cached_invoke(_reflection_llm(model_name), messages, model_name=model_name,
+                                         temperature=TEMPERATURE, schema=ReflectionFeedback, normalize=False),
+        uncertain_reflection
     )
 
-    human_prompt = HumanMessage(
-        f"""User Input: {user_input}
 
-Extracted Fields: {extracted_character.model_dump_json()}
-
-Please verify the correctness of these fields based on the user input."""
-    )
-
-    prompt_template = ChatPromptTemplate.from_messages([system_prompt, human_prompt])
+async def areflect_on_extraction(user_input: str,
+                                 extracted_character: AnimeCharacter,
+                                 fields: Optional[List[str]] = None) -> ReflectionFeedback:
+    """
+    Async counterpart of `reflect_on_extraction`.
+    """
 
-    llm = ChatOpenAI(model_name="gpt-4o", temperature=0).with_structured_output(
-        ReflectionFeedback,
-        method="json_mode",
+    messages = _reflection_messages(user_input, extracted_character, fields)
+    return await atiered_invoke(
+        "reflection_mapper", MODEL_NAME,
+        lambda model_name: acached_invoke(_reflection_llm(model_name), messages, model_name=model_name,
+                                          temperature=TEMPERATURE, schema=ReflectionFeedback, normalize=False),
+        uncertain_reflection
     )
 
-    reflection_chain = prompt_template | llm
-
-    # Invoke the reflection chain with the provided data
-    reflection_result = reflection_chain.invoke(
-        {"user_input": user_input, "extracted_character": extracted_character.model_dump()})
-    return reflection_result
-
 
 # Example usage of model_dump and model_dump_json:
 if __name__ == "__main__":
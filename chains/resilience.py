@@ -0,0 +1,437 @@
+"""
+Resilience policy wrapped around the model runnable of every chain (see `chains.llm.for_chain`):
+
+- a deadline per chain call, covering its retries and fallback, and a shorter timeout per attempt, so a stalled
+  primary model still leaves the fallback time to answer;
+- an optional hedged second request once a call is slower than a percentile of the chain's recent latencies;
+- bounded retries with jittered exponential backoff on transient provider errors;
+- a circuit breaker per model, which stops sending requests to a failing model for a while;
+- a fallback model, used when the primary model keeps failing or its breaker is open.
+
+Every event is counted in the metrics of the running node.
+"""
+import asyncio
+import contextvars
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import lru_cache
+from typing import Any, Callable, Deque, Dict, Optional, Tuple, Type
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.runnables import RunnableLambda
+from langchain_core.runnables.config import merge_configs
+
+import settings
+from instrumentation.metrics import current_recorder
+
+
+@lru_cache(maxsize=None)
+def retryable_errors() -> Tuple[Type[BaseException], ...]:
+    """
+    Provider errors worth retrying; anything else (e.g. schema validation) is raised right away. The openai SDK
+    is only imported once a call fails.
+    """
+    import openai
+
+    return TimeoutError, openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError
+
+
+class CircuitOpenError(RuntimeError):
+    """
+    Raised when every model of a chain is behind an open circuit breaker.
+    """
+
+
+def _parse_pairs(value: str) -> Dict[str, str]:
+    # "gpt-4o=gpt-4o-mini,classifier=5" -> {"gpt-4o": "gpt-4o-mini", "classifier": "5"}
+    pairs = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        key, _, pair_value = item.partition("=")
+        pairs[key.strip()] = pair_value.strip()
+    return pairs
+
+
+_deadlines = {chain: float(seconds) for chain, seconds in _parse_pairs(settings.CHAIN_DEADLINES).items()}
+_fallback_models = _parse_pairs(settings.FALLBACK_MODELS)
+
+
+def chain_deadline(chain: str) -> Optional[float]:
+    seconds = _deadlines.get(chain, settings.CHAIN_DEADLINE)
+    return seconds if seconds > 0 else None
+
+
+def fallback_model(model_name: str) -> Optional[str]:
+    fallback = _fallback_models.get(model_name)
+    return fallback if fallback and fallback != model_name else None
+
+
+class CircuitBreaker:
+    """
+    Opens after `failures` consecutive failures and rejects calls for `reset_seconds`. After that, one trial call
+    is let through (half-open): a success closes the breaker, a failure opens it again.
+    """
+
+    def __init__(self, failures: int, reset_seconds: float):
+        self.failures = failures
+        self.reset_seconds = reset_seconds
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.reset_seconds or self._trial_running:
+                return False
+            self._trial_running = True
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.consecutive_failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_failure(self) -> bool:
+        """
+        Returns True when this failure opened the breaker.
+        """
+        with self._lock:
+            self.consecutive_failures += 1
+            was_open = self.opened_at is not None
+            if was_open or self.consecutive_failures >= self.failures:
+                self.opened_at = time.monotonic()
+            self._trial_running = False
+            return not was_open and self.opened_at is not None
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(model_name: str) -> CircuitBreaker:
+    with _breakers_lock:
+        if model_name not in _breakers:
+            _breakers[model_name] = CircuitBreaker(settings.CIRCUIT_BREAKER_FAILURES,
+                                                   settings.CIRCUIT_BREAKER_RESET_SECONDS)
+        return _breakers[model_name]
+
+
+# Chain -> latencies of its last successful calls, used to pick the hedging delay
+_latencies: Dict[str, Deque[float]] = {}
+LATENCY_WINDOW = 200
+
+
+def _record_latency(chain: str, seconds: float) -> None:
+    _latencies.setdefault(chain, deque(maxlen=LATENCY_WINDOW)).append(seconds)
+
+
+def hedge_delay(chain: str) -> Optional[float]:
+    """
+    Seconds after which a second request is sent, or None when hedging is off or there are too few samples.
+    """
+    samples = _latencies.get(chain)
+    if not settings.HEDGE_PERCENTILE or not samples or len(samples) < settings.HEDGE_MIN_SAMPLES:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * settings.HEDGE_PERCENTILE / 100))]
+
+
+def _backoff(attempt: int) -> float:
+    # Full jitter: a random wait up to the exponential backoff, so retrying clients do not synchronize
+    return random.uniform(0, settings.LLM_RETRY_BACKOFF * 2 ** (attempt - 1))
+
+
+def _event(event: str) -> None:
+    recorder = current_recorder()
+    if recorder is not None:
+        recorder.record_event(event)
+
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.RESILIENCE_MAX_WORKERS,
+                                       thread_name_prefix="configpilot-llm")
+    return _executor
+
+
+def _submit(runnable, input: Any, config):
+    # The attempt runs in the caller's context, so metrics and callback hooks keep reporting to the node
+    return _get_executor().submit(contextvars.copy_context().run, runnable.invoke, input, config)
+
+
+def _remaining(deadline: Optional[float]) -> Optional[float]:
+    if deadline is None:
+        return None
+    return max(0.0, deadline - time.monotonic())
+
+
+class _TokenWatch(BaseCallbackHandler):
+    """
+    Notes whether an attempt of a streaming chain has emitted tokens, after which it can no longer be hedged,
+    retried or replaced by the fallback without repeating output the user has already seen.
+    """
+    run_inline = True
+
+    def __init__(self):
+        self.streamed = False
+
+    def on_llm_new_token(self, token: str, **kwargs: Any) -> None:
+        self.streamed = True
+
+
+def _watched(config, watch: Optional[_TokenWatch]):
+    return merge_configs(config, {"callbacks": [watch]}) if watch is not None else config
+
+
+def _timed_out(deadline: Optional[float], watch: Optional[_TokenWatch]) -> bool:
+    # A streaming reply only has to start within its attempt timeout; once it has, it runs up to the chain deadline
+    return watch is None or not watch.streamed or _remaining(deadline) == 0
+
+
+def _attempt(chain: str, runnable, input: Any, config, timeout_at: Optional[float],
+             watch: Optional[_TokenWatch]) -> Any:
+    start = time.monotonic()
+    delay = hedge_delay(chain) if watch is None else None
+    config = _watched(config, watch)
+
+    # An abandoned thread keeps calling the caller's callbacks, so a streaming attempt given up for the fallback
+    # would stream its late tokens next to the fallback's reply. Streaming attempts run inline instead, bounded only
+    # by the client's own timeouts
+    if (timeout_at is None or watch is not None) and delay is None:
+        result = runnable.invoke(input, config)
+        _record_latency(chain, time.monotonic() - start)
+        return result
+
+    primary = _submit(runnable, input, config)
+    pending = {primary}
+
+    if delay is not None:
+        remaining = _remaining(timeout_at)
+        if remaining is None or delay < remaining:
+            wait(pending, timeout=delay)
+            if not primary.done():
+                _event("hedge")
+                pending.add(_submit(runnable, input, config))
+
+    error = None
+    while pending:
+        done, pending = wait(pending, timeout=_remaining(timeout_at), return_when=FIRST_COMPLETED)
+        if not done:
+            break
+        for future in done:
+            if future.exception() is None:
+                if future is not primary:
+                    _event("hedge_win")
+                _record_latency(chain, time.monotonic() - start)
+                return future.result()
+            error = future.exception()
+
+    if error is not None and not pending:
+        raise error
+    # Threads cannot be interrupted; a timed-out request finishes in the background, still reporting to the
+    # callbacks, and its result is dropped
+    _event("timeout")
+    raise TimeoutError(f"{chain} attempt timed out")
+
+
+async def _aattempt(chain: str, runnable, input: Any, config, timeout_at: Optional[float],
+                    deadline: Optional[float], watch: Optional[_TokenWatch]) -> Any:
+    start = time.monotonic()
+    delay = hedge_delay(chain) if watch is None else None
+    config = _watched(config, watch)
+
+    if timeout_at is None and delay is None:
+        result = await runnable.ainvoke(input, config)
+        _record_latency(chain, time.monotonic() - start)
+        return result
+
+    primary = asyncio.ensure_future(runnable.ainvoke(input, config))
+    pending = {primary}
+
+    try:
+        if delay is not None:
+            remaining = _remaining(timeout_at)
+            if remaining is None or delay < remaining:
+                await asyncio.wait(pending, timeout=delay)
+                if not primary.done():
+                    _event("hedge")
+                    pending.add(asyncio.ensure_future(runnable.ainvoke(input, config)))
+
+        error = None
+        while pending:
+            limit = deadline if watch is not None and watch.streamed else timeout_at
+            done, pending = await asyncio.wait(pending, timeout=_remaining(limit),
+                                               return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                if _timed_out(deadline, watch):
+                    break
+                continue
+            for task in done:
+                if task.exception() is None:
+                    if task is not primary:
+                        _event("hedge_win")
+                    _record_latency(chain, time.monotonic() - start)
+                    return task.result()
+                error = task.exception()
+
+        if error is not None and not pending:
+            raise error
+        _event("timeout")
+        raise TimeoutError(f"{chain} attempt timed out")
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+def _candidates(model_name: str, runnable, build_fallback: Optional[Callable[[str], Any]]):
+    yield model_name, runnable
+    fallback = fallback_model(model_name) if build_fallback is not None else None
+    if fallback is not None:
+        yield fallback, build_fallback(fallback)
+
+
+def _failed(model_name: str, breaker: CircuitBreaker) -> None:
+    if breaker.record_failure():
+        _event("breaker_opened")
+
+
+class _Budget:
+    """
+    Time limits of one chain call. Each attempt may use `CHAIN_ATTEMPT_SHARE` of the chain's deadline; when a
+    fallback model follows, the primary model's attempts stop at that share too, so the fallback keeps the rest.
+    """
+
+    def __init__(self, chain: str, has_fallback: bool):
+        seconds = chain_deadline(chain)
+        now = time.monotonic()
+        self.attempt_seconds = seconds * settings.CHAIN_ATTEMPT_SHARE if seconds else None
+        self.deadline = now + seconds if seconds else None
+        self.primary_deadline = now + self.attempt_seconds if seconds and has_fallback else self.deadline
+
+    def candidate_deadline(self, index: int) -> Optional[float]:
+        return self.primary_deadline if index == 0 else self.deadline
+
+    def attempt_deadline(self, candidate_deadline: Optional[float]) -> Optional[float]:
+        if self.attempt_seconds is None:
+            return None
+        return min(time.monotonic() + self.attempt_seconds, candidate_deadline)
+
+    def backoff(self, attempt: int, candidate_deadline: Optional[float]) -> float:
+        backoff = _backoff(attempt)
+        return min(backoff, _remaining(candidate_deadline)) if candidate_deadline is not None else backoff
+
+
+def resilient(runnable, chain: str, model_name: str, build_fallback: Optional[Callable[[str], Any]] = None,
+              streaming: bool = False):
+    """
+    Wraps the model runnable of `chain` in the resilience policy. `build_fallback(model_name)` builds the same
+    chain model for the fallback model. A `streaming` chain streams its tokens to the user, so it is never hedged,
+    and an attempt that has emitted tokens is neither timed out before the chain deadline nor retried. Under
+    `ainvoke` a streaming attempt that times out before its first token is cancelled; under `invoke` it cannot be,
+    so there it runs without the attempt timeout rather than stream alongside the fallback.
+    """
+    has_fallback = build_fallback is not None and fallback_model(model_name) is not None
+
+    def give_up(error: BaseException, watch: Optional[_TokenWatch], budget: _Budget,
+                candidate_deadline: Optional[float], index: int) -> str:
+        # What a failed attempt leads to: "raise", "fallback" (the next model) or "retry" (the same model)
+        if watch is not None and watch.streamed:
+            return "raise"
+        if budget.deadline is not None and time.monotonic() >= budget.deadline:
+            return "raise"
+        if candidate_deadline is not None and time.monotonic() >= candidate_deadline:
+            return "fallback"
+        # A model that timed out is likely to stall again, so a timeout goes straight to the fallback
+        if isinstance(error, TimeoutError) and index == 0 and has_fallback:
+            return "fallback"
+        return "retry"
+
+    def invoke(input: Any, config=None) -> Any:
+        budget = _Budget(chain, has_fallback)
+        last_error: Optional[BaseException] = None
+
+        for index, (candidate, candidate_runnable) in enumerate(_candidates(model_name, runnable, build_fallback)):
+            breaker = get_circuit_breaker(candidate)
+            if not breaker.allow():
+                _event("breaker_rejected")
+                continue
+            if index:
+                _event("fallback")
+            candidate_deadline = budget.candidate_deadline(index)
+
+            for attempt in range(settings.LLM_RETRIES + 1):
+                if attempt:
+                    _event("retry")
+                    time.sleep(budget.backoff(attempt, candidate_deadline))
+                watch = _TokenWatch() if streaming else None
+                try:
+                    result = _attempt(chain, candidate_runnable, input, config,
+                                      budget.attempt_deadline(candidate_deadline), watch)
+                except retryable_errors() as e:
+                    last_error = e
+                    _failed(candidate, breaker)
+                    outcome = give_up(e, watch, budget, candidate_deadline, index)
+                    if outcome == "raise":
+                        raise
+                    if outcome == "fallback" or not breaker.allow():
+                        break
+                    continue
+                except Exception:
+                    # The model answered, e.g. with output that does not validate, so it counts as reachable
+                    breaker.record_success()
+                    raise
+                breaker.record_success()
+                return result
+
+        raise last_error or CircuitOpenError(f"Every model of {chain} is behind an open circuit breaker")
+
+    async def ainvoke(input: Any, config=None) -> Any:
+        budget = _Budget(chain, has_fallback)
+        last_error: Optional[BaseException] = None
+
+        for index, (candidate, candidate_runnable) in enumerate(_candidates(model_name, runnable, build_fallback)):
+            breaker = get_circuit_breaker(candidate)
+            if not breaker.allow():
+                _event("breaker_rejected")
+                continue
+            if index:
+                _event("fallback")
+            candidate_deadline = budget.candidate_deadline(index)
+
+            for attempt in range(settings.LLM_RETRIES + 1):
+                if attempt:
+                    _event("retry")
+                    await asyncio.sleep(budget.backoff(attempt, candidate_deadline))
+                watch = _TokenWatch() if streaming else None
+                try:
+                    result = await _aattempt(chain, candidate_runnable, input, config,
+                                             budget.attempt_deadline(candidate_deadline), budget.deadline, watch)
+                except retryable_errors() as e:
+                    last_error = e
+                    _failed(candidate, breaker)
+                    outcome = give_up(e, watch, budget, candidate_deadline, index)
+                    if outcome == "raise":
+                        raise
+                    if outcome == "fallback" or not breaker.allow():
+                        break
+                    continue
+                except Exception:
+                    # The model answered, e.g. with output that does not validate, so it counts as reachable
+                    breaker.record_success()
+                    raise
+                breaker.record_success()
+                return result
+
+        raise last_error or CircuitOpenError(f"Every model of {chain} is behind an open circuit breaker")
+
+    return RunnableLambda(invoke, afunc=ainvoke, name=f"{chain}_resilient")
@@ -0,0 +1,259 @@
+"""
+Model tiering: a chain listed in the tier table runs on its cheapest model first and is escalated to the next tier
+only when the result cannot be trusted (schema-validation failure, or a chain-specific low-confidence check). A result
+found unreliable further down the graph, e.g. an extraction the reflection flags, is re-run on the top tier with
+`escalated_invoke`.
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Iterator, Optional, Tuple
+
+from langchain_core.callbacks import UsageMetadataCallbackHandler
+from langchain_core.exceptions import OutputParserException
+from langchain_core.tracers.context import register_configure_hook
+from pydantic import ValidationError
+
+import settings
+from instrumentation.metrics import current_recorder
+from instrumentation.usage import BUDGET_OK, current_budget_level
+
+
+logger = logging.getLogger(__name__)
+
+# Failures that mean the model could not produce the schema, which a stronger model usually can
+ESCALATION_ERRORS = (ValidationError, OutputParserException)
+
+
+def _parse_model_tiers(value: str) -> Dict[str, Tuple[str, ...]]:
+    # "field_mapper=gpt-4o-mini>gpt-4o,creator_assistant=gpt-4o-mini>gpt-4o" -> {"field_mapper": ("gpt-4o-mini",
+    # "gpt-4o"), ...}
+    tiers = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        chain, _, models = item.partition("=")
+        tiers[chain.strip()] = tuple(model.strip() for model in models.split(">") if model.strip())
+    return tiers
+
+
+_tier_table: Dict[str, Tuple[str, ...]] = _parse_model_tiers(settings.MODEL_TIERS)
+
+
+def set_model_tiers(chain: str, *models: str) -> None:
+    """
+    Sets the models tried by `chain`, cheapest first. Without models, the chain goes back to its own model.
+    """
+    if models:
+        _tier_table[chain] = tuple(models)
+    else:
+        _tier_table.pop(chain, None)
+
+
+def model_tiers(chain: str, default_model: str) -> Tuple[str, ...]:
+    # Past the economy threshold of a budget, every tiered chain runs on the economy model only
+    if current_budget_level() != BUDGET_OK:
+        return (settings.BUDGET_ECONOMY_MODEL,)
+    if not settings.MODEL_TIERING:
+        return (default_model,)
+    return _tier_table.get(chain) or (default_model,)
+
+
+class TierStats:
+    """
+    Per chain and model: attempts, escalations, errors, wall time and token usage.
+    """
+
+    def __init__(self):
+        self.chains: Dict[str, Dict[str, Dict[str, float]]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, chain: str, model_name: str, seconds: float, usage: Dict[str, Any], escalated: bool,
+               error: bool) -> None:
+        with self._lock:
+            tier = self.chains.setdefault(chain, {}).setdefault(model_name, {
+                "calls": 0, "escalations": 0, "errors": 0, "seconds": 0.0, "input_tokens": 0, "output_tokens": 0
+            })
+            tier["calls"] += 1
+            tier["escalations"] += int(escalated)
+            tier["errors"] += int(error)
+            tier["seconds"] += seconds
+            for model_usage in usage.values():
+                tier["input_tokens"] += model_usage.get("input_tokens", 0)
+                tier["output_tokens"] += model_usage.get("output_tokens", 0)
+
+    def record_escalation(self, chain: str, model_name: str) -> None:
+        # An escalation decided after the call was recorded
+        with self._lock:
+            tier = self.chains.get(chain, {}).get(model_name)
+            if tier is not None:
+                tier["escalations"] += 1
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            report = {}
+            for chain, tiers in sorted(self.chains.items()):
+                calls = sum(tier["calls"] for tier in tiers.values())
+                escalations = sum(tier["escalations"] for tier in tiers.values())
+                report[chain] = {
+                    "escalation_rate": round(escalations / calls, 3) if calls else 0.0,
+                    "tiers": {
+                        model_name: {
+                            **tier,
+                            "mean_latency_ms": round(tier["seconds"] * 1000 / tier["calls"], 3),
+                            "escalation_rate": round(tier["escalations"] / tier["calls"], 3),
+                        }
+                        for model_name, tier in tiers.items()
+                    },
+                }
+            return report
+
+    def reset(self) -> None:
+        with self._lock:
+            self.chains.clear()
+
+
+tier_stats = TierStats()
+
+# `get_usage_metadata_callback` registers a new configure hook on every use, so the attempts share this one
+_attempt_usage: ContextVar[Optional[UsageMetadataCallbackHandler]] = ContextVar("configpilot_tier_usage",
+                                                                                 default=None)
+register_configure_hook(_attempt_usage, inheritable=True)
+
+
+@contextmanager
+def _usage() -> Iterator[UsageMetadataCallbackHandler]:
+    handler = UsageMetadataCallbackHandler()
+    token = _attempt_usage.set(handler)
+    try:
+        yield handler
+    finally:
+        _attempt_usage.reset(token)
+
+
+def empty_reply(response) -> Optional[str]:
+    """
+    `low_confidence` check of the free-text reply chains.
+    """
+    return None if str(response.content).strip() else "empty reply"
+
+
+def _escalate(chain: str, model_name: str, reason: str) -> None:
+    logger.debug("Escalating %s from %s: %s", chain, model_name, reason)
+    recorder = current_recorder()
+    if recorder is not None:
+        recorder.record_escalation()
+
+
+def tiered_invoke(chain: str,
+                  default_model: str,
+                  call: Callable[[str], Any],
+                  low_confidence: Optional[Callable[[Any], Optional[str]]] = None) -> Any:
+    """
+    Runs `call(model_name)` on each tier of `chain` until a result is accepted. `low_confidence` returns the
+    reason to escalate a result, or None to keep it. The last tier's result is always kept.
+    """
+    tiers = model_tiers(chain, default_model)
+
+    for index, model_name in enumerate(tiers):
+        last_tier = index == len(tiers) - 1
+        start = time.perf_counter()
+
+        with _usage() as usage:
+            try:
+                result = call(model_name)
+            except ESCALATION_ERRORS as e:
+                tier_stats.record(chain, model_name, time.perf_counter() - start, usage.usage_metadata,
+                                  escalated=not last_tier, error=True)
+                if last_tier:
+                    raise
+                _escalate(chain, model_name, f"{type(e).__name__}: {e}")
+                continue
+
+        reason = None if last_tier or low_confidence is None else low_confidence(result)
+        tier_stats.record(chain, model_name, time.perf_counter() - start, usage.usage_metadata,
+                          escalated=reason is not None, error=False)
+        if reason is None:
+            return result
+        _escalate(chain, model_name, reason)
+
+
+async def atiered_invoke(chain: str,
+                         default_model: str,
+                         call: Callable[[str], Awaitable[Any]],
+                         low_confidence: Optional[Callable[[Any], Optional[str]]] = None) -> Any:
+    tiers = model_tiers(chain, default_model)
+
+    for index, model_name in enumerate(tiers):
+        last_tier = index == len(tiers) - 1
+        start = time.perf_counter()
+
+        with _usage() as usage:
+            try:
+                result = await call(model_name)
+            except ESCALATION_ERRORS as e:
+                tier_stats.record(chain, model_name, time.perf_counter() - start, usage.usage_metadata,
+                                  escalated=not last_tier, error=True)
+                if last_tier:
+                    raise
+                _escalate(chain, model_name, f"{type(e).__name__}: {e}")
+                continue
+
+        reason = None if last_tier or low_confidence is None else low_confidence(result)
+        tier_stats.record(chain, model_name, time.perf_counter() - start, usage.usage_metadata,
+                          escalated=reason is not None, error=False)
+        if reason is None:
+            return result
+        _escalate(chain, model_name, reason)
+
+
+def _top_tier(chain: str, default_model: str, from_model: str, reason: str) -> Optional[str]:
+    # Only a result from a lower tier of the current tier list is escalated, e.g. not one from the top tier or the
+    # economy model
+    tiers = model_tiers(chain, default_model)
+    if from_model not in tiers[:-1]:
+        return None
+    tier_stats.record_escalation(chain, from_model)
+    _escalate(chain, from_model, reason)
+    return tiers[-1]
+
+
+def escalated_invoke(chain: str, default_model: str, from_model: str, call: Callable[[str], Any],
+                     reason: str) -> Optional[Any]:
+    """
+    Re-runs `call(model_name)` on the top tier of `chain`, for a result of the lower tier `from_model` found
+    unreliable after the fact. Returns None when `from_model` is not a lower tier or the top tier fails to produce
+    the schema.
+    """
+    model_name = _top_tier(chain, default_model, from_model, reason)
+    if model_name is None:
+        return None
+
+    start = time.perf_counter()
+    with _usage() as usage:
+        try:
+            result = call(model_name)
+        except ESCALATION_ERRORS:
+            logger.warning("Escalated %s call on %s failed", chain, model_name, exc_info=True)
+            result = None
+    tier_stats.record(chain, model_name, time.perf_counter() - start, usage.usage_metadata, escalated=False,
+                      error=result is None)
+    return result
+
+
+async def aescalated_invoke(chain: str, default_model: str, from_model: str, call: Callable[[str], Awaitable[Any]],
+                            reason: str) -> Optional[Any]:
+    model_name = _top_tier(chain, default_model, from_model, reason)
+    if model_name is None:
+        return None
+
+    start = time.perf_counter()
+    with _usage() as usage:
+        try:
+            result = await call(model_name)
+        except ESCALATION_ERRORS:
+            logger.warning("Escalated %s call on %s failed", chain, model_name, exc_info=True)
+            result = None
+    tier_stats.record(chain, model_name, time.perf_counter() - start, usage.usage_metadata, escalated=False,
+                      error=result is None)
+    return result
@@ -0,0 +1,148 @@
+import logging
+from functools import partial
+from typing import Literal, Any
+
+from langchain_core.messages import SystemMessage
+from langchain_core.prompts import ChatPromptTemplate
+from pydantic import BaseModel, Field
+
+from chains.cache import cached_invoke, acached_invoke
+from chains.llm import cached_chain, for_chain, get_structured_model
+from state import ANIME_CHARACTER, AnimeCharacter
+
+
+logger = logging.getLogger(__name__)
+
+
+class Triage(BaseModel):
+    """
+    Combined decision of the classifier and the relevance reflector for a single user input.
+
+    Attributes:
+        related_with_fields: If the user input provides attribute values for the json fields or not.
+        input_type: Nature of the user input: ambiguous, misleading, or stable.
+        reasoning: Explanation of the input type and its validity or not.
+    """
+    related_with_fields: Literal[True, False] = Field(
+        description="If the user input provides attribute values for the json fields or not"
+    )
+    input_type: Literal["ambiguous", "misleading", "stable"] = Field(
+        description="Indicates the nature of the user input, either ambiguous, misleading, or stable."
+    )
+    reasoning: str = Field(
+        description="Explanation of the input type and its validity or not."
+    )
+
+
+class TriageWithFields(Triage):
+    """
+    Triage decision that also carries the fields extracted from the user input.
+    """
+    extracted_fields: AnimeCharacter = Field(
+        description="Attributes extracted from the user input, null when not mentioned."
+    )
+
+
+SYSTEM_MESSAGE = SystemMessage(
+    f"""You are the triage step of an assistant that helps users fill the following anime-character JSON fields:
+
+    {ANIME_CHARACTER.prompt_fields()}
+
+    For every user input you make two decisions at once.
+
+    1. related_with_fields: respond `True` if the input provides actual attribute values for any of the fields, or
+    `False` for questions, requests for guidance, or unrelated content.
+
+    2. input_type, considering **only** the fields the input explicitly mentions:
+    - **stable**: the input mentions at least one field and gives clear and sufficient detail for it.
+    - **misleading**: the input contains contradictions or inaccuracies within the mentioned fields.
+    - **ambiguous**: the input mentions no field, or mentions a field without enough detail.
+    Do not consider the absence of other fields, and never assume information about fields not mentioned.
+
+    Give a brief reasoning (1-2 sentences) based solely on the provided information.
+
+    If an `extracted_fields` object is requested, map the attributes of the input into it, leaving fields that are not
+    mentioned as null and interpreting implicit descriptions reasonably ("a 3-year-old boy" is age 3, gender "male").
+
+    **Examples:**
+
+    - **Input:** "el personaje se llama brais"
+      - related_with_fields: `True`, input_type: stable
+
+    - **Input:** "el personaje es increíblemente fuerte pero no tiene ningún poder"
+      - related_with_fields: `True`, input_type: misleading
+
+    - **Input:** "el personaje se llama"
+      - related_with_fields: `True`, input_type: ambiguous
+
+    - **Input:** "I need help coming up with a name."
+      - related_with_fields: `False`, input_type: ambiguous
+    """
+)
+
+
+PROMPT = ChatPromptTemplate.from_messages([
+    SYSTEM_MESSAGE,
+    ("human", """Triage the following user input for the anime character profile.
+
+User Input: {user_input}"""),
+])
+
+
+MODEL_NAME = "gpt-4o-mini"
+# Extraction keeps the same model as the field mapper
+EXTRACTION_MODEL_NAME = "gpt-4o"
+TEMPERATURE = 0
+
+
+@cached_chain
+def _triage_llm():
+    return for_chain("triage", MODEL_NAME,
+                     partial(get_structured_model, temperature=TEMPERATURE, schema=Triage, method="json_schema",
+                             strict=True))
+
+
+@cached_chain
+def _triage_with_fields_llm():
+    return for_chain("triage", EXTRACTION_MODEL_NAME,
+                     partial(get_structured_model, temperature=TEMPERATURE, schema=TriageWithFields,
+                             method="json_schema", strict=True))
+
+
+def _triage_messages(user_input):
+    return PROMPT.format_messages(user_input=user_input)
+
+
+def triage_input(user_input, extract_fields: bool = False) -> Any:
+    """
+    Classifies the user input and assesses its consistency in a single structured-output call, optionally
+    extracting the fields as well.
+    """
+
+    logger.debug("-- TRIAGE INPUT --")
+
+    if extract_fields:
+        return cached_invoke(_triage_with_fields_llm(), _triage_messages(user_input),
+                             model_name=EXTRACTION_MODEL_NAME, temperature=TEMPERATURE, schema=TriageWithFields,
+                             normalize=False)
+
+    return cached_invoke(_triage_llm(), _triage_messages(user_input),
+                         model_name=MODEL_NAME, temperature=TEMPERATURE, schema=Triage)
+
+
+async def atriage_input(user_input, extract_fields: bool = False) -> Any:
+
+    logger.debug("-- TRIAGE INPUT --")
+
+    if extract_fields:
+        return await acached_invoke(_triage_with_fields_llm(), _triage_messages(user_input),
+                                    model_name=EXTRACTION_MODEL_NAME, temperature=TEMPERATURE, schema=TriageWithFields,
+                                    normalize=False)
+
+    return await acached_invoke(_triage_llm(), _triage_messages(user_input),
+                                model_name=MODEL_NAME, temperature=TEMPERATURE, schema=Triage)
+
+
+if __name__ == "__main__":
+    user_query = "el personaje de anime se llama Brais tiene 14 años"
+    print(triage_input(user_query, extract_fields=True))
@@ -1,35 +1,78 @@
-from langgraph.graph import END
+import logging
+import threading
+from functools import partial
+
+from langchain_core.runnables import RunnableLambda
+from langgraph.graph import END, START
 from langgraph.graph import StateGraph
 
-from chains.classifier import classify_input
-from nodes.creator_node import creator_assistant_node
-from nodes.extract_fields_node import extract_fields
-from nodes.ambiguity_resolution_node import ambiguity_resolution
-from nodes.persist_character import persist_character_fields
-from nodes.reflecting_mapping_node import reflect_mapping
-from nodes.relevance_reflector_node import relevance_reflector_node
-from nodes.non_field_guidance_node import non_field_guidance
+import settings
+from chains.classifier import classify_input, aclassify_input
+from chains.llm import warm_up
+from instrumentation import (
+    BUDGET_EXHAUSTED,
+    accounted,
+    budget_level,
+    budgets_enabled,
+    configure_exporters,
+    instrumented,
+)
+from nodes.apply_corrections_node import apply_corrections
+from nodes.budget_node import budget_exhausted
+from nodes.classifier_node import classifier_node, aclassifier_node
+from nodes.creator_node import creator_assistant_node, acreator_assistant_node
+from nodes.extract_fields_node import (
+    extract_fields, aextract_fields,
+    speculative_extract_fields, aspeculative_extract_fields,
+    commit_speculative_fields,
+)
+from nodes.ambiguity_resolution_node import ambiguity_resolution, aambiguity_resolution
+from nodes.history_node import compact_history, acompact_history
+from nodes.pre_extract_node import pre_extract
+from nodes.persist_character import persist_character_fields, apersist_character_fields
+from nodes.reflecting_mapping_node import reflect_mapping, areflect_mapping
+from nodes.relevance_reflector_node import relevance_reflector_node, arelevance_reflector_node
+from nodes.non_field_guidance_node import non_field_guidance, anon_field_guidance
 from nodes.set_character_fields import set_character_fields
+from nodes.triage_node import triage_node, atriage_node
 
-from state import GraphState
+from schemas.field_index import relevant_fields
+from state import ANIME_CHARACTER, GraphState
 
 
-def message_related_to_field(state: GraphState):
+logger = logging.getLogger(__name__)
 
-    print("-- MESSAGE RELATED TO FIELD CONDITION --")
 
-    is_related_to_fields = classify_input(state["messages"][-1]).related_with_fields
+def _related_to_field_route(is_related_to_fields: bool):
 
-    print(f"is related to fields: {is_related_to_fields}")
+    logger.debug("is related to fields: %s", is_related_to_fields)
 
     if is_related_to_fields:
-        print("is related to fields")
         return "relevance_reflector_node"
     else:
-        print("is NOT related to fields")
         return "non_field_guidance"
 
 
+def message_related_to_field(state: GraphState):
+
+    logger.debug("-- MESSAGE RELATED TO FIELD CONDITION --")
+
+    user_input = state["messages"][-1].content
+    classification = classify_input(user_input, relevant_fields(ANIME_CHARACTER, user_input))
+
+    return _related_to_field_route(classification.related_with_fields)
+
+
+async def amessage_related_to_field(state: GraphState):
+
+    logger.debug("-- MESSAGE RELATED TO FIELD CONDITION --")
+
+    user_input = state["messages"][-1].content
+    classification = await aclassify_input(user_input, relevant_fields(ANIME_CHARACTER, user_input))
+
+    return _related_to_field_route(classification.related_with_fields)
+
+
 def relevance_reflector_decision(state: GraphState):
 
     input_type = state["relevance_reflector"]["input_type"]
@@ -44,47 +87,303 @@ def suggested_corrections_decision(state: GraphState):
 
     if not state["reflection_feedback"]["suggested_corrections"]:
         return "set_character_fields_node"
+    else:
+        return "apply_corrections_node"
+
+
+def reflection_depth_decision(state: GraphState):
+
+    # Bounds the reflect/correct loop so the LLM calls per turn are predictable
+    if state.get("reflection_iterations", 0) < settings.MAX_REFLECTION_DEPTH:
+        return "reflection_mapping_node"
+    else:
+        return "set_character_fields_node"
+
+
+def speculative_decision(state: GraphState):
+
+    if not state["classifier"]["related_with_fields"]:
+        return "non_field_guidance"
+
+    # Stable input already has its extraction committed, so it goes straight to reflection
+    if relevance_reflector_decision(state) == "extract_fields_node":
+        return "reflection_mapping_node"
+    else:
+        return "ambiguity_resolution_node"
+
+
+def triage_decision(state: GraphState):
+
+    if not state["triage"]["related_with_fields"]:
+        return "non_field_guidance"
+
+    if state["triage"]["input_type"] != "stable":
+        return "ambiguity_resolution_node"
+
+    # Triage that carried the extraction only needs it committed
+    if settings.TRIAGE_EXTRACTS_FIELDS:
+        return "commit_speculative_node"
     else:
         return "extract_fields_node"
 
 
-builder = StateGraph(GraphState)
-builder.add_node("non_field_guidance", non_field_guidance)
-builder.add_node("relevance_reflector_node", relevance_reflector_node)
-builder.add_node("ambiguity_resolution_node", ambiguity_resolution)
-builder.add_node("extract_fields_node", extract_fields)
-builder.add_node("reflection_mapping_node", reflect_mapping)
-builder.add_node("set_character_fields_node", set_character_fields)
-builder.add_node("creator_assistant_node", creator_assistant_node)
-builder.add_node("persist_character", persist_character_fields)
-
-builder.set_conditional_entry_point(
-    message_related_to_field,
-    path_map={
-        "non_field_guidance": "non_field_guidance",
-        "relevance_reflector_node": "relevance_reflector_node"
-    }
-)
-builder.add_conditional_edges(
-    "relevance_reflector_node",
-    relevance_reflector_decision,
-    path_map={
-        "ambiguity_resolution_node": "ambiguity_resolution_node",
-        "extract_fields_node": "extract_fields_node"
-    }
-)
+def _sync_and_async(func, afunc, name=None, metrics=False, accounting=False):
+    # Nodes and routers run `func` under graph.invoke/stream and `afunc` under graph.ainvoke/astream
+    name = name or func.__name__
+    if metrics:
+        func, afunc = instrumented(func, name), instrumented(afunc, name)
+    if accounting:
+        func, afunc = accounted(func, name), accounted(afunc, name)
+    return RunnableLambda(func, afunc=afunc, name=name)
+
+
+def _after_pre_extraction(route):
+    # Confident pre-extractions skip straight to the character fields; everything else takes the regular entry
+    def fast_path_route(state: GraphState, config):
+        if state["pre_extraction"]["hit"]:
+            return "set_character_fields_node"
+        return route.invoke(state, config)
+
+    async def afast_path_route(state: GraphState, config):
+        if state["pre_extraction"]["hit"]:
+            return "set_character_fields_node"
+        return await route.ainvoke(state, config)
+
+    return RunnableLambda(fast_path_route, afunc=afast_path_route, name="pre_extraction_decision")
+
+
+def _budget_guard(route):
+    # A turn that starts with a budget spent gets the static reply instead of taking the entry route
+    def budget_route(state: GraphState, config):
+        if budget_level(state) == BUDGET_EXHAUSTED:
+            return "budget_exhausted_node"
+        return route.invoke(state, config)
+
+    async def abudget_route(state: GraphState, config):
+        if budget_level(state) == BUDGET_EXHAUSTED:
+            return "budget_exhausted_node"
+        return await route.ainvoke(state, config)
+
+    return RunnableLambda(budget_route, afunc=abudget_route, name="budget_decision")
+
+
+def build_graph(speculative_entry: bool = None,
+                triage_entry: bool = None,
+                pre_extraction: bool = None,
+                history_max_turns: int = None,
+                checkpointer=None,
+                metrics: bool = None,
+                accounting: bool = None):
+    """
+    Builds and compiles the ConfigPilot graph.
+
+    With `speculative_entry`, the classifier, relevance reflector and field mapper run in the first superstep and
+    their results are committed or discarded by `commit_speculative_fields` before routing.
+
+    With `triage_entry`, a single triage call replaces the classifier and relevance reflector calls.
+
+    With `pre_extraction`, deterministic pre-extractors run first and confident matches skip the LLM entry path.
+
+    With `history_max_turns`, every turn ends by dropping the messages of older turns and rolling them into
+    `history_summary`.
+
+    With a `checkpointer`, the state of each conversation is saved per `thread_id` and restored on the next turn.
+
+    With `metrics`, every node and the entry router record their wall time, model calls, token usage, retries and
+    cache lookups into the `metrics` state key and the registered exporters.
+
+    With `accounting`, the tokens and cost of every model call are accounted into the `usage` state key. When
+    budgets are configured, accounting is always on and turns that start with a budget spent get a static reply.
+    """
+    if speculative_entry is None:
+        speculative_entry = settings.SPECULATIVE_ENTRY
+    if triage_entry is None:
+        triage_entry = settings.TRIAGE_ENTRY
+    if pre_extraction is None:
+        pre_extraction = settings.PRE_EXTRACTION
+    if history_max_turns is None:
+        history_max_turns = settings.HISTORY_MAX_TURNS
+    if metrics is None:
+        metrics = settings.METRICS
+    budgets = budgets_enabled()
+    if accounting is None:
+        accounting = settings.TOKEN_ACCOUNTING
+    accounting = accounting or budgets
+    if speculative_entry and triage_entry:
+        raise ValueError("speculative_entry and triage_entry are mutually exclusive")
+
+    def node(func, afunc=None, name=None):
+        if afunc is not None:
+            return _sync_and_async(func, afunc, name, metrics, accounting)
+        if metrics:
+            func = instrumented(func, name)
+        return accounted(func, name) if accounting else func
+
+    # The state type follows the character schema file, like the prompts, models and storage columns
+    builder = StateGraph(ANIME_CHARACTER.state_schema)
+    builder.add_node("non_field_guidance", node(non_field_guidance, anon_field_guidance))
+    builder.add_node("ambiguity_resolution_node", node(ambiguity_resolution, aambiguity_resolution))
+    builder.add_node("extract_fields_node", node(extract_fields, aextract_fields))
+    builder.add_node("reflection_mapping_node", node(reflect_mapping, areflect_mapping))
+    builder.add_node("apply_corrections_node", node(apply_corrections))
+    builder.add_node("set_character_fields_node", node(set_character_fields))
+    builder.add_node("creator_assistant_node", node(creator_assistant_node, acreator_assistant_node))
+    builder.add_node("persist_character", node(persist_character_fields, apersist_character_fields))
+
+    if speculative_entry or triage_entry:
+        builder.add_node("commit_speculative_node", node(commit_speculative_fields))
+        builder.add_conditional_edges(
+            "commit_speculative_node",
+            speculative_decision,
+            path_map={
+                "non_field_guidance": "non_field_guidance",
+                "ambiguity_resolution_node": "ambiguity_resolution_node",
+                "reflection_mapping_node": "reflection_mapping_node"
+            }
+        )
+
+    if not triage_entry:
+        builder.add_node("relevance_reflector_node",
+                         node(relevance_reflector_node, arelevance_reflector_node))
+
+    # Each entry mode provides the route taken from START, or from the pre-extractor when it misses
+    if triage_entry:
+        builder.add_node("triage_node", node(triage_node, atriage_node))
+        builder.add_conditional_edges(
+            "triage_node",
+            triage_decision,
+            path_map={
+                "non_field_guidance": "non_field_guidance",
+                "ambiguity_resolution_node": "ambiguity_resolution_node",
+                "extract_fields_node": "extract_fields_node",
+                "commit_speculative_node": "commit_speculative_node"
+            }
+        )
+        entry_route = RunnableLambda(lambda state: "triage_node", name="triage_entry")
+        entry_path_map = ["triage_node"]
+    elif speculative_entry:
+        speculative_nodes = ["classifier_node", "relevance_reflector_node", "speculative_extract_node"]
+
+        builder.add_node("classifier_node", node(classifier_node, aclassifier_node))
+        builder.add_node("speculative_extract_node",
+                         node(speculative_extract_fields, aspeculative_extract_fields))
+        builder.add_edge(speculative_nodes, "commit_speculative_node")
+        entry_route = RunnableLambda(lambda state: speculative_nodes, name="speculative_entry")
+        entry_path_map = speculative_nodes
+    else:
+        builder.add_conditional_edges(
+            "relevance_reflector_node",
+            relevance_reflector_decision,
+            path_map={
+                "ambiguity_resolution_node": "ambiguity_resolution_node",
+                "extract_fields_node": "extract_fields_node"
+            }
+        )
+        entry_route = node(message_related_to_field, amessage_related_to_field)
+        entry_path_map = ["non_field_guidance", "relevance_reflector_node"]
+
+    entry_source = START
+    if pre_extraction:
+        builder.add_node("pre_extract_node", node(pre_extract))
+        builder.add_edge(START, "pre_extract_node")
+        entry_source = "pre_extract_node"
+        entry_route = _after_pre_extraction(entry_route)
+        entry_path_map = entry_path_map + ["set_character_fields_node"]
+
+    # Pre-extraction makes no model calls, so it still runs once the budget is spent
+    if budgets:
+        builder.add_node("budget_exhausted_node", node(budget_exhausted))
+        entry_route = _budget_guard(entry_route)
+        entry_path_map = entry_path_map + ["budget_exhausted_node"]
+
+    builder.add_conditional_edges(entry_source, entry_route, path_map=entry_path_map)
+
+    builder.add_conditional_edges(
+        "reflection_mapping_node",
+        suggested_corrections_decision,
+        path_map={
+            "set_character_fields_node": "set_character_fields_node",
+            "apply_corrections_node": "apply_corrections_node"
+        }
+    )
+    builder.add_conditional_edges(
+        "apply_corrections_node",
+        reflection_depth_decision,
+        path_map={
+            "reflection_mapping_node": "reflection_mapping_node",
+            "set_character_fields_node": "set_character_fields_node"
+        }
+    )
+
+    builder.add_edge("extract_fields_node", "reflection_mapping_node")
+    builder.add_edge("set_character_fields_node", "creator_assistant_node")
+    builder.add_edge("creator_assistant_node", "persist_character")
+
+    if history_max_turns:
+        builder.add_node("compact_history_node", node(
+            partial(compact_history, max_turns=history_max_turns),
+            partial(acompact_history, max_turns=history_max_turns),
+            name="compact_history"
+        ))
+        builder.add_edge("persist_character", "compact_history_node")
+        builder.add_edge("non_field_guidance", "compact_history_node")
+        builder.add_edge("ambiguity_resolution_node", "compact_history_node")
+        builder.add_edge("compact_history_node", END)
+        if budgets:
+            builder.add_edge("budget_exhausted_node", "compact_history_node")
+    else:
+        builder.add_edge("persist_character", END)
+    return builder.compile(checkpointer=checkpointer)
+
+
+_graph = None
+_graph_lock = threading.Lock()
+_started = False
+
+
+def start_up() -> None:
+    """
+    Process startup work, run once: metrics exporters, chain warm-up and schema migration, as configured.
+    """
+    global _started
+    with _graph_lock:
+        if _started:
+            return
+        _started = True
+
+    if settings.METRICS:
+        configure_exporters()
+
+    if settings.WARM_UP_CHAINS:
+        warm_up()
+
+    if settings.DB_MIGRATE_ON_STARTUP:
+        from storage.postgres import ensure_schema
+
+        ensure_schema()
+
+
+def get_graph():
+    """
+    Returns the module's graph, compiled on first use after `start_up`. Its checkpointer, when configured, is
+    synchronous, so it serves `invoke`/`stream`; async callers build their own graph with `aget_checkpointer`.
+    """
+    global _graph
+    if _graph is None:
+        start_up()
+        with _graph_lock:
+            if _graph is None:
+                from storage.checkpointer import get_checkpointer
+
+                # The LangGraph platform provides its own checkpointer, so one is only attached when configured
+                # explicitly
+                _graph = build_graph(checkpointer=get_checkpointer())
+    return _graph
 
-builder.add_conditional_edges(
-    "reflection_mapping_node",
-    suggested_corrections_decision,
-    path_map={
-        "set_character_fields_node": "set_character_fields_node",
-        "extract_fields_node": "extract_fields_node"
-    }
-)
 
-builder.add_edge("extract_fields_node", "reflection_mapping_node")
-builder.add_edge("set_character_fields_node", "creator_assistant_node")
-builder.add_edge("creator_assistant_node", "persist_character")
-builder.add_edge("persist_character", END)
-graph = builder.compile()
+def __getattr__(name: str):
+    # `graph` is compiled on first access, by `from configpilot import graph` or by the LangGraph platform loading
+    # "./configpilot.py:graph", so importing the module for `build_graph` or the routers stays cheap
+    if name == "graph":
+        return get_graph()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,12 @@
+from extractors.base import (
+    PreExtraction,
+    PreExtractor,
+    get_pre_extractors,
+    register_pre_extractor,
+    run_pre_extractors,
+    stats,
+)
+from extractors.patterns import PatternPreExtractor
+from extractors.verifier import verify_fields
+
+register_pre_extractor(PatternPreExtractor())
@@ -0,0 +1,92 @@
+from typing import Any, Dict, List
+
+from pydantic import BaseModel, Field
+
+from instrumentation.metrics import current_recorder
+
+
+class PreExtraction(BaseModel):
+    """
+    Result of a deterministic pre-extractor run over a user message.
+    """
+    extractor: str = Field(..., description="Name of the pre-extractor that produced the result.")
+    fields: Dict[str, Any] = Field(default_factory=dict, description="Field values matched in the message.")
+    confident: bool = Field(
+        default=False,
+        description="True when the matches explain the whole message and the LLM path can be skipped."
+    )
+
+
+class PreExtractor:
+    """
+    Base class of the pre-extractors that run ahead of the LLM classifier.
+
+    Subclasses return a `PreExtraction`; anything that is not `confident` falls through to the LLM path.
+    """
+    name = "pre_extractor"
+
+    def extract(self, text: str) -> PreExtraction:
+        raise NotImplementedError
+
+
+class PreExtractionStats:
+    """
+    Process-wide counters used to report the hit rate of the pre-extraction stage.
+    """
+
+    def __init__(self):
+        self.attempts = 0
+        self.hits = 0
+        self.field_hits: Dict[str, int] = {}
+
+    def record(self, result: PreExtraction) -> None:
+        self.attempts += 1
+        if result.confident:
+            self.hits += 1
+            for field in result.fields:
+                self.field_hits[field] = self.field_hits.get(field, 0) + 1
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / self.attempts if self.attempts else 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "attempts": self.attempts,
+            "hits": self.hits,
+            "hit_rate": self.hit_rate,
+            "field_hits": dict(self.field_hits),
+        }
+
+    def reset(self) -> None:
+        self.__init__()
+
+
+_pre_extractors: List[PreExtractor] = []
+stats = PreExtractionStats()
+
+
+def register_pre_extractor(extractor: PreExtractor) -> PreExtractor:
+    _pre_extractors.append(extractor)
+    return extractor
+
+
+def get_pre_extractors() -> List[PreExtractor]:
+    return list(_pre_extractors)
+
+
+def run_pre_extractors(text: str) -> PreExtraction:
+    """
+    Runs the registered pre-extractors in order and returns the first confident result, or the last miss.
+    """
+    result = PreExtraction(extractor="none")
+    for extractor in _pre_extractors:
+        result = extractor.extract(text)
+        if result.confident:
+            break
+
+    stats.record(result)
+    recorder = current_recorder()
+    if recorder is not None:
+        recorder.record_pre_extraction(result.confident, result.fields)
+    return result
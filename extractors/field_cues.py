@@ -0,0 +1,33 @@
+import re
+from typing import Dict, List, Pattern
+
+
+# English and Spanish words that suggest a message talks about a field, even when no value can be parsed
+FIELD_CUES: Dict[str, List[str]] = {
+    "name": [r"name[sd]?", r"called", r"llam\w*", r"nombre", r"apod\w*", r"nickname"],
+    "age": [r"\d+", r"years?", r"old", r"age[sd]?", r"young", r"teen\w*", r"años", r"edad", r"joven", r"viej\w*",
+            r"ancian\w*", r"adolescente"],
+    "gender": [r"boy", r"girl", r"man", r"woman", r"male", r"female", r"guy", r"lady", r"he", r"she", r"chic[oa]",
+               r"hombre", r"mujer", r"niñ[oa]", r"él", r"ella", r"género", r"gender"],
+    "physical_appearance": [r"hair", r"eyes?", r"tall", r"short", r"wears?", r"scars?", r"looks?", r"skin",
+                            r"pelo", r"cabello", r"ojos", r"alt[oa]", r"baj[oa]", r"viste", r"lleva", r"piel",
+                            r"cicatriz", r"aspecto", r"appearance"],
+    "personality": [r"shy", r"brave", r"kind", r"cheerful", r"lazy", r"cold", r"personality", r"tímid[oa]",
+                    r"valiente", r"amable", r"alegre", r"perezos[oa]", r"fr[ií]\w*", r"personalidad", r"carácter"],
+    "abilities_power": [r"powers?", r"abilit\w*", r"magic", r"strength", r"strong", r"controls?", r"can",
+                        r"poder\w*", r"habilidad\w*", r"magia", r"fuerza", r"fuerte", r"controla", r"puede"],
+    "occupation": [r"works?", r"job", r"student", r"teacher", r"ninja", r"samurai", r"occupation", r"trabaja\w*",
+                   r"estudiante", r"profesor\w*", r"oficio", r"ocupación", r"es un[oa]?"],
+}
+
+_FIELD_CUE_PATTERNS: Dict[str, Pattern] = {
+    field: re.compile(r"\b(?:" + "|".join(cues) + r")\b", re.IGNORECASE)
+    for field, cues in FIELD_CUES.items()
+}
+
+
+def fields_touched(text: str) -> List[str]:
+    """
+    Returns the fields a message plausibly talks about, in declaration order.
+    """
+    return [field for field, pattern in _FIELD_CUE_PATTERNS.items() if pattern.search(text)]
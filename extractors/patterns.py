@@ -0,0 +1,111 @@
+import re
+from typing import Dict, List, Pattern
+
+from pydantic import ValidationError
+
+from extractors.base import PreExtraction, PreExtractor
+from state import AnimeCharacter
+
+
+_NAME = r"(?P<value>[^\W\d_][\w'-]*(?:\s+[A-ZÀ-Ý][\w'-]*)?)"
+_NUMBER = r"(?P<value>\d{1,4})"
+
+# English and Spanish phrasings for the fields that can be extracted without an LLM
+FIELD_PATTERNS: Dict[str, List[Pattern]] = {
+    "name": [
+        re.compile(r"\b(?i:(?:his|her|their|its|the character'?s?) name is|is (?:called|named))\s+" + _NAME),
+        re.compile(r"\b(?i:se llama|su nombre es|(?:es|está) llamad[oa])\s+" + _NAME),
+        re.compile(r"\b(?i:name)\s*:\s*" + _NAME),
+    ],
+    "age": [
+        re.compile(r"\b" + _NUMBER + r"[- ]?(?:years?|yrs?)[- ]old\b", re.IGNORECASE),
+        # A bare "is 14" is left to the LLM: "it is 3" or "he is 6 feet" are not ages
+        re.compile(r"\b(?:aged|age\s*(?::|is|of))\s*" + _NUMBER + r"(?:\s+years?(?:\s+old)?)?\b", re.IGNORECASE),
+        re.compile(r"\b" + _NUMBER + r"\s+years?\s+of\s+age\b", re.IGNORECASE),
+        re.compile(r"\b(?:tiene\s+)?" + _NUMBER + r"\s+años(?:\s+de\s+edad)?\b", re.IGNORECASE),
+        re.compile(r"\bedad\s*(?:de|:)?\s*" + _NUMBER + r"\b", re.IGNORECASE),
+    ],
+    "gender": [
+        re.compile(r"\b(?P<value>boy|girl|man|woman|male|female|guy|lady)\b", re.IGNORECASE),
+        re.compile(r"\b(?P<value>chico|chica|hombre|mujer|niño|niña|varón|masculino|femenino)\b", re.IGNORECASE),
+    ],
+}
+
+GENDER_VOCABULARY = {
+    "boy": "male", "man": "male", "male": "male", "guy": "male",
+    "chico": "male", "hombre": "male", "niño": "male", "varón": "male", "masculino": "male",
+    "girl": "female", "woman": "female", "female": "female", "lady": "female",
+    "chica": "female", "mujer": "female", "niña": "female", "femenino": "female",
+}
+
+# Words caught by the name patterns that are not names ("his name is unknown", "se llama el ..."); a match on them
+# leaves the message to the LLM
+NAME_STOP_WORDS = {
+    "unknown", "secret", "nothing", "none", "no", "not", "unnamed", "nameless", "anonymous", "undecided", "hidden",
+    "something", "whatever", "still", "yet", "what", "who", "the", "a", "an", "my", "his", "her", "their", "its",
+    "desconocido", "desconocida", "secreto", "secreta", "nada", "ninguno", "ninguna", "anónimo", "anónima", "algo",
+    "todavía", "aún", "qué", "quién", "como", "así", "el", "la", "los", "las", "un", "una", "mi", "su", "sus",
+}
+
+# Words that may remain around the matches without changing their meaning
+FILLER_WORDS = {
+    "the", "my", "a", "an", "and", "is", "he", "she", "it", "they", "character", "anime", "of", "our",
+    "el", "la", "mi", "un", "una", "y", "es", "de", "personaje", "nuestro", "nuestra", "él", "ella",
+}
+
+_WORD = re.compile(r"[^\W_]+")
+
+
+class PatternPreExtractor(PreExtractor):
+    """
+    Matches compiled multilingual patterns per `AnimeCharacter` field.
+
+    The result is confident only when every field matched a single value, no name matched a stop word and the
+    words left over once the matched spans are removed are all filler words.
+    """
+    name = "patterns"
+
+    def __init__(self, field_patterns: Dict[str, List[Pattern]] = None):
+        self.field_patterns = field_patterns or FIELD_PATTERNS
+
+    def extract(self, text: str) -> PreExtraction:
+        fields = {}
+        consumed = [False] * len(text)
+        ambiguous = False
+        stop_word_name = False
+
+        for field, patterns in self.field_patterns.items():
+            values = set()
+            for pattern in patterns:
+                for match in pattern.finditer(text):
+                    if any(consumed[match.start():match.end()]):
+                        continue
+                    consumed[match.start():match.end()] = [True] * (match.end() - match.start())
+                    value = self._normalize(field, match.group("value"))
+                    if field == "name" and any(word in NAME_STOP_WORDS for word in _WORD.findall(value.lower())):
+                        stop_word_name = True
+                        continue
+                    values.add(value)
+            if len(values) > 1:
+                ambiguous = True
+            elif values:
+                fields[field] = values.pop()
+
+        residual = "".join(" " if used else char for char, used in zip(text, consumed))
+        leftover = [word for word in _WORD.findall(residual.lower()) if word not in FILLER_WORDS]
+
+        try:
+            fields = AnimeCharacter.model_validate(fields).model_dump(exclude_none=True)
+        except ValidationError:
+            return PreExtraction(extractor=self.name, fields=fields, confident=False)
+
+        confident = bool(fields) and not ambiguous and not stop_word_name and not leftover
+        return PreExtraction(extractor=self.name, fields=fields, confident=confident)
+
+    @staticmethod
+    def _normalize(field: str, value: str):
+        if field == "age":
+            return int(value)
+        if field == "gender":
+            return GENDER_VOCABULARY[value.lower()]
+        return value.strip()
@@ -0,0 +1,81 @@
+import re
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from extractors.field_cues import fields_touched
+from extractors.patterns import FIELD_PATTERNS, GENDER_VOCABULARY
+from schemas import CompiledSchema
+from state import ANIME_CHARACTER
+
+
+_WORD = re.compile(r"[^\W_]+")
+_NUMBER = re.compile(r"-?\d+(?:[.,]\d+)?")
+
+
+def _words(text: str) -> str:
+    # Case, punctuation and spacing differences do not count against a literal match
+    return " " + " ".join(_WORD.findall(text.lower())) + " "
+
+
+def _in_range(prop: Dict[str, Any], value: Any) -> bool:
+    if "minimum" in prop and value < prop["minimum"]:
+        return False
+    if "maximum" in prop and value > prop["maximum"]:
+        return False
+    if isinstance(value, str) and len(value) > prop.get("maxLength", len(value)):
+        return False
+    return "enum" not in prop or value in prop["enum"]
+
+
+def _genders(text: str) -> set:
+    return {GENDER_VOCABULARY[match.group("value").lower()]
+            for pattern in FIELD_PATTERNS["gender"] for match in pattern.finditer(text)}
+
+
+def _verify_value(field: str, prop: Dict[str, Any], value: Any, text: str) -> bool:
+    if not _in_range(prop, value):
+        return False
+
+    if field == "gender":
+        # "chico", "boy" and "male" all verify a male gender, as long as the message names no other gender
+        gender = GENDER_VOCABULARY.get(str(value).strip().lower(), str(value).strip().lower())
+        return _genders(text) == {gender}
+
+    if isinstance(value, bool):
+        return False
+    if isinstance(value, (int, float)):
+        return any(float(number.replace(",", ".")) == value for number in _NUMBER.findall(text))
+    if isinstance(value, str):
+        return _words(value).strip() != "" and _words(value) in _words(text)
+    return False
+
+
+def verify_fields(text: str,
+                  character: Dict[str, Any],
+                  fields: Optional[Sequence[str]] = None,
+                  changed_fields: Sequence[str] = (),
+                  schema: CompiledSchema = ANIME_CHARACTER) -> Tuple[List[str], List[str]]:
+    """
+    Deterministic checks of the extracted `character` against the user message, run ahead of the LLM reflection.
+    Returns the checked fields (`fields`, or every field) split into those verified locally and those left for
+    the reflection model.
+
+    A value is verified when it satisfies the schema's type and range constraints and occurs in the message:
+    literally for strings, as a number for numeric fields, and through the normalized vocabulary for gender.
+    A missing value is verified when the message does not talk about the field, and a value kept from an earlier
+    turn is skipped when the message does not touch it. Anything else goes to the model.
+    """
+    touched = set(fields_touched(text))
+    verified, unverified = [], []
+
+    for field in schema.fields if fields is None else [field for field in schema.fields if field in fields]:
+        value = character.get(field)
+        if value is None:
+            (unverified if field in touched else verified).append(field)
+        elif field not in changed_fields and field not in touched:
+            continue
+        elif _verify_value(field, schema.properties[field], value, text):
+            verified.append(field)
+        else:
+            unverified.append(field)
+
+    return verified, unverified
@@ -0,0 +1,31 @@
+from instrumentation.exporters import (
+    MetricsExporter,
+    PrometheusExporter,
+    SpanExporter,
+    configure_exporters,
+    get_exporters,
+    jsonl_span_sink,
+    register_exporter,
+)
+from instrumentation.metrics import (
+    CHAIN_KEY,
+    MetricsRecorder,
+    PromptCacheReport,
+    current_recorder,
+    instrumented,
+    merge_metrics,
+    prompt_cache_report,
+)
+from instrumentation.prices import MODEL_PRICES, call_cost
+from instrumentation.usage import (
+    BUDGET_ECONOMY,
+    BUDGET_EXHAUSTED,
+    BUDGET_OK,
+    UsageLedger,
+    accounted,
+    budget_level,
+    budgets_enabled,
+    current_budget_level,
+    merge_usage,
+    usage_ledger,
+)
@@ -0,0 +1,210 @@
+import hashlib
+import json
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional
+
+import settings
+from instrumentation.prices import call_cost
+
+
+class MetricsExporter:
+    """
+    Base class of the exporters that receive one record per instrumented node or router run.
+
+    A record holds the node and function name, start and end timestamps in seconds, the model calls made
+    (model, chain, timestamps, input/output/cached tokens, error), retries, model tier escalations, resilience
+    events, response-cache hits and misses and pre-extraction attempts, hits and matched fields.
+    """
+
+    def export(self, record: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+
+_exporters: List[MetricsExporter] = []
+
+
+def register_exporter(exporter: MetricsExporter) -> MetricsExporter:
+    _exporters.append(exporter)
+    return exporter
+
+
+def get_exporters() -> List[MetricsExporter]:
+    return list(_exporters)
+
+
+def export(record: Dict[str, Any]) -> None:
+    for exporter in _exporters:
+        exporter.export(record)
+
+
+def _labels(**labels: str) -> str:
+    escaped = (f'{key}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+               for key, value in labels.items())
+    return "{" + ",".join(escaped) + "}"
+
+
+class PrometheusExporter(MetricsExporter):
+    """
+    Aggregates records into counters rendered in the Prometheus text exposition format, optionally served over
+    HTTP with `serve`.
+    """
+
+    def __init__(self, prefix: str = "configpilot"):
+        self.prefix = prefix
+        self._counters: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    def _inc(self, name: str, labels: str, value: float = 1.0) -> None:
+        series = self._counters.setdefault(name, {})
+        series[labels] = series.get(labels, 0.0) + value
+
+    def export(self, record: Dict[str, Any]) -> None:
+        node = _labels(node=record["node"])
+        with self._lock:
+            self._inc("node_runs_total", node)
+            self._inc("node_seconds_total", node, record["end"] - record["start"])
+            self._inc("llm_retries_total", node, record["retries"])
+            self._inc("model_escalations_total", node, record["escalations"])
+            for event, count in record["events"].items():
+                self._inc("resilience_events_total", _labels(node=record["node"], event=event), count)
+            self._inc("response_cache_lookups_total", _labels(result="hit"), record["cache_hits"])
+            self._inc("response_cache_lookups_total", _labels(result="miss"), record["cache_misses"])
+            pre_extraction = record["pre_extraction"]
+            if pre_extraction["attempts"]:
+                self._inc("pre_extractions_total", _labels(result="hit"), pre_extraction["hits"])
+                self._inc("pre_extractions_total", _labels(result="miss"),
+                          pre_extraction["attempts"] - pre_extraction["hits"])
+            for field, hits in pre_extraction["fields"].items():
+                self._inc("pre_extraction_fields_total", _labels(field=field), hits)
+
+            for call in record["llm_calls"]:
+                model = _labels(model=call["model"])
+                self._inc("llm_calls_total", model)
+                self._inc("llm_seconds_total", model, call["end"] - call["start"])
+                self._inc("llm_cost_usd_total", model, call_cost(call["model"], call["input_tokens"],
+                                                                 call["output_tokens"], call["cached_tokens"]))
+                if call["error"]:
+                    self._inc("llm_errors_total", _labels(model=call["model"], error=call["error"]))
+                for kind in ("input", "output", "cached"):
+                    self._inc("llm_tokens_total", _labels(model=call["model"], type=kind), call[f"{kind}_tokens"])
+                self._inc("prompt_tokens_total", _labels(chain=call["chain"], cache="hit"), call["cached_tokens"])
+                self._inc("prompt_tokens_total", _labels(chain=call["chain"], cache="miss"),
+                          call["input_tokens"] - call["cached_tokens"])
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                lines.append(f"# TYPE {self.prefix}_{name} counter")
+                lines.extend(f"{self.prefix}_{name}{labels} {value:g}" for labels, value in sorted(series.items()))
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port: int = 9464, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+        """
+        Serves `render()` on http://host:port/metrics from a daemon thread.
+        """
+        exporter = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = exporter.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self._server.serve_forever, name="configpilot-metrics", daemon=True).start()
+        return self._server
+
+
+class SpanExporter(MetricsExporter):
+    """
+    Turns each record into OpenTelemetry-shaped spans: one per node run with a child span per model call.
+
+    Spans are plain dicts (trace_id, span_id, parent_span_id, name, start/end_time_unix_nano, attributes) passed
+    to `sink`, e.g. a function forwarding them to an OTLP client. Spans of a thread share its trace id.
+    """
+
+    def __init__(self, sink: Callable[[Dict[str, Any]], None]):
+        self.sink = sink
+
+    @staticmethod
+    def _trace_id(record: Dict[str, Any]) -> str:
+        thread_id = record["metadata"].get("thread_id")
+        if thread_id is None:
+            return uuid.uuid4().hex
+        return hashlib.sha256(str(thread_id).encode("utf-8")).hexdigest()[:32]
+
+    def export(self, record: Dict[str, Any]) -> None:
+        trace_id = self._trace_id(record)
+        node_span_id = uuid.uuid4().hex[:16]
+
+        self.sink({
+            "trace_id": trace_id,
+            "span_id": node_span_id,
+            "parent_span_id": None,
+            "name": record["node"],
+            "start_time_unix_nano": int(record["start"] * 1e9),
+            "end_time_unix_nano": int(record["end"] * 1e9),
+            "attributes": {
+                "configpilot.function": record["name"],
+                "configpilot.llm_calls": len(record["llm_calls"]),
+                "configpilot.retries": record["retries"],
+                "configpilot.escalations": record["escalations"],
+                **{f"configpilot.events.{event}": count for event, count in record["events"].items()},
+                "configpilot.cache_hits": record["cache_hits"],
+                "configpilot.cache_misses": record["cache_misses"],
+                **({"configpilot.pre_extraction.hit": bool(record["pre_extraction"]["hits"])}
+                   if record["pre_extraction"]["attempts"] else {}),
+                **{f"configpilot.{key}": value for key, value in record["metadata"].items()},
+            },
+        })
+
+        for call in record["llm_calls"]:
+            self.sink({
+                "trace_id": trace_id,
+                "span_id": uuid.uuid4().hex[:16],
+                "parent_span_id": node_span_id,
+                "name": f"{call['chain']} {call['model']}",
+                "start_time_unix_nano": int(call["start"] * 1e9),
+                "end_time_unix_nano": int(call["end"] * 1e9),
+                "attributes": {
+                    "gen_ai.request.model": call["model"],
+                    "configpilot.chain": call["chain"],
+                    "gen_ai.usage.input_tokens": call["input_tokens"],
+                    "gen_ai.usage.output_tokens": call["output_tokens"],
+                    "gen_ai.usage.cached_tokens": call["cached_tokens"],
+                    **({"error.type": call["error"]} if call["error"] else {}),
+                },
+            })
+
+
+def configure_exporters() -> None:
+    """
+    Registers the exporters enabled in settings: the Prometheus endpoint and the JSON lines span file.
+    """
+    if settings.METRICS_PROMETHEUS_PORT:
+        register_exporter(PrometheusExporter()).serve(settings.METRICS_PROMETHEUS_PORT)
+    if settings.METRICS_SPAN_PATH:
+        register_exporter(SpanExporter(jsonl_span_sink(settings.METRICS_SPAN_PATH)))
+
+
+def jsonl_span_sink(path: str) -> Callable[[Dict[str, Any]], None]:
+    """
+    Span sink appending one JSON span per line to `path`.
+    """
+    lock = threading.Lock()
+
+    def sink(span: Dict[str, Any]) -> None:
+        with lock, open(path, "a", encoding="utf-8") as file:
+            file.write(json.dumps(span) + "\n")
+
+    return sink
@@ -0,0 +1,306 @@
+import inspect
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.tracers.context import register_configure_hook
+
+from instrumentation.exporters import export
+
+
+# Run metadata key naming the chain a model call belongs to, set by `chains.llm.for_chain`
+CHAIN_KEY = "configpilot_chain"
+
+
+def _usage(response) -> Dict[str, Any]:
+    generations = response.generations[0] if response.generations else []
+    message = getattr(generations[0], "message", None) if generations else None
+    return getattr(message, "usage_metadata", None) or {}
+
+
+def _cached_tokens(usage: Dict[str, Any]) -> int:
+    return (usage.get("input_token_details") or {}).get("cache_read", 0)
+
+
+class MetricsRecorder(BaseCallbackHandler):
+    """
+    Collects the model calls, retries, model tier escalations, resilience events, response-cache lookups and
+    pre-extraction attempts made while one node or router runs.
+
+    It is installed through a context variable registered as a LangChain configure hook, so every chat model
+    called inside the node reports to it without threading callbacks through the chains.
+    """
+
+    def __init__(self, node: str, name: str, metadata: Optional[Dict[str, Any]] = None):
+        self.node = node
+        self.name = name
+        self.metadata = metadata or {}
+        self.start = time.time()
+        self.end: Optional[float] = None
+        self.llm_calls: List[Dict[str, Any]] = []
+        self.retries = 0
+        self.escalations = 0
+        self.events: Dict[str, int] = {}
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.pre_extraction: Dict[str, Any] = {"attempts": 0, "hits": 0, "fields": {}}
+        self._pending: Dict[UUID, Dict[str, Any]] = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, tags=None, metadata=None,
+                            **kwargs):
+        metadata = metadata or {}
+        invocation_params = kwargs.get("invocation_params") or {}
+        self._pending[run_id] = {
+            "model": metadata.get("ls_model_name") or invocation_params.get("model_name") or "unknown",
+            "chain": metadata.get(CHAIN_KEY, "unknown"),
+            "start": time.time(),
+        }
+
+    def on_llm_end(self, response, *, run_id, parent_run_id=None, **kwargs):
+        call = self._pending.pop(run_id, None)
+        if call is None:
+            return
+
+        usage = _usage(response)
+        call.update(
+            end=time.time(),
+            input_tokens=usage.get("input_tokens", 0),
+            output_tokens=usage.get("output_tokens", 0),
+            cached_tokens=_cached_tokens(usage),
+            error=None,
+        )
+        self.llm_calls.append(call)
+
+    def on_llm_error(self, error, *, run_id, parent_run_id=None, **kwargs):
+        call = self._pending.pop(run_id, None)
+        if call is not None:
+            call.update(end=time.time(), input_tokens=0, output_tokens=0, cached_tokens=0,
+                        error=type(error).__name__)
+            self.llm_calls.append(call)
+
+    def on_retry(self, retry_state, *, run_id, parent_run_id=None, **kwargs):
+        self.retries += 1
+
+    def record_escalation(self) -> None:
+        self.escalations += 1
+
+    def record_event(self, event: str) -> None:
+        """
+        Counts a resilience event: timeout, retry, hedge, hedge_win, fallback, breaker_opened or breaker_rejected.
+        """
+        self.events[event] = self.events.get(event, 0) + 1
+
+    def record_cache_lookup(self, hit: bool) -> None:
+        if hit:
+            self.cache_hits += 1
+        else:
+            self.cache_misses += 1
+
+    def record_pre_extraction(self, hit: bool, fields) -> None:
+        self.pre_extraction["attempts"] += 1
+        if hit:
+            self.pre_extraction["hits"] += 1
+            for field in fields:
+                self.pre_extraction["fields"][field] = self.pre_extraction["fields"].get(field, 0) + 1
+
+    def finish(self) -> Dict[str, Any]:
+        self.end = time.time()
+        return {
+            "node": self.node,
+            "name": self.name,
+            "metadata": self.metadata,
+            "start": self.start,
+            "end": self.end,
+            "llm_calls": self.llm_calls,
+            "retries": self.retries,
+            "escalations": self.escalations,
+            "events": dict(self.events),
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "pre_extraction": self.pre_extraction,
+        }
+
+
+_current_recorder: ContextVar[Optional[MetricsRecorder]] = ContextVar("configpilot_metrics_recorder", default=None)
+register_configure_hook(_current_recorder, inheritable=True)
+
+
+def current_recorder() -> Optional[MetricsRecorder]:
+    return _current_recorder.get()
+
+
+class PromptCacheReport(BaseCallbackHandler):
+    """
+    Totals the prompt tokens of every model call per chain, split into the ones served from the provider's prompt
+    cache and the uncached rest. Attach it as a callback or collect it with `prompt_cache_report()`.
+    """
+
+    def __init__(self):
+        self.chains: Dict[str, Dict[str, int]] = {}
+        self._pending: Dict[UUID, str] = {}
+        self._lock = threading.Lock()
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, tags=None, metadata=None,
+                            **kwargs):
+        self._pending[run_id] = (metadata or {}).get(CHAIN_KEY, "unknown")
+
+    def on_llm_end(self, response, *, run_id, parent_run_id=None, **kwargs):
+        chain = self._pending.pop(run_id, None)
+        if chain is None:
+            return
+
+        usage = _usage(response)
+        with self._lock:
+            totals = self.chains.setdefault(chain, {"calls": 0, "input_tokens": 0, "cached_tokens": 0})
+            totals["calls"] += 1
+            totals["input_tokens"] += usage.get("input_tokens", 0)
+            totals["cached_tokens"] += _cached_tokens(usage)
+
+    def on_llm_error(self, error, *, run_id, parent_run_id=None, **kwargs):
+        self._pending.pop(run_id, None)
+
+    def report(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {
+                chain: {
+                    **totals,
+                    "uncached_tokens": totals["input_tokens"] - totals["cached_tokens"],
+                    "cached_ratio": round(totals["cached_tokens"] / totals["input_tokens"], 3)
+                    if totals["input_tokens"] else 0.0,
+                }
+                for chain, totals in sorted(self.chains.items())
+            }
+
+
+_prompt_cache_report: ContextVar[Optional[PromptCacheReport]] = ContextVar("configpilot_prompt_cache_report",
+                                                                            default=None)
+register_configure_hook(_prompt_cache_report, inheritable=True)
+
+
+@contextmanager
+def prompt_cache_report() -> Iterator[PromptCacheReport]:
+    """
+    Collects a `PromptCacheReport` of every model call made inside the block, e.g. around `graph.invoke`.
+    """
+    report = PromptCacheReport()
+    token = _prompt_cache_report.set(report)
+    try:
+        yield report
+    finally:
+        _prompt_cache_report.reset(token)
+
+
+def state_metrics(record: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Summarizes a node record into the `metrics` state shape, which `merge_metrics` accumulates over the session.
+    """
+    models: Dict[str, Dict[str, float]] = {}
+    chains: Dict[str, Dict[str, int]] = {}
+    for call in record["llm_calls"]:
+        chain = chains.setdefault(call["chain"], {"calls": 0, "input_tokens": 0, "cached_tokens": 0})
+        chain["calls"] += 1
+        chain["input_tokens"] += call["input_tokens"]
+        chain["cached_tokens"] += call["cached_tokens"]
+
+        model = models.setdefault(call["model"], {
+            "calls": 0, "errors": 0, "wall_ms": 0.0, "input_tokens": 0, "output_tokens": 0, "cached_tokens": 0
+        })
+        model["calls"] += 1
+        model["errors"] += 1 if call["error"] else 0
+        model["wall_ms"] += (call["end"] - call["start"]) * 1000
+        model["input_tokens"] += call["input_tokens"]
+        model["output_tokens"] += call["output_tokens"]
+        model["cached_tokens"] += call["cached_tokens"]
+
+    return {
+        "nodes": {record["node"]: {"runs": 1, "wall_ms": (record["end"] - record["start"]) * 1000}},
+        "models": models,
+        "chains": chains,
+        "retries": record["retries"],
+        "escalations": record["escalations"],
+        "events": record["events"],
+        "cache_hits": record["cache_hits"],
+        "cache_misses": record["cache_misses"],
+        "pre_extraction": record["pre_extraction"],
+    }
+
+
+def merge_metrics(left: Optional[Dict[str, Any]], right: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    `metrics` reducer: sums numeric leaves key by key, so the state stays the same size however long the session.
+    """
+    merged = dict(left or {})
+    for key, value in (right or {}).items():
+        if isinstance(value, dict):
+            merged[key] = merge_metrics(merged.get(key), value)
+        elif isinstance(value, (int, float)) and isinstance(merged.get(key), (int, float)):
+            merged[key] = merged[key] + value
+        else:
+            merged[key] = value
+    return merged
+
+
+def _accepts_config(func: Callable) -> bool:
+    return "config" in inspect.signature(func).parameters
+
+
+def _start(name: str, config) -> MetricsRecorder:
+    metadata = (config or {}).get("metadata") or {}
+    return MetricsRecorder(
+        node=metadata.get("langgraph_node", name),
+        name=name,
+        metadata={key: metadata[key] for key in ("thread_id", "langgraph_step") if key in metadata},
+    )
+
+
+def _finish(recorder: MetricsRecorder, result: Any) -> Any:
+    record = recorder.finish()
+
+    # Node updates also carry the metrics into the state. Router results are route names and are returned as is;
+    # routers run under the node they leave from, so they are recorded under their own name
+    if not isinstance(result, dict):
+        record["node"] = record["name"]
+        export(record)
+        return result
+
+    export(record)
+    return {**result, "metrics": state_metrics(record)}
+
+
+def instrumented(func: Callable, name: Optional[str] = None) -> Callable:
+    """
+    Wraps a node or router so its wall time, model calls, token usage, retries and cache lookups are recorded,
+    exported and, for nodes, merged into the `metrics` state key. `name` defaults to the function name.
+    """
+    name = name or func.__name__
+    pass_config = _accepts_config(func)
+
+    # `functools.wraps` is not used: its `__wrapped__` would hide the `config` parameter from LangGraph
+    if inspect.iscoroutinefunction(func):
+        async def async_wrapper(state, config=None):
+            recorder = _start(name, config)
+            token = _current_recorder.set(recorder)
+            try:
+                result = await (func(state, config) if pass_config else func(state))
+            finally:
+                _current_recorder.reset(token)
+            return _finish(recorder, result)
+
+        async_wrapper.__name__ = name
+        return async_wrapper
+
+    def wrapper(state, config=None):
+        recorder = _start(name, config)
+        token = _current_recorder.set(recorder)
+        try:
+            result = func(state, config) if pass_config else func(state)
+        finally:
+            _current_recorder.reset(token)
+        return _finish(recorder, result)
+
+    wrapper.__name__ = name
+    return wrapper
@@ -0,0 +1,39 @@
+from typing import Dict, Optional, Tuple
+
+import settings
+
+
+def _parse_prices(value: str) -> Dict[str, Tuple[float, float, float]]:
+    # "gpt-4o=2.5/1.25/10" -> {"gpt-4o": (2.5, 1.25, 10.0)}: USD per million input, cached input and output tokens
+    prices = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        model_name, _, amounts = item.partition("=")
+        input_price, cached_price, output_price = (float(amount) for amount in amounts.split("/"))
+        prices[model_name.strip()] = (input_price, cached_price, output_price)
+    return prices
+
+
+MODEL_PRICES = _parse_prices(settings.MODEL_PRICES)
+
+
+def model_prices(model_name: str) -> Optional[Tuple[float, float, float]]:
+    """
+    Prices of a model, matching dated snapshots ("gpt-4o-2024-08-06") by the longest listed prefix.
+    """
+    if model_name in MODEL_PRICES:
+        return MODEL_PRICES[model_name]
+    prefixes = [listed for listed in MODEL_PRICES if model_name.startswith(listed + "-")]
+    return MODEL_PRICES[max(prefixes, key=len)] if prefixes else None
+
+
+def call_cost(model_name: str, input_tokens: int, output_tokens: int, cached_tokens: int = 0) -> float:
+    """
+    USD cost of a model call. Cached prompt tokens are part of `input_tokens` and billed at the cached price.
+    Models missing from the price table cost 0.
+    """
+    prices = model_prices(model_name)
+    if prices is None:
+        return 0.0
+    input_price, cached_price, output_price = prices
+    return ((input_tokens - cached_tokens) * input_price + cached_tokens * cached_price
+            + output_tokens * output_price) / 1_000_000
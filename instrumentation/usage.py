@@ -0,0 +1,306 @@
+"""
+Token and cost accounting per session and per turn, and the budgets enforced on it.
+
+Every node wrapped with `accounted` totals the tokens and cost of its model calls (provider usage metadata priced
+with `instrumentation.prices`) into the `usage` state key. Before the node runs, the session and turn totals are
+checked against the configured budgets:
+
+- "economy" (past `BUDGET_ECONOMY_RATIO` of a budget): tiered chains run on `BUDGET_ECONOMY_MODEL`;
+- "exhausted" (a budget spent): reflection is skipped, and a turn that starts exhausted gets a static reply.
+
+`usage_ledger` keeps the recent per-turn totals of the process for capacity planning.
+"""
+import inspect
+import statistics
+import threading
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.tracers.context import register_configure_hook
+
+import settings
+from instrumentation.metrics import _accepts_config, _cached_tokens, _usage, merge_metrics
+from instrumentation.prices import call_cost
+
+
+BUDGET_OK = "ok"
+BUDGET_ECONOMY = "economy"
+BUDGET_EXHAUSTED = "exhausted"
+
+
+def _totals() -> Dict[str, float]:
+    return {"calls": 0, "input_tokens": 0, "cached_tokens": 0, "output_tokens": 0, "cost_usd": 0.0}
+
+
+def _add(totals: Dict[str, float], other: Dict[str, float]) -> None:
+    for key in totals:
+        totals[key] += other.get(key, 0)
+
+
+class UsageRecorder(BaseCallbackHandler):
+    """
+    Totals, per model, the calls, tokens and cost of the model calls made while one node or router runs.
+    """
+
+    def __init__(self):
+        self.models: Dict[str, Dict[str, float]] = {}
+        self._pending: Dict[UUID, str] = {}
+        self._lock = threading.Lock()
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, tags=None, metadata=None,
+                            **kwargs):
+        invocation_params = kwargs.get("invocation_params") or {}
+        self._pending[run_id] = ((metadata or {}).get("ls_model_name") or invocation_params.get("model_name")
+                                 or "unknown")
+
+    def on_llm_end(self, response, *, run_id, parent_run_id=None, **kwargs):
+        model_name = self._pending.pop(run_id, None)
+        if model_name is None:
+            return
+
+        usage = _usage(response)
+        input_tokens, output_tokens = usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+        cached_tokens = _cached_tokens(usage)
+        with self._lock:
+            totals = self.models.setdefault(model_name, _totals())
+            _add(totals, {
+                "calls": 1,
+                "input_tokens": input_tokens,
+                "cached_tokens": cached_tokens,
+                "output_tokens": output_tokens,
+                "cost_usd": call_cost(model_name, input_tokens, output_tokens, cached_tokens),
+            })
+
+    def on_llm_error(self, error, *, run_id, parent_run_id=None, **kwargs):
+        self._pending.pop(run_id, None)
+
+    def update(self, turn: Optional[str]) -> Optional[Dict[str, Any]]:
+        """
+        The recorded usage in the `usage` state shape, or None when no model was called.
+        """
+        if not self.models:
+            return None
+        session = _totals()
+        for totals in self.models.values():
+            _add(session, totals)
+        return {"turn": turn, "session": session, "models": self.models}
+
+
+def merge_usage(left: Optional[Dict[str, Any]], right: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    `usage` reducer: accumulates the session and per-model totals, and restarts the `current_turn` totals when
+    the update belongs to a new turn.
+    """
+    left, right = left or {}, right or {}
+    if not right:
+        return left
+
+    same_turn = bool(left) and left.get("turn") == right.get("turn")
+    return {
+        "turn": right.get("turn"),
+        "turns": left.get("turns", 0) + (0 if same_turn else 1),
+        "session": merge_metrics(left.get("session"), right.get("session")),
+        "current_turn": merge_metrics(left.get("current_turn") if same_turn else None, right.get("session")),
+        "models": merge_metrics(left.get("models"), right.get("models")),
+    }
+
+
+def _turn(state) -> Optional[str]:
+    # The id of the last user message identifies the turn, and stays stable when the history is compacted
+    for message in reversed(state.get("messages", [])):
+        if message.type == "human":
+            return message.id
+    return None
+
+
+def _session(state, config) -> str:
+    configurable = (config or {}).get("configurable") or {}
+    return configurable.get("thread_id") or state.get("session_id") or "default"
+
+
+def budgets_enabled() -> bool:
+    return any((settings.SESSION_TOKEN_BUDGET, settings.SESSION_COST_BUDGET,
+                settings.TURN_TOKEN_BUDGET, settings.TURN_COST_BUDGET))
+
+
+def _spent(totals: Dict[str, float], token_budget: int, cost_budget: float) -> float:
+    # Fraction of the tighter budget already spent
+    spent = 0.0
+    if token_budget:
+        spent = max(spent, (totals.get("input_tokens", 0) + totals.get("output_tokens", 0)) / token_budget)
+    if cost_budget:
+        spent = max(spent, totals.get("cost_usd", 0.0) / cost_budget)
+    return spent
+
+
+def budget_level(state) -> str:
+    """
+    BUDGET_OK, BUDGET_ECONOMY or BUDGET_EXHAUSTED, from the session and current turn usage in `state`.
+    """
+    usage = state.get("usage") or {}
+    turn_totals = (usage.get("current_turn") or {}) if usage.get("turn") == _turn(state) else {}
+
+    spent = max(_spent(usage.get("session") or {}, settings.SESSION_TOKEN_BUDGET, settings.SESSION_COST_BUDGET),
+                _spent(turn_totals, settings.TURN_TOKEN_BUDGET, settings.TURN_COST_BUDGET))
+    if spent >= 1:
+        return BUDGET_EXHAUSTED
+    if spent >= settings.BUDGET_ECONOMY_RATIO:
+        return BUDGET_ECONOMY
+    return BUDGET_OK
+
+
+_budget_level: ContextVar[str] = ContextVar("configpilot_budget_level", default=BUDGET_OK)
+
+
+def current_budget_level() -> str:
+    """
+    Budget level of the running node, BUDGET_OK outside accounted nodes.
+    """
+    return _budget_level.get()
+
+
+class UsageLedger:
+    """
+    Process-wide usage per session and turn, kept for the most recent `max_turns` turns, with totals per model.
+    """
+
+    def __init__(self, max_turns: int = 10_000):
+        self.max_turns = max_turns
+        self.turns: "OrderedDict[Tuple[str, Optional[str]], Dict[str, float]]" = OrderedDict()
+        self.models: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, session: str, turn: Optional[str], update: Dict[str, Any]) -> None:
+        with self._lock:
+            key = (session, turn)
+            if key not in self.turns:
+                self.turns[key] = _totals()
+                if len(self.turns) > self.max_turns:
+                    self.turns.popitem(last=False)
+            _add(self.turns[key], update["session"])
+            for model_name, totals in update["models"].items():
+                _add(self.models.setdefault(model_name, _totals()), totals)
+
+    @staticmethod
+    def _distribution(values: List[float]) -> Dict[str, float]:
+        if not values:
+            return {}
+        values = sorted(values)
+        return {
+            "mean": round(statistics.fmean(values), 6),
+            "p50": round(values[len(values) // 2], 6),
+            "p95": round(values[min(len(values) - 1, int(len(values) * 0.95))], 6),
+            "max": round(values[-1], 6),
+        }
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            sessions: Dict[str, Dict[str, float]] = {}
+            for (session, _), totals in self.turns.items():
+                _add(sessions.setdefault(session, _totals()), totals)
+
+            turns = list(self.turns.values())
+            return {
+                "sessions": len(sessions),
+                "turns": len(turns),
+                "models": {model_name: dict(totals) for model_name, totals in sorted(self.models.items())},
+                "cost_per_turn_usd": self._distribution([totals["cost_usd"] for totals in turns]),
+                "tokens_per_turn": self._distribution([totals["input_tokens"] + totals["output_tokens"]
+                                                       for totals in turns]),
+                "calls_per_turn": self._distribution([totals["calls"] for totals in turns]),
+                "cost_per_session_usd": self._distribution([totals["cost_usd"] for totals in sessions.values()]),
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self.turns.clear()
+            self.models.clear()
+
+
+usage_ledger = UsageLedger()
+
+_current_usage: ContextVar[Optional[UsageRecorder]] = ContextVar("configpilot_usage_recorder", default=None)
+register_configure_hook(_current_usage, inheritable=True)
+
+# Routers cannot update the state, so the usage of their model calls is added by the next accounted node of the
+# turn, keyed by the turn
+_router_usage: "OrderedDict[Optional[str], Dict[str, Any]]" = OrderedDict()
+_router_usage_lock = threading.Lock()
+
+
+def _carry(turn: Optional[str], update: Dict[str, Any]) -> None:
+    with _router_usage_lock:
+        _router_usage[turn] = merge_metrics(_router_usage.get(turn), update)
+        while len(_router_usage) > 1024:
+            _router_usage.popitem(last=False)
+
+
+def _take(turn: Optional[str]) -> Optional[Dict[str, Any]]:
+    with _router_usage_lock:
+        return _router_usage.pop(turn, None)
+
+
+def _start(state):
+    recorder = UsageRecorder()
+    level = budget_level(state) if budgets_enabled() else BUDGET_OK
+    return recorder, (_current_usage.set(recorder), _budget_level.set(level))
+
+
+def _stop(tokens) -> None:
+    usage_token, level_token = tokens
+    _current_usage.reset(usage_token)
+    _budget_level.reset(level_token)
+
+
+def _finish(recorder: UsageRecorder, state, config, result: Any) -> Any:
+    turn = _turn(state)
+    update = recorder.update(turn)
+    if update is not None:
+        usage_ledger.record(_session(state, config), turn, update)
+
+    if not isinstance(result, dict):
+        if update is not None:
+            _carry(turn, update)
+        return result
+
+    carried = _take(turn)
+    if carried is not None:
+        update = merge_metrics(carried, update)
+    return result if update is None else {**result, "usage": update}
+
+
+def accounted(func: Callable, name: Optional[str] = None) -> Callable:
+    """
+    Wraps a node or router so the tokens and cost of its model calls are accounted into the `usage` state key and
+    `usage_ledger`, and the budget level of the session is available to the chains through
+    `current_budget_level`.
+    """
+    name = name or func.__name__
+    pass_config = _accepts_config(func)
+
+    # Same as `instrumented`: no `functools.wraps`, so LangGraph still sees the `config` parameter
+    if inspect.iscoroutinefunction(func):
+        async def async_wrapper(state, config=None):
+            recorder, tokens = _start(state)
+            try:
+                result = await (func(state, config) if pass_config else func(state))
+            finally:
+                _stop(tokens)
+            return _finish(recorder, state, config, result)
+
+        async_wrapper.__name__ = name
+        return async_wrapper
+
+    def wrapper(state, config=None):
+        recorder, tokens = _start(state)
+        try:
+            result = func(state, config) if pass_config else func(state)
+        finally:
+            _stop(tokens)
+        return _finish(recorder, state, config, result)
+
+    wrapper.__name__ = name
+    return wrapper
@@ -1,9 +1,77 @@
+import argparse
+import time
+
 from langchain_core.messages import HumanMessage
 
-from configpilot import graph
+import settings
+from chains.llm import REPLY_TAG
+from configpilot import get_graph
+from storage.characters import load_session
 
 
-if __name__ == "__main__":
+def turn_input(user_input: str, session_id: str = None, resume: bool = False) -> dict:
+    """
+    Graph input of one turn. With `session_id` the character is persisted to that session, and with `resume`
+    the turn starts from the character stored for it.
+    """
+    state = {"messages": [HumanMessage(content=user_input)]}
+    if session_id:
+        state.update(load_session(session_id) if resume else {"session_id": session_id})
+    return state
+
+
+def stream_turn(user_input: str, config: dict = None, session_id: str = None, resume: bool = False) -> dict:
+    """
+    Runs one turn with `stream_mode="messages"`, printing the reply tokens as they arrive, and returns the
+    time to first token and total latency in seconds.
+    """
+    start = time.perf_counter()
+    first_token = None
+
+    for chunk, metadata in get_graph().stream(turn_input(user_input, session_id, resume), config,
+                                              stream_mode="messages"):
+        if REPLY_TAG not in metadata.get("tags", []) or not chunk.content:
+            continue
+        if first_token is None:
+            first_token = time.perf_counter() - start
+        print(chunk.content, end="", flush=True)
+
+    total = time.perf_counter() - start
+    print()
+    return {"ttft": first_token, "total": total}
+
 
-    messages = [HumanMessage(content="el personaje de anime se llama Brais tiene 14 años")]
-    print(graph.invoke({"messages": messages}))
+def main():
+    parser = argparse.ArgumentParser(description="Run ConfigPilot turns from the command line.")
+    parser.add_argument("message", nargs="?", default="el personaje de anime se llama Brais tiene 14 años")
+    parser.add_argument("--stream", action="store_true",
+                        help="chat interactively, printing reply tokens as they arrive with per-turn latency")
+    parser.add_argument("--thread-id", help="conversation thread, when a checkpointer is configured")
+    parser.add_argument("--session-id",
+                        help="resume the character stored for this session and keep saving to it; also the default "
+                             "thread id")
+    args = parser.parse_args()
+
+    thread_id = args.thread_id or args.session_id
+    config = {"configurable": {"thread_id": thread_id}} if thread_id else None
+
+    if not args.stream:
+        print(get_graph().invoke(turn_input(args.message, args.session_id, resume=True), config))
+        return
+
+    # Without a checkpointer nothing carries the character between turns, so every turn resumes it from storage
+    resume = True
+    user_input = args.message
+    while user_input:
+        timings = stream_turn(user_input, config, args.session_id, resume)
+        resume = not settings.CHECKPOINTER
+        ttft = f"{timings['ttft']:.3f}s" if timings["ttft"] is not None else "n/a"
+        print(f"[ttft {ttft} | total {timings['total']:.3f}s]")
+        try:
+            user_input = input("> ").strip()
+        except EOFError:
+            break
+
+
+if __name__ == "__main__":
+    main()
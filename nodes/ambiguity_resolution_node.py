@@ -1,15 +1,23 @@
-from chains.ambiguity_resolution import generate_response
+from chains.ambiguity_resolution import generate_response, agenerate_response
+from nodes.history_node import compact_message
 from state import GraphState
 
 
 def ambiguity_resolution(state: GraphState):
 
-    user_input = state["messages"][-1]
+    user_input = state["messages"][-1].content
     reason = state["relevance_reflector"]["reasoning"]
 
-    response = [generate_response(user_input, reason)]
+    response = generate_response(user_input, reason, state.get("history_summary", ""))
 
-    messages = state["messages"] + response
+    return {"messages": [compact_message(response)]}
 
-    return {"messages": messages}
 
+async def aambiguity_resolution(state: GraphState):
+
+    user_input = state["messages"][-1].content
+    reason = state["relevance_reflector"]["reasoning"]
+
+    response = await agenerate_response(user_input, reason, state.get("history_summary", ""))
+
+    return {"messages": [compact_message(response)]}
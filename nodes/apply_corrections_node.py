@@ -0,0 +1,37 @@
+import logging
+
+from pydantic import ValidationError
+
+from state import GraphState, AnimeCharacter
+
+
+logger = logging.getLogger(__name__)
+
+
+def apply_corrections(state: GraphState):
+    """
+    Merges the reflection's suggested corrections straight into `anime_character`, instead of running the
+    field mapper again. Corrections for unknown fields or with values that do not validate against
+    `AnimeCharacter` are dropped.
+    """
+    corrections = state["reflection_feedback"]["suggested_corrections"]
+    anime_character = dict(state.get("anime_character", {}))
+    changed_fields = []
+
+    for field, value in corrections.items():
+        if field not in AnimeCharacter.model_fields:
+            logger.info("Ignoring correction for unknown field: %s", field)
+            continue
+
+        try:
+            validated = AnimeCharacter.model_validate({field: value})
+        except ValidationError:
+            logger.info("Ignoring invalid correction for %s: %r", field, value)
+            continue
+
+        anime_character[field] = getattr(validated, field)
+        changed_fields.append(field)
+
+    # The next reflection pass, if any, only needs to re-check the corrected fields. They come from the reflection,
+    # not from an extraction, so that pass does not re-run the field mapper over them
+    return {"anime_character": anime_character, "changed_fields": changed_fields, "extraction_model": ""}
@@ -0,0 +1,22 @@
+from typing import Any, Dict
+
+from langchain_core.messages import AIMessage
+
+from state import ANIME_CHARACTER, GraphState
+
+
+def budget_exhausted(state: GraphState) -> Dict[str, Any]:
+    """
+    Reply of a turn that starts with the session budget spent: the `non_field_guidance` redirection, built from
+    the schema without any model call. It asks for the first field that has no value yet.
+    """
+    anime_character = state.get("anime_character") or {}
+    missing_fields = [field for field in ANIME_CHARACTER.fields if anime_character.get(field) is None]
+
+    if missing_fields:
+        description = ANIME_CHARACTER.properties[missing_fields[0]].get("description", missing_fields[0])
+        reply = f"Let's keep building your anime character. Could you tell me the {description.lower()}?"
+    else:
+        reply = "Your anime character has every field filled in. Tell me if you want to change any of them."
+
+    return {"messages": [AIMessage(content=reply)]}
@@ -0,0 +1,29 @@
+from chains.classifier import classify_input, aclassify_input
+from schemas.field_index import relevant_fields
+from state import ANIME_CHARACTER, GraphState
+
+
+def _classifier_update(result):
+    return {
+        "classifier": {
+            "related_with_fields": result.related_with_fields
+        }
+    }
+
+
+def classifier_node(state: GraphState):
+
+    user_input = state["messages"][-1].content
+
+    result = classify_input(user_input, relevant_fields(ANIME_CHARACTER, user_input))
+
+    return _classifier_update(result)
+
+
+async def aclassifier_node(state: GraphState):
+
+    user_input = state["messages"][-1].content
+
+    result = await aclassify_input(user_input, relevant_fields(ANIME_CHARACTER, user_input))
+
+    return _classifier_update(result)
@@ -1,9 +1,10 @@
-from chains.creator_assistant import creation_message
+from chains.creator_assistant import creation_message, acreation_message
+from nodes.history_node import compact_message
 from state import GraphState
 import json
 
 
-def creator_assistant_node(state: GraphState):
+def _creation_fields(state: GraphState):
     # `confirmations` is a list of field names that were just updated
     new_fields_keys = state["reflection_feedback"]["confirmations"]
     current_fields = state["anime_character"]
@@ -15,6 +16,16 @@ def creator_assistant_node(state: GraphState):
     new_fields_str = json.dumps(new_fields_dict, ensure_ascii=False, indent=2)
     current_fields_str = json.dumps(current_fields, ensure_ascii=False, indent=2)
 
-    response = creation_message(new_fields_str, current_fields_str)
+    return new_fields_str, current_fields_str
+
+
+def creator_assistant_node(state: GraphState):
+    response = creation_message(*_creation_fields(state), state.get("history_summary", ""))
+
+    return {"messages": [compact_message(response)]}
+
+
+async def acreator_assistant_node(state: GraphState):
+    response = await acreation_message(*_creation_fields(state), state.get("history_summary", ""))
 
-    return {"messages": response}
+    return {"messages": [compact_message(response)]}
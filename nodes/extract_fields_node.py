@@ -1,11 +1,33 @@
-from chains.field_mapper import map_fields
-from state import GraphState
+import settings
+from chains.field_mapper import map_fields_with_model, amap_fields_with_model
+from extractors.field_cues import fields_touched
+from schemas.field_index import relevant_fields
+from state import ANIME_CHARACTER, GraphState, AnimeCharacter
 
 
-def extract_fields(state: GraphState):
-    user_input = state["messages"][-1]
+def _requested_fields(state: GraphState, user_input: str):
+    """
+    Requests only the fields retrieved as relevant to the message, for large schemas. In incremental mode,
+    requests only the fields that are not confirmed yet or that the message plausibly touches. Returns None to
+    request every field.
+    """
+    candidate_fields = relevant_fields(ANIME_CHARACTER, user_input)
+    if candidate_fields is not None:
+        return list(candidate_fields)
+
+    if not settings.INCREMENTAL_EXTRACTION:
+        return None
+
+    confirmed_fields = state.get("field_turns", {})
+    touched_fields = fields_touched(user_input)
+
+    requested_fields = [field for field in AnimeCharacter.model_fields
+                        if field not in confirmed_fields or field in touched_fields]
 
-    mapped_fields = map_fields(user_input)
+    return requested_fields or None
+
+
+def _merge_fields(state: GraphState, mapped_fields: AnimeCharacter, model_name: str = ""):
     new_fields = mapped_fields.model_dump(exclude_none=True)
 
     # Get any previously extracted character fields
@@ -14,4 +36,60 @@ def extract_fields(state: GraphState):
     # Merge the old and new fields, where new fields overwrite old ones if they conflict
     merged_character = {**existing_character, **new_fields}
 
-    return {"anime_character": merged_character}
+    changed_fields = [field for field, value in new_fields.items() if existing_character.get(field) != value]
+
+    # A fresh extraction starts a new round of reflection, which may re-run it on a higher tier than `model_name`
+    return {"anime_character": merged_character, "changed_fields": changed_fields, "reflection_iterations": 0,
+            "extraction_model": model_name}
+
+
+def extract_fields(state: GraphState):
+    user_input = state["messages"][-1].content
+
+    return _merge_fields(state, *map_fields_with_model(user_input, _requested_fields(state, user_input),
+                                                       state.get("history_summary", "")))
+
+
+async def aextract_fields(state: GraphState):
+    user_input = state["messages"][-1].content
+
+    return _merge_fields(state, *await amap_fields_with_model(user_input, _requested_fields(state, user_input),
+                                                              state.get("history_summary", "")))
+
+
+def speculative_extract_fields(state: GraphState):
+    # Runs alongside the classifier and relevance reflector; merged later by `commit_speculative_fields`
+    user_input = state["messages"][-1].content
+
+    mapped_fields, model_name = map_fields_with_model(user_input, _requested_fields(state, user_input),
+                                                      state.get("history_summary", ""))
+
+    return {"speculative_character": mapped_fields.model_dump(exclude_none=True), "extraction_model": model_name}
+
+
+async def aspeculative_extract_fields(state: GraphState):
+    user_input = state["messages"][-1].content
+
+    mapped_fields, model_name = await amap_fields_with_model(user_input, _requested_fields(state, user_input),
+                                                             state.get("history_summary", ""))
+
+    return {"speculative_character": mapped_fields.model_dump(exclude_none=True), "extraction_model": model_name}
+
+
+def commit_speculative_fields(state: GraphState):
+    """
+    Joins the speculative fan-out: keeps the extraction only when the input is related and stable,
+    otherwise the speculative result is discarded.
+    """
+    speculative_character = state.get("speculative_character", {})
+
+    update = {"speculative_character": {}}
+
+    is_related = state["classifier"]["related_with_fields"]
+    is_stable = state["relevance_reflector"]["input_type"] == "stable"
+
+    if is_related and is_stable:
+        update.update(_merge_fields(state, AnimeCharacter.model_validate(speculative_character),
+                                    state.get("extraction_model", "")))
+
+    return update
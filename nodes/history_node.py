@@ -0,0 +1,63 @@
+from typing import Any, Dict, List
+
+from langchain_core.messages import BaseMessage, RemoveMessage
+
+import settings
+from chains.history_summarizer import summarize_history, asummarize_history
+from state import GraphState
+
+
+def compact_message(message: BaseMessage) -> BaseMessage:
+    """
+    Drops the provider `response_metadata` (model fingerprint, log probabilities, etc.) from a response before it
+    is stored in the conversation history.
+    """
+    if not settings.HISTORY_STRIP_METADATA or not message.response_metadata:
+        return message
+    return message.model_copy(update={"response_metadata": {}})
+
+
+def _expired_messages(messages: List[BaseMessage], max_turns: int) -> List[BaseMessage]:
+    # A turn starts at a user message; everything before the `max_turns`-th last one has expired
+    human_indexes = [index for index, message in enumerate(messages) if message.type == "human"]
+    if not max_turns or len(human_indexes) <= max_turns:
+        return []
+    return messages[:human_indexes[-max_turns]]
+
+
+def _compaction(state: GraphState, expired: List[BaseMessage], summary: str) -> Dict[str, Any]:
+    # The dropped turns are counted so `current_turn` keeps counting past the history window
+    dropped_turns = sum(1 for message in expired if message.type == "human")
+    update = {"messages": [RemoveMessage(id=message.id) for message in expired],
+              "compacted_turns": state.get("compacted_turns", 0) + dropped_turns}
+    if summary is not None:
+        update["history_summary"] = summary
+    return update
+
+
+def compact_history(state: GraphState, max_turns: int = None) -> Dict[str, Any]:
+    """
+    Keeps the last `max_turns` turns (default `HISTORY_MAX_TURNS`) in `messages` and, with `HISTORY_SUMMARIZE`,
+    rolls older turns into `history_summary`, so the state stays the same size as the session grows.
+    """
+    expired = _expired_messages(state["messages"], max_turns or settings.HISTORY_MAX_TURNS)
+    if not expired:
+        return {}
+
+    summary = None
+    if settings.HISTORY_SUMMARIZE:
+        summary = summarize_history(state.get("history_summary", ""), expired)
+
+    return _compaction(state, expired, summary)
+
+
+async def acompact_history(state: GraphState, max_turns: int = None) -> Dict[str, Any]:
+    expired = _expired_messages(state["messages"], max_turns or settings.HISTORY_MAX_TURNS)
+    if not expired:
+        return {}
+
+    summary = None
+    if settings.HISTORY_SUMMARIZE:
+        summary = await asummarize_history(state.get("history_summary", ""), expired)
+
+    return _compaction(state, expired, summary)
@@ -1,15 +1,31 @@
+import logging
 from typing import Dict, Any
 
-from chains.non_field_guidance import provide_related_info
+from chains.non_field_guidance import provide_related_info, aprovide_related_info
+from nodes.history_node import compact_message
 from state import GraphState
 
 
+logger = logging.getLogger(__name__)
+
+
 def non_field_guidance(state: GraphState) -> Dict[str, Any]:
 
-    print("---NON FIELD GUIDANCE---")
-    last_user_message = state["messages"][-1]
+    logger.debug("---NON FIELD GUIDANCE---")
+    last_user_message = state["messages"][-1].content
+
+    related_info = provide_related_info(last_user_message, state.get("history_summary", ""))
+
+    # The `add_messages` reducer appends, so only the new message is returned
+    return {"messages": [compact_message(related_info)]}
+
+
+async def anon_field_guidance(state: GraphState) -> Dict[str, Any]:
+
+    logger.debug("---NON FIELD GUIDANCE---")
+    last_user_message = state["messages"][-1].content
 
-    related_info = [provide_related_info(last_user_message)]
-    messages = state["messages"] + related_info
+    related_info = await aprovide_related_info(last_user_message, state.get("history_summary", ""))
 
-    return {"messages": messages}
+    # The `add_messages` reducer appends, so only the new message is returned
+    return {"messages": [compact_message(related_info)]}
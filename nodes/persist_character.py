@@ -1,59 +1,56 @@
+import asyncio
+import logging
+
+from langchain_core.runnables import RunnableConfig
+
+import settings
 from state import GraphState
-import psycopg2
+from storage.characters import changed_columns, character_record, insert_character, upsert_character
+from storage.write_behind import get_write_behind_queue
+
+
+logger = logging.getLogger(__name__)
+
+
+def _session_id(state: GraphState, config: RunnableConfig = None):
+    # Checkpointed threads persist under their thread id unless the state names a session explicitly
+    if state.get("session_id"):
+        return state["session_id"]
+    return ((config or {}).get("configurable") or {}).get("thread_id")
+
 
-def persist_character_fields(state: GraphState):
+def persist_character_fields(state: GraphState, config: RunnableConfig = None):
     # Extract the anime_character data from the state
-    anime_character = state.get("anime_character", {})
-
-    name = anime_character.get("name")
-    age = anime_character.get("age")
-    gender = anime_character.get("gender")
-    physical_appearance = anime_character.get("physical_appearance")
-    personality = anime_character.get("personality")
-    abilities_power = anime_character.get("abilities_power")
-    occupation = anime_character.get("occupation")
-
-    # Connect to the PostgreSQL database
-    conn = psycopg2.connect(
-        host="langgraph-postgres",
-        port="5432",
-        database="my_characters",
-        user="postgres",
-        password="postgres"
-    )
+    record = character_record(state.get("anime_character", {}))
+
+    session_id = _session_id(state, config)
+    changes = changed_columns(record, state.get("persisted_character", {}))
+
+    # Nothing changed since the last persisted snapshot of this session
+    if session_id and not changes:
+        return {"persisted": True}
+
+    if settings.WRITE_BEHIND:
+        # The record is written by the background batch writer; the turn does not wait for the database
+        get_write_behind_queue().put({**record, "session_id": session_id})
+        return {"persisted": True, "persisted_character": record}
 
     try:
-        with conn:
-            with conn.cursor() as cur:
-                # Create the table if it doesn't exist
-                create_table_query = """
-                CREATE TABLE IF NOT EXISTS anime_characters (
-                    id SERIAL PRIMARY KEY,
-                    name TEXT,
-                    age INT,
-                    gender TEXT,
-                    physical_appearance TEXT,
-                    personality TEXT,
-                    abilities_power TEXT,
-                    occupation TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                );
-                """
-                cur.execute(create_table_query)
-
-                insert_query = """
-                    INSERT INTO anime_characters
-                    (name, age, gender, physical_appearance, personality, abilities_power, occupation)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s)
-                """
-                cur.execute(
-                    insert_query,
-                    (name, age, gender, physical_appearance, personality, abilities_power, occupation)
-                )
-    except Exception as e:
-        print(f"Error inserting character: {e}")
-    finally:
-        conn.close()
+        if session_id:
+            upsert_character(session_id, changes)
+        else:
+            insert_character(record)
+    except Exception:
+        logger.exception("Error persisting character")
+        return {"persisted": False}
 
     # Return a dictionary indicating persistence success
-    return {"persisted": True}
+    return {"persisted": True, "persisted_character": record}
+
+
+async def apersist_character_fields(state: GraphState, config: RunnableConfig = None):
+    if settings.WRITE_BEHIND:
+        return persist_character_fields(state, config)
+
+    # psycopg2 is blocking, so run the insert in the default executor to keep the event loop free
+    return await asyncio.to_thread(persist_character_fields, state, config)
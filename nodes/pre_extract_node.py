@@ -0,0 +1,28 @@
+from extractors import run_pre_extractors
+from state import GraphState, ReflectionFeedback, current_turn
+
+
+def pre_extract(state: GraphState):
+    """
+    Deterministic fast path ahead of the LLM classifier. Confident matches are merged into `anime_character`
+    together with a synthesized reflection, so the turn can skip classifier, reflector, mapper and reflection.
+    """
+    user_input = state["messages"][-1].content
+
+    result = run_pre_extractors(user_input)
+
+    update = {"pre_extraction": {"hit": result.confident, "extractor": result.extractor,
+                                 "fields": list(result.fields)}}
+
+    if result.confident:
+        existing_character = state.get("anime_character", {})
+        update["anime_character"] = {**existing_character, **result.fields}
+        update["changed_fields"] = list(result.fields)
+        update["field_turns"] = {**state.get("field_turns", {}),
+                                 **{field: current_turn(state) for field in result.fields}}
+        update["reflection_feedback"] = ReflectionFeedback(
+            correctness_summary=f"Fields matched deterministically by the '{result.extractor}' pre-extractor.",
+            confirmations=list(result.fields),
+        ).model_dump()
+
+    return update
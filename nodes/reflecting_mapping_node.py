@@ -1,21 +1,153 @@
-from chains.reflection_mapper import reflect_on_extraction
-from state import GraphState
-from state import AnimeCharacter
+import settings
+from chains.field_mapper import aremap_fields, remap_fields
+from chains.reflection_mapper import reflect_on_extraction, areflect_on_extraction, uncertain_reflection
+from extractors.verifier import verify_fields
+from instrumentation.usage import BUDGET_EXHAUSTED, current_budget_level
+from schemas.field_index import relevant_fields
+from state import ANIME_CHARACTER, GraphState, current_turn
+from state import AnimeCharacter, ReflectionFeedback
 from pydantic import ValidationError
 
 
-def reflect_mapping(state: GraphState):
-
-    user_input = state["messages"][-1]
+def _validated_character(state: GraphState) -> AnimeCharacter:
 
     anime_character_dict = state["anime_character"]
 
     try:
-        anime_character = AnimeCharacter.model_validate(anime_character_dict)
+        return AnimeCharacter.model_validate(anime_character_dict)
     except ValidationError as e:
         raise ValueError(f"Invalid AnimeCharacter data: {e}")
 
-    reflection = reflect_on_extraction(user_input, anime_character)
+
+def _reflected_fields(state: GraphState, user_input: str):
+    # In incremental mode only the fields that changed this turn are checked
+    if settings.INCREMENTAL_EXTRACTION:
+        return state.get("changed_fields", [])
+
+    # For large schemas, the fields relevant to the message plus any field changed this turn
+    candidate_fields = relevant_fields(ANIME_CHARACTER, user_input)
+    if candidate_fields is None:
+        return None
+    changed_fields = state.get("changed_fields", [])
+    return [field for field in AnimeCharacter.model_fields if field in candidate_fields or field in changed_fields]
+
+
+def _reflection_update(state: GraphState, reflection):
+    confirmed_fields = [field for field in reflection.confirmations if field in AnimeCharacter.model_fields]
+    turn = current_turn(state)
+
+    return {
+        "reflection_feedback": reflection.model_dump(),
+        "reflection_iterations": state.get("reflection_iterations", 0) + 1,
+        "field_turns": {**state.get("field_turns", {}), **{field: turn for field in confirmed_fields}}
+    }
+
+
+def _unchanged_reflection():
+    return ReflectionFeedback(correctness_summary="No fields changed in this turn, nothing to verify.")
+
+
+def _local_verification(state: GraphState, user_input: str, fields):
+    """
+    Runs the deterministic verifier over the fields to reflect on. Returns the locally verified fields and the
+    fields left for the reflection model, or no verified fields when local verification is off.
+    """
+    if not settings.LOCAL_VERIFICATION:
+        return [], fields
+
+    return verify_fields(user_input, state["anime_character"], fields, state.get("changed_fields", []))
+
+
+def _verified_reflection(verified, reflection=None):
+    # Fields verified locally are confirmed alongside the model's own confirmations, if the model ran at all
+    if reflection is None:
+        return ReflectionFeedback(correctness_summary="The extracted fields were verified locally against the input.",
+                                  confirmations=verified)
+
+    confirmations = reflection.confirmations + [field for field in verified if field not in reflection.confirmations]
+    return reflection.model_copy(update={"confirmations": confirmations})
+
+
+def _unreflected(verified, fields):
+    # With the budget spent, the extraction is kept without asking the reflection model
+    unverified = list(AnimeCharacter.model_fields) if fields is None else fields
+    return ReflectionFeedback(correctness_summary="Reflection skipped: the token budget is spent.",
+                              notes=[f"{field} was not verified" for field in unverified if field not in verified],
+                              confirmations=verified + [field for field in unverified if field not in verified])
+
+
+def _remapped(state: GraphState, remapped) -> dict:
+    # Values the top tier extracted differently replace the cheaper tier's and count as changed this turn
+    if remapped is None:
+        return {}
+
+    remapped_character, model_name = remapped
+    character = state["anime_character"]
+    new_fields = {field: value for field, value in remapped_character.model_dump(exclude_none=True).items()
+                  if character.get(field) != value}
+    if not new_fields:
+        return {"extraction_model": model_name}
+
+    changed_fields = state.get("changed_fields", [])
+    return {"anime_character": {**character, **new_fields}, "extraction_model": model_name,
+            "changed_fields": changed_fields + [field for field in new_fields if field not in changed_fields]}
+
+
+def reflect_mapping(state: GraphState):
+
+    user_input = state["messages"][-1].content
+    fields = _reflected_fields(state, user_input)
+
+    if fields == []:
+        return _reflection_update(state, _unchanged_reflection())
+
+    verified, fields = _local_verification(state, user_input, fields)
+    if fields == []:
+        return _reflection_update(state, _verified_reflection(verified) if verified else _unchanged_reflection())
+    if current_budget_level() == BUDGET_EXHAUSTED:
+        return _reflection_update(state, _unreflected(verified, fields))
+
+    reflection = reflect_on_extraction(user_input, _validated_character(state), fields)
+
+    # With model tiering, an extraction of a lower tier the reflection doubts is re-run on the top tier and checked
+    # again
+    remapped = {}
+    reason = uncertain_reflection(reflection)
+    if reason is not None:
+        remapped = _remapped(state, remap_fields(user_input, fields, state.get("history_summary", ""), reason,
+                                                 state.get("extraction_model", "")))
+        if "anime_character" in remapped:
+            reflection = reflect_on_extraction(user_input, AnimeCharacter.model_validate(remapped["anime_character"]),
+                                               fields)
 
     # Return the reflection feedback in the desired format
-    return {"reflection_feedback": reflection.model_dump()}
+    return {**_reflection_update(state, _verified_reflection(verified, reflection)), **remapped}
+
+
+async def areflect_mapping(state: GraphState):
+
+    user_input = state["messages"][-1].content
+    fields = _reflected_fields(state, user_input)
+
+    if fields == []:
+        return _reflection_update(state, _unchanged_reflection())
+
+    verified, fields = _local_verification(state, user_input, fields)
+    if fields == []:
+        return _reflection_update(state, _verified_reflection(verified) if verified else _unchanged_reflection())
+    if current_budget_level() == BUDGET_EXHAUSTED:
+        return _reflection_update(state, _unreflected(verified, fields))
+
+    reflection = await areflect_on_extraction(user_input, _validated_character(state), fields)
+
+    remapped = {}
+    reason = uncertain_reflection(reflection)
+    if reason is not None:
+        remapped = _remapped(state, await aremap_fields(user_input, fields, state.get("history_summary", ""), reason,
+                                                        state.get("extraction_model", "")))
+        if "anime_character" in remapped:
+            reflection = await areflect_on_extraction(
+                user_input, AnimeCharacter.model_validate(remapped["anime_character"]), fields
+            )
+
+    return {**_reflection_update(state, _verified_reflection(verified, reflection)), **remapped}
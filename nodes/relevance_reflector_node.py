@@ -1,13 +1,8 @@
-from chains.relevance_reflector import relevance_reflector
+from chains.relevance_reflector import relevance_reflector, arelevance_reflector
 from state import GraphState
 
 
-def relevance_reflector_node(state: GraphState):
-
-    user_input = state["messages"][-1]
-
-    result = relevance_reflector(user_input)
-
+def _relevance_update(result):
     return {
         "relevance_reflector": {
             "input_type": result.input_type,
@@ -16,3 +11,19 @@ def relevance_reflector_node(state: GraphState):
     }
 
 
+def relevance_reflector_node(state: GraphState):
+
+    user_input = state["messages"][-1].content
+
+    result = relevance_reflector(user_input)
+
+    return _relevance_update(result)
+
+
+async def arelevance_reflector_node(state: GraphState):
+
+    user_input = state["messages"][-1].content
+
+    result = await arelevance_reflector(user_input)
+
+    return _relevance_update(result)
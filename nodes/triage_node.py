@@ -0,0 +1,40 @@
+import settings
+from chains.triage import triage_input, atriage_input
+from state import GraphState
+
+
+def _triage_update(result):
+    # Mirrors the classifier and relevance reflector keys so downstream nodes work unchanged
+    update = {
+        "triage": result.model_dump(),
+        "classifier": {
+            "related_with_fields": result.related_with_fields
+        },
+        "relevance_reflector": {
+            "input_type": result.input_type,
+            "reasoning": result.reasoning
+        }
+    }
+
+    if hasattr(result, "extracted_fields"):
+        update["speculative_character"] = result.extracted_fields.model_dump(exclude_none=True)
+
+    return update
+
+
+def triage_node(state: GraphState):
+
+    user_input = state["messages"][-1].content
+
+    result = triage_input(user_input, extract_fields=settings.TRIAGE_EXTRACTS_FIELDS)
+
+    return _triage_update(result)
+
+
+async def atriage_node(state: GraphState):
+
+    user_input = state["messages"][-1].content
+
+    result = await atriage_input(user_input, extract_fields=settings.TRIAGE_EXTRACTS_FIELDS)
+
+    return _triage_update(result)
@@ -0,0 +1,8 @@
+from schemas.registry import (
+    CompiledSchema,
+    compile_schema,
+    get_schema,
+    load_schema,
+    register_schema,
+    schema_hash,
+)
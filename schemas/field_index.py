@@ -0,0 +1,109 @@
+import math
+import re
+import unicodedata
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import settings
+
+try:
+    import numpy as np
+except ImportError:
+    # Scoring falls back to the postings lists
+    np = None
+
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+# Tokens are also indexed by their prefix, a cheap stemmer that matches "personality" with "personalidad"
+PREFIX_LENGTH = 5
+K1 = 1.2
+B = 0.75
+# Matches scoring below this fraction of the best match are noise from terms shared by most fields
+MIN_RELATIVE_SCORE = 0.1
+
+
+def tokenize(text: str) -> List[str]:
+    text = unicodedata.normalize("NFKD", text.casefold())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+
+    tokens = []
+    for token in _TOKEN.findall(text):
+        tokens.append(token)
+        if len(token) > PREFIX_LENGTH:
+            tokens.append(token[:PREFIX_LENGTH] + "*")
+    return tokens
+
+
+class FieldIndex:
+    """
+    Okapi BM25 index with one document per field (its name, description and aliases). Term weights are
+    computed once, so scoring a message is a lookup per query term; with NumPy it is a single column sum over a
+    dense field x term matrix.
+    """
+
+    def __init__(self, documents: Dict[str, Sequence[str]]):
+        self.fields: Tuple[str, ...] = tuple(documents)
+        term_counts = [Counter(tokenize(" ".join(texts))) for texts in documents.values()]
+
+        lengths = [sum(counts.values()) for counts in term_counts]
+        average_length = sum(lengths) / len(lengths) if lengths else 0.0
+        document_frequency = Counter(term for counts in term_counts for term in counts)
+        field_count = len(self.fields)
+
+        self.vocabulary: Dict[str, int] = {term: index for index, term in enumerate(document_frequency)}
+        # term -> [(field index, BM25 weight)]
+        self.postings: Dict[str, List[Tuple[int, float]]] = {}
+
+        for field_index, (counts, length) in enumerate(zip(term_counts, lengths)):
+            norm = K1 * (1 - B + B * length / average_length) if average_length else K1
+            for term, frequency in counts.items():
+                idf = math.log(1 + (field_count - document_frequency[term] + 0.5) / (document_frequency[term] + 0.5))
+                weight = idf * frequency * (K1 + 1) / (frequency + norm)
+                self.postings.setdefault(term, []).append((field_index, weight))
+
+        self.weights = None
+        if np is not None:
+            self.weights = np.zeros((field_count, len(self.vocabulary)), dtype=np.float32)
+            for term, postings in self.postings.items():
+                for field_index, weight in postings:
+                    self.weights[field_index, self.vocabulary[term]] = weight
+
+    def scores(self, text: str) -> List[float]:
+        terms = set(tokenize(text))
+
+        if self.weights is not None:
+            columns = [self.vocabulary[term] for term in terms if term in self.vocabulary]
+            return self.weights[:, columns].sum(axis=1).tolist()
+
+        scores = [0.0] * len(self.fields)
+        for term in terms:
+            for field_index, weight in self.postings.get(term, ()):
+                scores[field_index] += weight
+        return scores
+
+    def top_k(self, text: str, k: int) -> List[Tuple[str, float]]:
+        """
+        The `k` best matching fields with a positive score, best first.
+        """
+        ranked = sorted(zip(self.fields, self.scores(text)), key=lambda item: item[1], reverse=True)
+        return [(field, score) for field, score in ranked[:k] if score > 0]
+
+
+@lru_cache(maxsize=1024)
+def _matching_fields(schema, text: str, k: int) -> Tuple[str, ...]:
+    ranked = schema.field_index.top_k(text, k)
+    matches = {field for field, score in ranked if score >= ranked[0][1] * MIN_RELATIVE_SCORE}
+    return tuple(field for field in schema.fields if field in matches)
+
+
+def relevant_fields(schema, text: str) -> Optional[Tuple[str, ...]]:
+    """
+    Candidate fields of `schema` for a message, in declaration order, or None to use every field. All fields are
+    used when retrieval is off, when the schema is small enough to list in full, or when no field matches the
+    message (recall is too low to trust).
+    """
+    if not settings.FIELD_RETRIEVAL or len(schema.fields) <= settings.FIELD_RETRIEVAL_MIN_FIELDS:
+        return None
+
+    return _matching_fields(schema, text, settings.FIELD_RETRIEVAL_TOP_K) or None
@@ -0,0 +1,237 @@
+import hashlib
+import json
+import os
+import threading
+from typing import Annotated, Any, Dict, Literal, Optional, Sequence, Tuple, Type
+
+from pydantic import AfterValidator, BaseModel, Field, create_model
+
+
+SCHEMAS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# JSON Schema type -> (Python type, SQLite column type, Postgres column type)
+TYPES: Dict[str, Tuple[type, str, str]] = {
+    "string": (str, "TEXT", "TEXT"),
+    "integer": (int, "INTEGER", "INTEGER"),
+    "number": (float, "REAL", "DOUBLE PRECISION"),
+    "boolean": (bool, "INTEGER", "BOOLEAN"),
+}
+
+
+class CompiledSchema:
+    """
+    Everything derived from a config schema: the pydantic model used as structured output, prompt fragments,
+    storage columns and the graph state type.
+
+    Every field of the model is optional, since the assistant fills the config over several turns.
+    """
+
+    def __init__(self, spec: Dict[str, Any], schema_hash: str):
+        self.spec = spec
+        self.hash = schema_hash
+        self.name: str = spec["title"]
+        self.description: str = spec.get("description", "")
+        self.properties: Dict[str, Dict[str, Any]] = spec["properties"]
+        self.fields: Tuple[str, ...] = tuple(self.properties)
+        self.columns = self.fields
+
+        self.model: Type[BaseModel] = create_model(
+            self.name,
+            __doc__=self.description or None,
+            **{field: (Optional[self._python_type(prop)],
+                       Field(None, description=prop.get("description"), ge=prop.get("minimum"),
+                             le=prop.get("maximum")))
+               for field, prop in self.properties.items()}
+        )
+
+        self._subset_models: Dict[Tuple[str, ...], Type[BaseModel]] = {}
+        self._state_schema = None
+        self._field_index = None
+
+    @staticmethod
+    def _python_type(prop: Dict[str, Any]):
+        if "enum" in prop:
+            return Literal[tuple(prop["enum"])]
+        python_type = TYPES[prop.get("type", "string")][0]
+        if "maxLength" in prop:
+            # Strict structured outputs reject `maxLength` in the schema sent to the model, so it is checked once
+            # the output is parsed instead
+            return Annotated[python_type, AfterValidator(_max_length(prop["maxLength"]))]
+        return python_type
+
+    def _type_label(self, field: str) -> str:
+        prop = self.properties[field]
+        if "enum" in prop:
+            return "one of: " + ", ".join(map(str, prop["enum"]))
+        return prop.get("type", "string")
+
+    def prompt_fields(self, indent: str = "    ", types: bool = True, fields: Optional[Sequence[str]] = None) -> str:
+        """
+        Bullet list of the fields for system prompts, e.g. "- age (integer)", restricted to `fields` if given.
+        Lines after the first are prefixed with `indent` so the fragment lines up inside an indented prompt string.
+        """
+        listed = self.fields if fields is None else [field for field in self.fields if field in fields]
+        lines = [f"- {field} ({self._type_label(field)})" if types else f"- {field}" for field in listed]
+        return f"\n{indent}".join(lines)
+
+    def subset_model(self, fields: Sequence[str]) -> Type[BaseModel]:
+        """
+        Output model restricted to `fields`, built once per field set. The full model is returned when every
+        field is requested.
+        """
+        key = tuple(field for field in self.fields if field in fields)
+        if key == self.fields:
+            return self.model
+
+        if key not in self._subset_models:
+            self._subset_models[key] = create_model(
+                self.name + "_" + "_".join(key),
+                __doc__=self.model.__doc__,
+                **{field: (self.model.model_fields[field].annotation, self.model.model_fields[field])
+                   for field in key}
+            )
+        return self._subset_models[key]
+
+    def column_types(self, dialect: str = "postgres") -> Dict[str, str]:
+        """
+        Storage column type of every field, for "postgres" or "sqlite".
+        """
+        index = 2 if dialect == "postgres" else 1
+        return {field: "TEXT" if "enum" in prop else TYPES[prop.get("type", "string")][index]
+                for field, prop in self.properties.items()}
+
+    def column_definitions(self, dialect: str = "postgres") -> str:
+        """
+        Column definitions of the storage table, for "postgres" or "sqlite".
+        """
+        return ", ".join(f"{field} {column_type}" for field, column_type in self.column_types(dialect).items())
+
+    def add_columns(self, table: str, dialect: str = "postgres", existing: Sequence[str] = ()) -> str:
+        """
+        Additive migration adding the schema's columns missing from `table`: `ADD COLUMN IF NOT EXISTS` for
+        Postgres, or one `ADD COLUMN` per field not in `existing` for SQLite, which has no `IF NOT EXISTS`.
+        Columns are never dropped or retyped, so rows written with an older schema keep their values.
+        """
+        if dialect == "postgres":
+            return "".join(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {field} {column_type};\n"
+                           for field, column_type in self.column_types(dialect).items())
+        return "".join(f"ALTER TABLE {table} ADD COLUMN {field} {column_type};\n"
+                       for field, column_type in self.column_types(dialect).items() if field not in existing)
+
+    @property
+    def field_index(self):
+        """
+        BM25 index over the field names, descriptions and `aliases`, built on first use.
+        """
+        if self._field_index is None:
+            from schemas.field_index import FieldIndex
+
+            self._field_index = FieldIndex({
+                field: [field.replace("_", " "), prop.get("description", ""), *prop.get("aliases", [])]
+                for field, prop in self.properties.items()
+            })
+        return self._field_index
+
+    @property
+    def state_schema(self):
+        """
+        `GraphState` with its `anime_character` record channel typed as this schema's model.
+        """
+        if self._state_schema is None:
+            from state import GraphState
+
+            # Calling the TypedDict metaclass directly keeps the MessagesState reducers of the base class
+            self._state_schema = type(GraphState)(
+                f"{self.name}State", (GraphState,),
+                {"__module__": __name__, "__annotations__": {"anime_character": self.model}}
+            )
+        return self._state_schema
+
+
+def _max_length(limit: int):
+    def check(value: str) -> str:
+        if len(value) > limit:
+            raise ValueError(f"at most {limit} characters are allowed")
+        return value
+
+    return check
+
+
+_compiled: Dict[str, CompiledSchema] = {}
+_registry: Dict[str, CompiledSchema] = {}
+_lock = threading.Lock()
+
+
+def _normalize_spec(spec: Dict[str, Any]) -> Dict[str, Any]:
+    # Short field specs ({"title": ..., "fields": {"age": "integer"}}) are turned into JSON Schema
+    if "properties" in spec:
+        return spec
+
+    properties = {}
+    for field, definition in spec.get("fields", {}).items():
+        properties[field] = {"type": definition} if isinstance(definition, str) else dict(definition)
+
+    normalized = {key: value for key, value in spec.items() if key != "fields"}
+    normalized.update(type="object", properties=properties)
+    return normalized
+
+
+def schema_hash(spec: Dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(spec, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def compile_schema(spec: Dict[str, Any]) -> CompiledSchema:
+    """
+    Compiles a JSON Schema object or short field spec. Compiled schemas are cached by the hash of the spec, so
+    loading the same definition again costs a hash and a lookup.
+    """
+    spec = _normalize_spec(spec)
+    if "title" not in spec:
+        raise ValueError("Schema needs a title, used as the model name")
+    for field, prop in spec["properties"].items():
+        if "enum" not in prop and prop.get("type", "string") not in TYPES:
+            raise ValueError(f"Unsupported type for field {field}: {prop.get('type')}")
+
+    key = schema_hash(spec)
+    with _lock:
+        if key not in _compiled:
+            _compiled[key] = CompiledSchema(spec, key)
+        return _compiled[key]
+
+
+def load_schema(path: str) -> CompiledSchema:
+    """
+    Loads and compiles a schema from a JSON or YAML file. YAML needs PyYAML.
+    """
+    with open(path, encoding="utf-8") as file:
+        if path.endswith((".yaml", ".yml")):
+            try:
+                import yaml
+            except ImportError as e:
+                raise ImportError("Loading YAML schemas requires PyYAML: pip install pyyaml") from e
+            spec = yaml.safe_load(file)
+        else:
+            spec = json.load(file)
+
+    return compile_schema(spec)
+
+
+def register_schema(name: str, schema: CompiledSchema) -> CompiledSchema:
+    _registry[name] = schema
+    return schema
+
+
+def get_schema(name: str) -> CompiledSchema:
+    """
+    Returns a registered schema, loading `schemas/<name>.json|yaml|yml` on first use.
+    """
+    if name not in _registry:
+        for extension in (".json", ".yaml", ".yml"):
+            path = os.path.join(SCHEMAS_DIR, name + extension)
+            if os.path.exists(path):
+                register_schema(name, load_schema(path))
+                break
+        else:
+            raise KeyError(f"Unknown schema: {name}")
+
+    return _registry[name]
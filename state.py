@@ -1,8 +1,12 @@
 from langgraph.graph import MessagesState
-from typing import Optional, Dict, Any, List
+from typing import Dict, Any, List, Annotated
 from pydantic import BaseModel, Field
 from typing import Literal
 
+from instrumentation.metrics import merge_metrics
+from instrumentation.usage import merge_usage
+from schemas import get_schema
+
 
 class Classifier(BaseModel):
     """
@@ -28,17 +32,27 @@ class RelevanceReflector(BaseModel):
     )
 
 
-class AnimeCharacter(BaseModel):
+class Triage(BaseModel):
     """
-    Represents an anime character with various attributes.
+    Combined classifier and relevance reflector decision from a single call.
     """
-    name: Optional[str] = Field(None, description="Name of the character")
-    age: Optional[int] = Field(None, description="Age of the character")
-    gender: Optional[str] = Field(None, description="Gender of the character")
-    physical_appearance: Optional[str] = Field(None, description="Physical appearance of the character")
-    personality: Optional[str] = Field(None, description="Personality of the character")
-    abilities_power: Optional[str] = Field(None, description="Abilities or power of the character")
-    occupation: Optional[str] = Field(None, description="Occupation of the character")
+    related_with_fields: Literal[True, False] = Field(
+        ...,
+        description="Indicates whether the user input is related to the provided JSON fields."
+    )
+    input_type: Literal["ambiguous", "misleading", "stable"] = Field(
+        ...,
+        description="Nature of the user input: ambiguous, misleading, or stable."
+    )
+    reasoning: str = Field(
+        ...,
+        description="Explanation of the input type and its validity."
+    )
+
+
+# Built from schemas/anime_character.json
+ANIME_CHARACTER = get_schema("anime_character")
+AnimeCharacter = ANIME_CHARACTER.model
 
 
 class ReflectionFeedback(BaseModel):
@@ -84,12 +98,50 @@ class GraphState(MessagesState):
         classifier: Determines the relevance of user input to the JSON fields.
         relevance_reflector: Assesses the nature and validity of the user input.
         reflection_feedback: Provides feedback on the extracted fields.
+        triage: Combined classifier and relevance reflector decision, when triage entry is enabled.
+        speculative_character: Fields extracted in parallel with classification, pending commit.
+        pre_extraction: Outcome of the deterministic pre-extraction stage for the last message.
+        reflection_iterations: Reflection passes run in the current turn.
+        changed_fields: Character fields whose value changed in the current turn.
+        extraction_model: Model tier that produced the extraction being reflected on; empty when its values came
+            from the reflection's corrections.
+        field_turns: Turn at which each character field was last confirmed.
+        session_id: Identifier of the session's character row; when set, persistence upserts it.
+        persisted_character: Snapshot of the character as last persisted, used to write only changed columns.
+        persisted: Whether the character was persisted in the current turn.
+        history_summary: Summary of the turns dropped from `messages` by the history policy.
+        compacted_turns: Number of turns dropped from `messages` by the history policy.
+        metrics: Node runs and wall time, model calls and token usage, retries and cache lookups, accumulated
+            over the session when metrics are enabled.
+        usage: Calls, tokens and cost of the session, of its current turn and per model, when token accounting
+            is enabled.
     """
     anime_character: AnimeCharacter
     classifier: Classifier
     relevance_reflector: RelevanceReflector
     reflection_feedback: ReflectionFeedback
+    triage: Triage
+    speculative_character: Dict[str, Any]
+    pre_extraction: Dict[str, Any]
+    reflection_iterations: int
+    changed_fields: List[str]
+    extraction_model: str
+    field_turns: Dict[str, int]
+    session_id: str
+    persisted_character: Dict[str, Any]
     persisted: bool
+    history_summary: str
+    compacted_turns: int
+    metrics: Annotated[Dict[str, Any], merge_metrics]
+    usage: Annotated[Dict[str, Any], merge_usage]
+
+
+def current_turn(state: GraphState) -> int:
+    """
+    Number of user messages in the conversation, including the turns the history policy dropped from `messages`,
+    used as the turn counter.
+    """
+    return state.get("compacted_turns", 0) + sum(1 for message in state["messages"] if message.type == "human")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,84 @@
+from typing import Any, Dict, Optional
+
+from storage.postgres import CHARACTER_COLUMNS, connection
+
+
+def character_record(anime_character: Dict[str, Any]) -> Dict[str, Any]:
+    return {column: anime_character.get(column) for column in CHARACTER_COLUMNS}
+
+
+def changed_columns(record: Dict[str, Any], snapshot: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Columns of `record` whose value differs from the last persisted snapshot.
+    """
+    return {column: value for column, value in record.items() if snapshot.get(column) != value}
+
+
+def insert_character(record: Dict[str, Any]) -> None:
+    from psycopg2 import sql
+
+    with connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                sql.SQL("INSERT INTO anime_characters ({}) VALUES ({})").format(
+                    sql.SQL(", ").join(map(sql.Identifier, record)),
+                    sql.SQL(", ").join(sql.Placeholder() * len(record)),
+                ),
+                list(record.values())
+            )
+
+
+def upsert_character(session_id: str, changes: Dict[str, Any]) -> None:
+    """
+    Inserts the session's character, or updates only the changed columns when it already exists.
+    """
+    from psycopg2 import sql
+
+    columns = ["session_id", *changes]
+    with connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                sql.SQL("""
+                    INSERT INTO anime_characters ({columns}) VALUES ({values})
+                    ON CONFLICT (session_id) DO UPDATE SET {updates}, updated_at = CURRENT_TIMESTAMP
+                """).format(
+                    columns=sql.SQL(", ").join(map(sql.Identifier, columns)),
+                    values=sql.SQL(", ").join(sql.Placeholder() * len(columns)),
+                    updates=sql.SQL(", ").join(
+                        sql.SQL("{0} = EXCLUDED.{0}").format(sql.Identifier(column)) for column in changes
+                    ),
+                ),
+                [session_id, *changes.values()]
+            )
+
+
+def load_character(session_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Loads the session's character with a single read on the unique session index.
+    """
+    from psycopg2 import sql
+
+    with connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                sql.SQL("SELECT {} FROM anime_characters WHERE session_id = %s").format(
+                    sql.SQL(", ").join(map(sql.Identifier, CHARACTER_COLUMNS))
+                ),
+                (session_id,)
+            )
+            row = cur.fetchone()
+
+    return dict(zip(CHARACTER_COLUMNS, row)) if row else None
+
+
+def load_session(session_id: str) -> Dict[str, Any]:
+    """
+    Builds the graph input needed to resume a session: the partially filled character and its persisted
+    snapshot, so unchanged columns are not written again.
+    """
+    character = load_character(session_id) or {}
+    return {
+        "session_id": session_id,
+        "anime_character": {column: value for column, value in character.items() if value is not None},
+        "persisted_character": character,
+    }
@@ -0,0 +1,199 @@
+import sqlite3
+import zlib
+from functools import lru_cache
+from typing import Any, List, Optional, Sequence, Tuple
+
+import ormsgpack
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+import settings
+from state import AnimeCharacter
+from storage.postgres import CHARACTER_COLUMNS
+
+
+_FLAT_RECORD = "cp_record"
+_COMPRESSED_SUFFIX = "+zlib"
+_PRIMITIVES = (str, int, float, bool, type(None))
+
+# The state channel stored as a flat record; savers tag its values with `_CharacterChannelValue`
+CHARACTER_CHANNEL = "anime_character"
+
+
+def _columns_hash(columns: Sequence[str]) -> int:
+    return zlib.crc32(",".join(columns).encode("utf-8"))
+
+
+class _CharacterChannelValue:
+    """
+    Marks a value written to the character channel, since the serializer itself never sees channel names.
+    """
+    __slots__ = ("value",)
+
+    def __init__(self, value: Any):
+        self.value = value
+
+
+class CompactSerializer(JsonPlusSerializer):
+    """
+    Checkpoint serializer that stores the character channel as a flat binary record and compresses large payloads.
+
+    A value of the `anime_character` channel, either an `AnimeCharacter` or a dict keyed by character columns, is
+    packed as a msgpack array: a hash of the columns it was written with, a bitmask of the present columns and
+    their values in column order. A value that does not fit the columns uses the default encoding, and a record
+    written with other columns (fields added or reordered in the schema since) is rejected instead of decoded
+    into the wrong fields. Decoding always yields a plain dict, so checkpoints never mix pydantic models and
+    dicts. Any other value uses the msgpack encoding of `JsonPlusSerializer`, zlib-compressed above
+    `CHECKPOINT_COMPRESS_THRESHOLD` bytes.
+    """
+
+    def dumps_typed(self, obj: Any) -> Tuple[str, bytes]:
+        if isinstance(obj, _CharacterChannelValue):
+            obj = obj.value
+            if isinstance(obj, AnimeCharacter):
+                obj = obj.model_dump(exclude_none=True)
+
+            if self._is_flat_record(obj):
+                mask = 0
+                values = []
+                for index, column in enumerate(CHARACTER_COLUMNS):
+                    if column in obj:
+                        mask |= 1 << index
+                        values.append(obj[column])
+                return _FLAT_RECORD, ormsgpack.packb([_columns_hash(CHARACTER_COLUMNS), mask, *values])
+
+        type_, data = super().dumps_typed(obj)
+        if len(data) > settings.CHECKPOINT_COMPRESS_THRESHOLD:
+            return type_ + _COMPRESSED_SUFFIX, zlib.compress(data)
+        return type_, data
+
+    def loads_typed(self, data: Tuple[str, bytes]) -> Any:
+        type_, payload = data
+
+        if type_ == _FLAT_RECORD:
+            columns_hash, mask, *values = ormsgpack.unpackb(payload)
+            if columns_hash != _columns_hash(CHARACTER_COLUMNS):
+                raise ValueError("Checkpointed character was written with different character columns; the "
+                                 "schema changed since, so its thread cannot be resumed")
+            columns = [column for index, column in enumerate(CHARACTER_COLUMNS) if mask & (1 << index)]
+            return dict(zip(columns, values))
+
+        if type_.endswith(_COMPRESSED_SUFFIX):
+            return super().loads_typed((type_[:-len(_COMPRESSED_SUFFIX)], zlib.decompress(payload)))
+
+        return super().loads_typed(data)
+
+    @staticmethod
+    def _is_flat_record(obj: Any) -> bool:
+        return (
+            isinstance(obj, dict)
+            and obj.keys() <= set(CHARACTER_COLUMNS)
+            and all(isinstance(value, _PRIMITIVES) for value in obj.values())
+        )
+
+
+def _tag_writes(writes: Sequence[Tuple[str, Any]]) -> List[Tuple[str, Any]]:
+    return [(channel, _CharacterChannelValue(value))
+            if channel == CHARACTER_CHANNEL and not isinstance(value, _CharacterChannelValue) else (channel, value)
+            for channel, value in writes]
+
+
+class _CharacterChannelSaver:
+    """
+    Saver mixin that tags the character channel's pending writes and, for Postgres, its channel blobs, so
+    `CompactSerializer` packs only that channel as a flat record.
+    """
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        return super().put_writes(config, _tag_writes(writes), task_id, task_path)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        return await super().aput_writes(config, _tag_writes(writes), task_id, task_path)
+
+    def _dump_blobs(self, thread_id, checkpoint_ns, values, versions):
+        if CHARACTER_CHANNEL in values:
+            values = {**values, CHARACTER_CHANNEL: _CharacterChannelValue(values[CHARACTER_CHANNEL])}
+        return super()._dump_blobs(thread_id, checkpoint_ns, values, versions)
+
+
+@lru_cache(maxsize=None)
+def _compact_saver(saver_class: type) -> type:
+    return type(saver_class.__name__, (_CharacterChannelSaver, saver_class), {})
+
+
+def get_checkpointer(kind: Optional[str] = None):
+    """
+    Returns a synchronous checkpointer for `graph.invoke`/`graph.stream`: "sqlite" for local use or
+    "postgres" for production. Returns None when no checkpointer is configured.
+    """
+    kind = kind if kind is not None else settings.CHECKPOINTER
+
+    if not kind:
+        return None
+
+    if kind == "sqlite":
+        from langgraph.checkpoint.sqlite import SqliteSaver
+
+        conn = sqlite3.connect(settings.CHECKPOINT_SQLITE_PATH, check_same_thread=False)
+        return _compact_saver(SqliteSaver)(conn, serde=CompactSerializer())
+
+    if kind == "postgres":
+        from langgraph.checkpoint.postgres import PostgresSaver
+        from psycopg.rows import dict_row
+        from psycopg_pool import ConnectionPool
+
+        connection_pool = ConnectionPool(
+            settings.CHECKPOINT_DATABASE_URL,
+            max_size=settings.DB_POOL_MAX_SIZE,
+            kwargs={"autocommit": True, "prepare_threshold": 0, "row_factory": dict_row},
+        )
+        checkpointer = _compact_saver(PostgresSaver)(connection_pool, serde=CompactSerializer())
+        checkpointer.setup()
+        return checkpointer
+
+    raise ValueError(f"Unknown checkpointer: {kind}")
+
+
+async def aget_checkpointer(kind: Optional[str] = None):
+    """
+    Async counterpart of `get_checkpointer`, for `graph.ainvoke`/`graph.astream`. The caller owns the returned
+    saver's connection and closes it on shutdown.
+    """
+    kind = kind if kind is not None else settings.CHECKPOINTER
+
+    if not kind:
+        return None
+
+    if kind == "sqlite":
+        import aiosqlite
+        from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+        checkpointer = _compact_saver(AsyncSqliteSaver)(aiosqlite.connect(settings.CHECKPOINT_SQLITE_PATH),
+                                                        serde=CompactSerializer())
+        await checkpointer.setup()
+        return checkpointer
+
+    if kind == "postgres":
+        from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+        from psycopg.rows import dict_row
+        from psycopg_pool import AsyncConnectionPool
+
+        connection_pool = AsyncConnectionPool(
+            settings.CHECKPOINT_DATABASE_URL,
+            max_size=settings.DB_POOL_MAX_SIZE,
+            kwargs={"autocommit": True, "prepare_threshold": 0, "row_factory": dict_row},
+            open=False,
+        )
+        await connection_pool.open()
+        checkpointer = _compact_saver(AsyncPostgresSaver)(connection_pool, serde=CompactSerializer())
+        await checkpointer.setup()
+        return checkpointer
+
+    raise ValueError(f"Unknown checkpointer: {kind}")
+
+
+async def aclose_checkpointer(checkpointer) -> None:
+    """
+    Closes the connection, or connection pool, of a saver returned by `aget_checkpointer`.
+    """
+    if checkpointer is not None:
+        await checkpointer.conn.close()
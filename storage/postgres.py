@@ -0,0 +1,189 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Iterator, List, Optional, Tuple
+
+import settings
+from state import ANIME_CHARACTER
+
+# psycopg2 is imported on the first connection, so deployments without Postgres never load it
+if TYPE_CHECKING:
+    import psycopg2.extensions
+    import psycopg2.pool
+
+
+logger = logging.getLogger(__name__)
+
+CHARACTER_COLUMNS = ANIME_CHARACTER.columns
+
+# Ordered schema migrations, applied once per database and recorded in `schema_migrations`. Columns for fields
+# added to the character schema since are added by `ANIME_CHARACTER.add_columns` after them
+MIGRATIONS: List[Tuple[int, str]] = [
+    (1, """
+        CREATE TABLE IF NOT EXISTS anime_characters (
+            id SERIAL PRIMARY KEY,
+            name TEXT,
+            age INT,
+            gender TEXT,
+            physical_appearance TEXT,
+            personality TEXT,
+            abilities_power TEXT,
+            occupation TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """),
+    (2, """
+        ALTER TABLE anime_characters ADD COLUMN IF NOT EXISTS session_id TEXT;
+        ALTER TABLE anime_characters ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP;
+        CREATE UNIQUE INDEX IF NOT EXISTS anime_characters_session_id ON anime_characters (session_id);
+    """),
+]
+
+# Arbitrary key for the advisory lock that serializes migrations across processes
+_MIGRATION_LOCK_ID = 7_281_945
+
+_pool: Optional["psycopg2.pool.ThreadedConnectionPool"] = None
+# `ThreadedConnectionPool.getconn` raises instead of waiting once every connection is checked out, so checkouts
+# first take one of DB_POOL_MAX_SIZE slots, waiting up to DB_POOL_TIMEOUT for one to free up
+_slots = threading.BoundedSemaphore(settings.DB_POOL_MAX_SIZE)
+_pool_lock = threading.Lock()
+_schema_ready = False
+_last_checked = {}
+
+
+def get_pool() -> "psycopg2.pool.ThreadedConnectionPool":
+    """
+    Process-wide connection pool configured from `CONFIGPILOT_DATABASE_URL`/`DATABASE_URL`.
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                from psycopg2 import pool
+
+                _pool = pool.ThreadedConnectionPool(
+                    settings.DB_POOL_MIN_SIZE,
+                    settings.DB_POOL_MAX_SIZE,
+                    dsn=settings.DATABASE_URL,
+                )
+    return _pool
+
+
+def _is_healthy(conn) -> bool:
+    import psycopg2
+
+    if conn.closed:
+        return False
+
+    # Connections used recently are trusted; idle ones are pinged before being handed out
+    if time.monotonic() - _last_checked.get(id(conn), 0) < settings.DB_HEALTH_CHECK_INTERVAL:
+        return True
+
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+        conn.rollback()
+    except psycopg2.Error:
+        return False
+
+    _last_checked[id(conn)] = time.monotonic()
+    return True
+
+
+@contextmanager
+def connection() -> Iterator["psycopg2.extensions.connection"]:
+    """
+    Borrows a healthy connection from the pool, committing on success and rolling back on error.
+    Waits up to DB_POOL_TIMEOUT when every connection is in use. The schema is migrated on first use.
+    """
+    import psycopg2
+    from psycopg2.pool import PoolError
+
+    connection_pool = get_pool()
+
+    if not _slots.acquire(timeout=settings.DB_POOL_TIMEOUT):
+        raise PoolError(f"no database connection available after {settings.DB_POOL_TIMEOUT}s")
+    try:
+        conn = _healthy_connection(connection_pool)
+    except BaseException:
+        _slots.release()
+        raise
+
+    broken = False
+    try:
+        if not _schema_ready:
+            _migrate(conn)
+        with conn:
+            yield conn
+        _last_checked[id(conn)] = time.monotonic()
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        broken = True
+        raise
+    finally:
+        if broken:
+            _last_checked.pop(id(conn), None)
+        connection_pool.putconn(conn, close=broken or conn.closed)
+        _slots.release()
+
+
+def _healthy_connection(connection_pool) -> "psycopg2.extensions.connection":
+    import psycopg2
+
+    # Every idle connection may be stale after a database restart, so each one is discarded in turn until a
+    # healthy or freshly opened one comes out of the pool
+    for _ in range(settings.DB_POOL_MAX_SIZE + 1):
+        conn = connection_pool.getconn()
+        if _is_healthy(conn):
+            return conn
+        _last_checked.pop(id(conn), None)
+        connection_pool.putconn(conn, close=True)
+    raise psycopg2.OperationalError("no healthy database connection available")
+
+
+def _migrate(conn) -> None:
+    global _schema_ready
+    with _pool_lock:
+        if _schema_ready:
+            return
+
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_advisory_xact_lock(%s)", (_MIGRATION_LOCK_ID,))
+                cur.execute("""
+                    CREATE TABLE IF NOT EXISTS schema_migrations (
+                        version INT PRIMARY KEY,
+                        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    );
+                """)
+                cur.execute("SELECT version FROM schema_migrations")
+                applied = {row[0] for row in cur.fetchall()}
+
+                for version, statement in MIGRATIONS:
+                    if version in applied:
+                        continue
+                    logger.info("Applying schema migration %s", version)
+                    cur.execute(statement)
+                    cur.execute("INSERT INTO schema_migrations (version) VALUES (%s)", (version,))
+
+                cur.execute(ANIME_CHARACTER.add_columns("anime_characters"))
+
+        _schema_ready = True
+
+
+def ensure_schema() -> None:
+    """
+    Applies pending migrations eagerly, e.g. at process startup.
+    """
+    with connection():
+        pass
+
+
+def close_pool() -> None:
+    global _pool, _schema_ready
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+        _schema_ready = False
+        _last_checked.clear()
@@ -0,0 +1,319 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import settings
+from state import ANIME_CHARACTER
+from storage.postgres import CHARACTER_COLUMNS, connection
+
+
+logger = logging.getLogger(__name__)
+
+
+def _split_batch(records: List[Dict[str, Any]]):
+    """
+    Separates session records, keeping only the latest snapshot per session, from session-less inserts.
+    """
+    sessions = {}
+    inserts = []
+    for record in records:
+        if record.get("session_id"):
+            sessions[record["session_id"]] = record
+        else:
+            inserts.append(record)
+    return list(sessions.values()), inserts
+
+
+def _upsert_updates() -> str:
+    return ", ".join(f"{column} = excluded.{column}" for column in CHARACTER_COLUMNS)
+
+
+class PostgresSink:
+    """
+    Writes a batch of character records with one multi-row upsert for sessions and one multi-row INSERT
+    for session-less records.
+    """
+
+    @staticmethod
+    def is_transient(error: Exception) -> bool:
+        """
+        True for connection failures worth retrying; data errors fail again however often they are retried.
+        """
+        import psycopg2
+        from psycopg2.pool import PoolError
+
+        return isinstance(error, (psycopg2.OperationalError, psycopg2.InterfaceError, PoolError))
+
+    def write_batch(self, records: List[Dict[str, Any]]) -> None:
+        from psycopg2.extras import execute_values
+
+        upserts, inserts = _split_batch(records)
+        columns = ", ".join(CHARACTER_COLUMNS)
+
+        with connection() as conn:
+            with conn.cursor() as cur:
+                if upserts:
+                    execute_values(
+                        cur,
+                        f"INSERT INTO anime_characters (session_id, {columns}) VALUES %s "
+                        f"ON CONFLICT (session_id) DO UPDATE SET {_upsert_updates()}, "
+                        f"updated_at = CURRENT_TIMESTAMP",
+                        [(record["session_id"], *(record.get(column) for column in CHARACTER_COLUMNS))
+                         for record in upserts],
+                        page_size=len(upserts),
+                    )
+                if inserts:
+                    execute_values(
+                        cur,
+                        f"INSERT INTO anime_characters ({columns}) VALUES %s",
+                        [tuple(record.get(column) for column in CHARACTER_COLUMNS) for record in inserts],
+                        page_size=len(inserts),
+                    )
+
+
+class SQLiteSink:
+    """
+    Local stand-in for Postgres, useful for development and tests.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with sqlite3.connect(self.path) as conn:
+            conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS anime_characters (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    {ANIME_CHARACTER.column_definitions("sqlite")},
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            existing_columns = {row[1] for row in conn.execute("PRAGMA table_info(anime_characters)")}
+            conn.executescript(ANIME_CHARACTER.add_columns("anime_characters", "sqlite", existing_columns))
+            for column in ("session_id", "updated_at"):
+                if column not in existing_columns:
+                    conn.execute(f"ALTER TABLE anime_characters ADD COLUMN {column} TEXT")
+            conn.execute(
+                "CREATE UNIQUE INDEX IF NOT EXISTS anime_characters_session_id ON anime_characters (session_id)"
+            )
+
+    @staticmethod
+    def is_transient(error: Exception) -> bool:
+        # e.g. "database is locked"
+        return isinstance(error, sqlite3.OperationalError)
+
+    def write_batch(self, records: List[Dict[str, Any]]) -> None:
+        upserts, inserts = _split_batch(records)
+        columns = ", ".join(CHARACTER_COLUMNS)
+        placeholders = ", ".join("?" for _ in CHARACTER_COLUMNS)
+
+        with sqlite3.connect(self.path) as conn:
+            conn.executemany(
+                f"INSERT INTO anime_characters (session_id, {columns}) VALUES (?, {placeholders}) "
+                f"ON CONFLICT (session_id) DO UPDATE SET {_upsert_updates()}, updated_at = CURRENT_TIMESTAMP",
+                [(record["session_id"], *(record.get(column) for column in CHARACTER_COLUMNS))
+                 for record in upserts],
+            )
+            conn.executemany(
+                f"INSERT INTO anime_characters ({columns}) VALUES ({placeholders})",
+                [tuple(record.get(column) for column in CHARACTER_COLUMNS) for record in inserts],
+            )
+
+
+class WriteBehindQueue:
+    """
+    Buffers character records and writes them in batches from a background thread.
+
+    A batch is flushed when `batch_size` records are waiting or `flush_interval` seconds have passed.
+    Batches that fail with a transient error (the sink's `is_transient`, e.g. the database is unreachable) are
+    appended to a local JSONL spool, which is replayed on its own before the next batch and on every
+    `flush_interval` tick while it is not empty, even when no new records arrive. When a batch fails with any other
+    error, its records are written one at a time and the ones the database rejects are moved to the quarantine
+    file, so a single bad record never blocks the records after it.
+    Everything left in memory is flushed on `close` (registered with `atexit`).
+    """
+
+    def __init__(self, sink, batch_size: int = 100, flush_interval: float = 1.0, spool_path: Optional[str] = None,
+                 quarantine_path: Optional[str] = None):
+        self.sink = sink
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spool_path = spool_path
+        self.quarantine_path = quarantine_path
+
+        self._queue: "queue.Queue[Dict[str, Any]]" = queue.Queue()
+        self._stop = threading.Event()
+        self._write_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "WriteBehindQueue":
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="configpilot-write-behind", daemon=True)
+            self._thread.start()
+        return self
+
+    def put(self, record: Dict[str, Any]) -> None:
+        self._queue.put(record)
+
+    def flush(self) -> None:
+        """
+        Writes every queued record now, in batches, and waits for the batch the worker may be writing.
+        """
+        while True:
+            batch = self._drain(timeout=0)
+            if not batch:
+                break
+            self._write(batch)
+        self._queue.join()
+        self._write([])
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            batch = self._drain(timeout=self.flush_interval)
+            # An idle process still retries the spool, so records spooled during an outage do not wait for new
+            # traffic or for `close`
+            if batch or self._spool_pending():
+                self._write(batch)
+
+    def _drain(self, timeout: float) -> List[Dict[str, Any]]:
+        batch = []
+        deadline = time.monotonic() + timeout
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch: List[Dict[str, Any]]) -> None:
+        try:
+            with self._write_lock:
+                # Spooled records are older than the batch, so the batch waits behind them while they cannot be
+                # written; otherwise an older session snapshot would overwrite a newer one on replay
+                if not self._replay_spool():
+                    self._append_to_spool(batch)
+                    return
+
+                retry = self._write_records(batch)
+                if retry:
+                    self._append_to_spool(retry)
+        finally:
+            for _ in batch:
+                self._queue.task_done()
+
+    def _replay_spool(self) -> bool:
+        spooled = self._read_spool()
+        if not spooled:
+            return True
+
+        retry = self._write_records(spooled)
+        if retry:
+            # Rewritten rather than left as is, so quarantined and written records are not replayed again
+            self._clear_spool()
+            self._append_to_spool(retry)
+            return False
+
+        self._clear_spool()
+        return True
+
+    def _write_records(self, records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Writes `records` and returns the ones to retry later, after a transient error.
+        """
+        if not records:
+            return []
+
+        try:
+            self.sink.write_batch(records)
+            return []
+        except Exception as e:
+            if self.sink.is_transient(e):
+                logger.warning("Write-behind flush of %s records failed, spooling them: %s", len(records), e)
+                return records
+            logger.warning("Write-behind flush of %s records was rejected, writing them one by one: %s",
+                           len(records), e)
+
+        for index, record in enumerate(records):
+            try:
+                self.sink.write_batch([record])
+            except Exception as e:
+                if self.sink.is_transient(e):
+                    return records[index:]
+                logger.error("Quarantining write-behind record for session %s: %s", record.get("session_id"), e)
+                self._quarantine(record, e)
+        return []
+
+    def _quarantine(self, record: Dict[str, Any], error: Exception) -> None:
+        if not self.quarantine_path:
+            logger.error("No write-behind quarantine configured, dropping the record")
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.quarantine_path)), exist_ok=True)
+        entry = {"record": record, "error": f"{type(error).__name__}: {str(error).strip()}"}
+        with open(self.quarantine_path, "a", encoding="utf-8") as quarantine:
+            quarantine.write(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+
+    def _spool_pending(self) -> bool:
+        return bool(self.spool_path) and os.path.exists(self.spool_path)
+
+    def _read_spool(self) -> List[Dict[str, Any]]:
+        if not self.spool_path or not os.path.exists(self.spool_path):
+            return []
+        with open(self.spool_path, encoding="utf-8") as spool:
+            return [json.loads(line) for line in spool if line.strip()]
+
+    def _append_to_spool(self, records: List[Dict[str, Any]]) -> None:
+        if not records:
+            return
+        if not self.spool_path:
+            logger.error("No write-behind spool configured, dropping %s records", len(records))
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.spool_path)), exist_ok=True)
+        with open(self.spool_path, "a", encoding="utf-8") as spool:
+            for record in records:
+                spool.write(json.dumps(record, ensure_ascii=False) + "\n")
+            spool.flush()
+            os.fsync(spool.fileno())
+
+    def _clear_spool(self) -> None:
+        os.remove(self.spool_path)
+
+
+_write_behind_queue: Optional[WriteBehindQueue] = None
+_queue_lock = threading.Lock()
+
+
+def _make_sink():
+    if settings.WRITE_BEHIND_SINK == "sqlite":
+        return SQLiteSink(settings.WRITE_BEHIND_SQLITE_PATH)
+    return PostgresSink()
+
+
+def get_write_behind_queue() -> WriteBehindQueue:
+    global _write_behind_queue
+    if _write_behind_queue is None:
+        with _queue_lock:
+            if _write_behind_queue is None:
+                _write_behind_queue = WriteBehindQueue(
+                    _make_sink(),
+                    batch_size=settings.WRITE_BEHIND_BATCH_SIZE,
+                    flush_interval=settings.WRITE_BEHIND_FLUSH_INTERVAL,
+                    spool_path=settings.WRITE_BEHIND_SPOOL_PATH or None,
+                    quarantine_path=settings.WRITE_BEHIND_QUARANTINE_PATH or None,
+                ).start()
+                atexit.register(_write_behind_queue.close)
+    return _write_behind_queue